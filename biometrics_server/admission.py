@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Admission Control for HumanID Biometrics Server
+Bounds concurrent work per endpoint and the total bytes of in-flight uploads,
+shedding excess load with fast 429/503 responses instead of queueing forever
+"""
+
+import os
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# ========= ENV & GLOBALS =========
+MAX_INFLIGHT_BYTES = int(os.getenv("ADMISSION_MAX_INFLIGHT_BYTES", str(256 * 1024 * 1024)))
+UNKNOWN_LENGTH_BYTES = int(os.getenv("ADMISSION_UNKNOWN_LENGTH_BYTES", str(50 * 1024 * 1024)))
+SATURATION_THRESHOLD = float(os.getenv("ADMISSION_SATURATION_THRESHOLD", "0.9"))
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class EndpointLimit:
+    """Concurrency limit and bounded wait queue for one endpoint"""
+
+    def __init__(self, name: str, concurrency: int, max_waiting: int,
+                 wait_timeout: float, retry_after: int):
+        self.name = name
+        self.concurrency = concurrency
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+
+    def saturation(self) -> float:
+        capacity = self.concurrency + self.max_waiting
+        return (self.active + self.waiting) / capacity if capacity else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'active': self.active,
+            'concurrency': self.concurrency,
+            'waiting': self.waiting,
+            'max_waiting': self.max_waiting,
+            'rejected': self.rejected,
+            'saturation': round(self.saturation(), 3)
+        }
+
+def _limit_from_env(name: str, prefix: str, concurrency: int, max_waiting: int,
+                    wait_timeout: float, retry_after: int) -> EndpointLimit:
+    return EndpointLimit(
+        name,
+        concurrency=int(os.getenv(f"ADMISSION_{prefix}_CONCURRENCY", str(concurrency))),
+        max_waiting=int(os.getenv(f"ADMISSION_{prefix}_MAX_WAITING", str(max_waiting))),
+        wait_timeout=float(os.getenv(f"ADMISSION_{prefix}_WAIT_TIMEOUT", str(wait_timeout))),
+        retry_after=int(os.getenv(f"ADMISSION_{prefix}_RETRY_AFTER", str(retry_after)))
+    )
+
+class AdmissionController:
+    """Admits requests against per-endpoint slots and a shared in-flight bytes budget"""
+
+    def __init__(self, limits: Dict[str, EndpointLimit], max_inflight_bytes: int = MAX_INFLIGHT_BYTES):
+        self.limits = limits
+        self.max_inflight_bytes = max_inflight_bytes
+        self.inflight_bytes = 0
+        self._changed: Optional[asyncio.Condition] = None
+
+    def match(self, path: str) -> Optional[EndpointLimit]:
+        """Find the limit for a request path; keys ending in '/' match as prefixes"""
+        limit = self.limits.get(path)
+        if limit is not None:
+            return limit
+        for key, limit in self.limits.items():
+            if key.endswith('/') and path.startswith(key):
+                return limit
+        return None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._changed is None:
+            self._changed = asyncio.Condition()
+        return self._changed
+
+    def _fits(self, limit: EndpointLimit, nbytes: int) -> bool:
+        return (limit.active < limit.concurrency and
+                self.inflight_bytes + nbytes <= self.max_inflight_bytes)
+
+    async def acquire(self, limit: EndpointLimit, nbytes: int):
+        """Take a slot and reserve bytes, waiting in the bounded queue if needed"""
+        # A single request larger than the whole budget may still run alone
+        nbytes = min(nbytes, self.max_inflight_bytes)
+        changed = self._condition()
+        async with changed:
+            if not self._fits(limit, nbytes):
+                if limit.waiting >= limit.max_waiting:
+                    limit.rejected += 1
+                    raise AdmissionRejected(
+                        429, f"Too many concurrent {limit.name} requests, try again later",
+                        limit.retry_after
+                    )
+                limit.waiting += 1
+                try:
+                    await asyncio.wait_for(
+                        changed.wait_for(lambda: self._fits(limit, nbytes)),
+                        limit.wait_timeout
+                    )
+                except asyncio.TimeoutError:
+                    limit.rejected += 1
+                    raise AdmissionRejected(
+                        503, f"Server is saturated, {limit.name} request was not admitted in time",
+                        limit.retry_after
+                    )
+                finally:
+                    limit.waiting -= 1
+            limit.active += 1
+            self.inflight_bytes += nbytes
+        return nbytes
+
+    async def release(self, limit: EndpointLimit, nbytes: int):
+        changed = self._condition()
+        async with changed:
+            limit.active -= 1
+            self.inflight_bytes -= nbytes
+            changed.notify_all()
+
+    def saturation(self) -> Dict[str, Any]:
+        """Current load per endpoint and overall, for /health"""
+        bytes_ratio = self.inflight_bytes / self.max_inflight_bytes if self.max_inflight_bytes else 0.0
+        overall = max([bytes_ratio] + [limit.saturation() for limit in self.limits.values()])
+        return {
+            'overall': round(overall, 3),
+            'saturated': overall >= SATURATION_THRESHOLD,
+            'inflight_bytes': self.inflight_bytes,
+            'max_inflight_bytes': self.max_inflight_bytes,
+            'endpoints': {name: limit.to_dict() for name, limit in self.limits.items()}
+        }
+
+def request_bytes(headers) -> int:
+    """Bytes to reserve for a request, from Content-Length when present"""
+    content_length = headers.get('content-length')
+    if content_length and content_length.isdigit():
+        return int(content_length)
+    if headers.get('transfer-encoding', '').lower() == 'chunked':
+        return UNKNOWN_LENGTH_BYTES
+    return 0
+
+# Shared controller used by the FastAPI app
+admission_controller = AdmissionController({
+    '/first_humanity_verification': _limit_from_env(
+        'first_humanity_verification', 'VERIFICATION',
+        concurrency=4, max_waiting=16, wait_timeout=5.0, retry_after=5
+    ),
+    '/similarity_check': _limit_from_env(
+        'similarity_check', 'SIMILARITY',
+        concurrency=4, max_waiting=16, wait_timeout=5.0, retry_after=10
+    ),
+    '/verification-with-golem/': _limit_from_env(
+        'verification_with_golem', 'GOLEM_READ',
+        concurrency=8, max_waiting=32, wait_timeout=2.0, retry_after=2
+    ),
+})
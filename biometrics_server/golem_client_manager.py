@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Golem DB Client Manager for HumanID Biometrics Server
+Owns a dedicated event loop with a small pool of health-checked Golem DB
+clients, and exposes it to both async and sync callers
+"""
+
+import os
+import random
+import asyncio
+import logging
+import threading
+import concurrent.futures
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# ========= ENV & GLOBALS =========
+POOL_SIZE = int(os.getenv("GOLEM_POOL_SIZE", "2"))
+HEALTH_CHECK_INTERVAL = float(os.getenv("GOLEM_HEALTH_CHECK_INTERVAL", "30"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("GOLEM_HEALTH_CHECK_TIMEOUT", "5"))
+RECONNECT_BASE_DELAY = float(os.getenv("GOLEM_RECONNECT_BASE_DELAY", "0.5"))
+RECONNECT_MAX_DELAY = float(os.getenv("GOLEM_RECONNECT_MAX_DELAY", "30"))
+MAX_WRITE_BATCH = int(os.getenv("GOLEM_MAX_WRITE_BATCH", "16"))
+# How long acquire() waits for a client when none is healthy, and how long
+# run_async() waits for a whole call, before giving up with GolemUnavailableError
+ACQUIRE_TIMEOUT = float(os.getenv("GOLEM_ACQUIRE_TIMEOUT", "15"))
+CALL_TIMEOUT = float(os.getenv("GOLEM_CALL_TIMEOUT", "30"))
+
+class GolemConfigurationError(ValueError):
+    """Raised by the connect function for errors retrying cannot fix, e.g. a missing key"""
+
+class GolemUnavailableError(RuntimeError):
+    """No Golem DB client could be had, or a call did not finish, within its deadline"""
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter"""
+    return random.uniform(0, min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * (2 ** attempt)))
+
+class _PooledClient:
+    """One pool slot: a client plus its connection state"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.client = None
+        self.healthy = False
+        self.failures = 0
+        self.reconnecting: Optional[asyncio.Task] = None
+
+class GolemClientManager:
+    """Pool of Golem DB clients running on one long-lived background event loop
+
+    Every coroutine that touches a client must run on the manager's loop;
+    use run_async() from other event loops and run_sync() from threads.
+    Writes go through a single writer task, so only one transaction per key
+    is in flight at a time and concurrent writes never reuse a nonce.
+    Creates queued while a transaction is pending are batched into the next.
+    """
+
+    def __init__(self, connect: Callable[[], Awaitable[Any]], pool_size: int = POOL_SIZE):
+        self._connect = connect
+        self.pool_size = pool_size
+        self._slots: List[_PooledClient] = [_PooledClient(index) for index in range(pool_size)]
+        self._next_slot = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._write_queue: Optional[asyncio.Queue] = None
+        self._background: List[asyncio.Task] = []
+
+    # ----- loop lifecycle -----
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run_loop():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run_loop, name="golem-client-loop", daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+                asyncio.run_coroutine_threadsafe(self._start_background(), loop).result()
+                logger.info(f"🔌 Golem client manager started with a pool of {self.pool_size}")
+        return self._loop
+
+    async def _start_background(self):
+        self._write_queue = asyncio.Queue()
+        self._background.append(asyncio.create_task(self._writer()))
+        self._background.append(asyncio.create_task(self._health_loop()))
+
+    def submit(self, coro: Awaitable[Any]) -> concurrent.futures.Future:
+        """Schedule a coroutine on the manager loop"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    async def run_async(self, coro: Awaitable[Any], timeout: Optional[float] = CALL_TIMEOUT) -> Any:
+        """Await a coroutine on the manager loop from any event loop
+
+        Raises GolemUnavailableError, and cancels the coroutine, if it does
+        not finish within timeout seconds.
+        """
+        if self._loop is not None and asyncio.get_running_loop() is self._loop:
+            return await coro
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(self.submit(coro)), timeout)
+        except asyncio.TimeoutError:
+            raise GolemUnavailableError(f"Golem DB call did not finish within {timeout:.0f}s")
+
+    def run_sync(self, coro: Awaitable[Any], timeout: Optional[float] = 30) -> Any:
+        """Run a coroutine on the manager loop and block for its result"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def close(self, timeout: float = 10):
+        """Disconnect all clients and stop the manager loop"""
+        if self._loop is None:
+            return
+        try:
+            self.run_sync(self._shutdown(), timeout=timeout)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout)
+            self._loop = None
+
+    async def _shutdown(self):
+        for task in self._background:
+            task.cancel()
+        for slot in self._slots:
+            if slot.reconnecting is not None:
+                slot.reconnecting.cancel()
+            await self._disconnect(slot)
+
+    # ----- connections (manager loop only) -----
+    async def _disconnect(self, slot: _PooledClient):
+        client, slot.client, slot.healthy = slot.client, None, False
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception as e:
+                logger.debug(f"Error disconnecting Golem client {slot.index}: {e}")
+
+    async def _reconnect(self, slot: _PooledClient):
+        """Replace a slot's client, retrying with exponential backoff
+
+        A GolemConfigurationError is raised at once, since every retry would
+        fail the same way.
+        """
+        await self._disconnect(slot)
+        attempt = 0
+        while True:
+            try:
+                slot.client = await self._connect()
+                slot.healthy = True
+                slot.failures = 0
+                logger.info(f"🔌 Golem client {slot.index} connected")
+                return
+            except GolemConfigurationError:
+                slot.failures += 1
+                raise
+            except Exception as e:
+                slot.failures += 1
+                delay = backoff_delay(attempt)
+                logger.warning(f"⚠️  Golem client {slot.index} connect failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    def _schedule_reconnect(self, slot: _PooledClient) -> asyncio.Task:
+        if slot.reconnecting is None or slot.reconnecting.done():
+            slot.healthy = False
+            slot.reconnecting = asyncio.create_task(self._reconnect(slot))
+            slot.reconnecting.add_done_callback(self._reconnect_done)
+        return slot.reconnecting
+
+    @staticmethod
+    def _reconnect_done(task: asyncio.Task):
+        # Reconnects nobody awaits (health checks, or slots acquire() stopped waiting for)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"❌ Golem client cannot connect: {task.exception()}")
+
+    async def _check(self, slot: _PooledClient):
+        try:
+            await asyncio.wait_for(
+                slot.client.http_client().eth.get_block_number(), HEALTH_CHECK_TIMEOUT
+            )
+        except Exception as e:
+            logger.warning(f"⚠️  Golem client {slot.index} failed health check: {e}")
+            self._schedule_reconnect(slot)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            await asyncio.gather(*[
+                self._check(slot) for slot in self._slots if slot.healthy and slot.client is not None
+            ])
+
+    async def acquire(self, timeout: Optional[float] = ACQUIRE_TIMEOUT):
+        """A healthy client, round-robin across the pool (manager loop only)
+
+        When no client is healthy, waits up to timeout seconds for one to
+        reconnect, then raises GolemUnavailableError; reconnection carries on
+        in the background. A GolemConfigurationError from connecting is
+        raised as is.
+        """
+        for _ in range(self.pool_size):
+            slot = self._slots[self._next_slot]
+            self._next_slot = (self._next_slot + 1) % self.pool_size
+            if slot.healthy:
+                return slot.client
+        # Nothing healthy: connect every idle slot and wait for the first one
+        tasks = [self._schedule_reconnect(slot) for slot in self._slots]
+        done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+        if not done:
+            raise GolemUnavailableError(f"No Golem DB client connected within {timeout:.0f}s")
+        return next(slot.client for slot in self._slots if slot.healthy)
+
+    def report_failure(self, client):
+        """Mark the slot holding client for reconnection after a connection error"""
+        for slot in self._slots:
+            if slot.client is client:
+                self._schedule_reconnect(slot)
+
+    # ----- writes (manager loop only) -----
+    async def create_entities(self, creates: Sequence[Any]) -> Sequence[Any]:
+        """Queue creates for the writer task and wait for their receipts"""
+        futures = []
+        for create in creates:
+            future = asyncio.get_running_loop().create_future()
+            await self._write_queue.put((create, future))
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+    async def _writer(self):
+        while True:
+            batch = [await self._write_queue.get()]
+            while len(batch) < MAX_WRITE_BATCH and not self._write_queue.empty():
+                batch.append(self._write_queue.get_nowait())
+
+            client = None
+            try:
+                client = await self.acquire()
+                results = await client.create_entities([create for create, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Expected {len(batch)} receipts from Golem DB, got {len(results)}")
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+                if len(batch) > 1:
+                    logger.info(f"📦 Wrote {len(batch)} entities to Golem DB in one transaction")
+            except Exception as e:
+                if client is not None and isinstance(e, (OSError, ConnectionError, asyncio.TimeoutError)):
+                    self.report_failure(client)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def status(self) -> dict:
+        return {
+            'pool_size': self.pool_size,
+            'healthy': sum(1 for slot in self._slots if slot.healthy),
+            'failures': [slot.failures for slot in self._slots],
+            'running': self._loop is not None
+        }
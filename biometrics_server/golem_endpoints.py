@@ -6,17 +6,21 @@ Handles writing verification data to Golem DB using the established pattern
 
 import os
 import json
+import zlib
 import asyncio
 import logging
+import functools
 from typing import Dict, Any, Optional
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+import msgpack
 
 # Set up logger
 logger = logging.getLogger(__name__)
 
 from golem_base_sdk import GolemBaseClient, Annotation, GenericBytes
 from golem_base_sdk.types import GolemBaseCreate
+from golem_client_manager import GolemClientManager, GolemConfigurationError
 
 # Load .env
 load_dotenv()
@@ -29,24 +33,118 @@ PRIVATE_KEY = os.getenv("PRIVATE_KEY")
 
 # PRIVATE_KEY will be checked when actually needed
 
-# ========= GOLEM CLIENT (lazy, long-lived) =========
-golem_client: Optional[GolemBaseClient] = None
+# ========= GOLEM CLIENT (pooled, long-lived) =========
+async def _connect() -> GolemBaseClient:
+    """Open one read/write Golem DB client"""
+    if not PRIVATE_KEY:
+        raise GolemConfigurationError("PRIVATE_KEY environment variable is required")
+    
+    return await GolemBaseClient.create_rw_client(
+        GOLEM_DB_RPC,
+        GOLEM_DB_WSS,
+        PRIVATE_KEY
+    )
+
+golem_manager = GolemClientManager(_connect)
+
+def on_golem_loop(func):
+    """Run an async Golem DB helper on the manager loop, whichever loop awaits it"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await golem_manager.run_async(func(*args, **kwargs))
+    return wrapper
 
 async def get_golem_client() -> GolemBaseClient:
-    """Get or create Golem DB client"""
-    global golem_client
-    if golem_client is None:
-        if not PRIVATE_KEY:
-            raise ValueError("PRIVATE_KEY environment variable is required")
-        
-        golem_client = await GolemBaseClient.create_rw_client(
-            GOLEM_DB_RPC,
-            GOLEM_DB_WSS,
-            PRIVATE_KEY
-        )
-    return golem_client
+    """Get a healthy pooled Golem DB client (only valid on the manager loop)"""
+    return await golem_manager.acquire()
+
+# ========= ANNOTATION HELPERS =========
+# Numeric annotations are unsigned integers, so scores are stored in basis points
+SCORE_SCALE = 10000
+
+def timestamp_to_unix(timestamp: Optional[str]) -> int:
+    """Convert an ISO timestamp to unix seconds (0 when missing or unparseable)"""
+    try:
+        return max(0, int(datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()))
+    except (AttributeError, ValueError):
+        return 0
+
+def score_to_basis_points(score: Any) -> int:
+    """Convert a 0-1 score to an integer annotation value"""
+    return max(0, int(round(float(score or 0.0) * SCORE_SCALE)))
+
+def build_query(record_type: str, user_id: Optional[str] = None,
+                since: Optional[datetime] = None, until: Optional[datetime] = None) -> str:
+    """Build a Golem DB annotation query for this app's records
+
+    Time bounds filter on the numeric timestamp_unix annotation, so entities
+    written before it existed only match queries without a time range.
+    """
+    clauses = [
+        f"app = {json.dumps(APP_TAG)}",
+        f"recordType = {json.dumps(record_type)}",
+    ]
+    if user_id is not None:
+        clauses.append(f"user_id = {json.dumps(user_id)}")
+    if since is not None:
+        clauses.append(f"timestamp_unix >= {int(since.timestamp())}")
+    if until is not None:
+        clauses.append(f"timestamp_unix < {int(until.timestamp())}")
+    return " && ".join(clauses)
+
+# ========= PAYLOAD ENCODING =========
+# Compact payload: MAGIC + version byte + flags byte + msgpack body.
+# Entities written before it hold plain JSON and are still readable.
+PAYLOAD_MAGIC = b"HID"
+PAYLOAD_VERSION = 1
+FLAG_ZLIB = 0x01
+COMPRESS_THRESHOLD = int(os.getenv("GOLEM_PAYLOAD_COMPRESS_THRESHOLD", "256"))
+
+# Record fields rebuilt from annotations and entity metadata on read
+DERIVED_FIELDS = {
+    "schema", "app", "record_type", "written_by", "user_id", "timestamp",
+    "verification_id", "external_kyc_document_id", "humanity_score", "file_hash", "verification_type",
+    "check_id", "stored_verification_id", "similarity_result", "probability_score", "check_type",
+}
+SCORE_FIELDS = ("humanity_score", "probability_score")
+
+def encode_payload(entity_data: Dict[str, Any]) -> bytes:
+    """Encode the fields of a record that annotations do not already carry"""
+    body = msgpack.packb(
+        {key: value for key, value in entity_data.items() if key not in DERIVED_FIELDS},
+        use_bin_type=True
+    )
+    flags = 0
+    if len(body) >= COMPRESS_THRESHOLD:
+        compressed = zlib.compress(body, 9)
+        if len(compressed) < len(body):
+            body, flags = compressed, FLAG_ZLIB
+    return PAYLOAD_MAGIC + bytes([PAYLOAD_VERSION, flags]) + body
+
+def decode_payload(storage_value: bytes, annotations: Dict[str, Any], owner: str) -> Dict[str, Any]:
+    """Rebuild a record from its payload and annotations, for both compact and JSON payloads"""
+    if not storage_value.startswith(PAYLOAD_MAGIC):
+        return json.loads(storage_value.decode('utf-8'))
+    
+    header_end = len(PAYLOAD_MAGIC) + 2
+    version, flags = storage_value[len(PAYLOAD_MAGIC)], storage_value[len(PAYLOAD_MAGIC) + 1]
+    if version != PAYLOAD_VERSION:
+        raise ValueError(f"Unsupported payload version {version}")
+    body = storage_value[header_end:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    
+    record = {key: value for key, value in annotations.items() if key in DERIVED_FIELDS}
+    record["record_type"] = annotations.get("recordType")
+    record["written_by"] = owner
+    for field in SCORE_FIELDS:
+        if field in record:
+            record[field] = float(record[field])
+    record.update(msgpack.unpackb(body, raw=False))
+    return record
 
 # ========= STORAGE HELPERS =========
+@on_golem_loop
 async def store_humanity_verification(verification_data: Dict[str, Any]) -> str:
     """Store humanity verification data in Golem DB"""
     client = await get_golem_client()
@@ -78,22 +176,28 @@ async def store_humanity_verification(verification_data: Dict[str, Any]) -> str:
         Annotation(key="file_hash", value=verification_data.get("file_hash", "")),
     ]
     
-    entity_bytes = json.dumps(entity_data).encode("utf-8")
+    numeric_annotations = [
+        Annotation(key="timestamp_unix", value=timestamp_to_unix(verification_data.get("timestamp"))),
+        Annotation(key="humanity_score_bp", value=score_to_basis_points(verification_data.get("humanity_score"))),
+    ]
+    
+    entity_bytes = encode_payload(entity_data)
     
     create_operation = GolemBaseCreate(
         data=entity_bytes,
         ttl=1000000,
         string_annotations=annotations,
-        numeric_annotations=[],
+        numeric_annotations=numeric_annotations,
     )
     
-    result = await client.create_entities([create_operation])
+    result = await golem_manager.create_entities([create_operation])
     if not result or not result[0].entity_key:
         raise RuntimeError("Failed to create humanity verification entity in Golem DB")
     
     logger.info(f"✅ Humanity verification stored in Golem DB with entity key: {result[0].entity_key.as_hex_string()}")
     return result[0].entity_key.as_hex_string()
 
+@on_golem_loop
 async def store_similarity_check(check_data: Dict[str, Any]) -> str:
     """Store similarity check data in Golem DB"""
     client = await get_golem_client()
@@ -125,16 +229,21 @@ async def store_similarity_check(check_data: Dict[str, Any]) -> str:
         Annotation(key="probability_score", value=str(check_data.get("probability_score", 0.0))),
     ]
     
-    entity_bytes = json.dumps(entity_data).encode("utf-8")
+    numeric_annotations = [
+        Annotation(key="timestamp_unix", value=timestamp_to_unix(check_data.get("timestamp"))),
+        Annotation(key="probability_score_bp", value=score_to_basis_points(check_data.get("probability_score"))),
+    ]
+    
+    entity_bytes = encode_payload(entity_data)
     
     create_operation = GolemBaseCreate(
         data=entity_bytes,
         ttl=1000000,
         string_annotations=annotations,
-        numeric_annotations=[],
+        numeric_annotations=numeric_annotations,
     )
     
-    result = await client.create_entities([create_operation])
+    result = await golem_manager.create_entities([create_operation])
     if not result or not result[0].entity_key:
         raise RuntimeError("Failed to create similarity check entity in Golem DB")
     
@@ -147,73 +256,67 @@ def notify_golem(endpoint: str, data: Dict[str, Any]) -> bool:
     This function handles both humanity verification and similarity check data
     """
     try:
-        import threading
-        import concurrent.futures
+        if endpoint == "humanity_verification":
+            entity_key = golem_manager.run_sync(store_humanity_verification(data), timeout=30)
+            print(f"✅ Humanity verification stored in Golem DB with entity key: {entity_key}")
+        elif endpoint == "similarity_check":
+            entity_key = golem_manager.run_sync(store_similarity_check(data), timeout=30)
+            print(f"✅ Similarity check stored in Golem DB with entity key: {entity_key}")
+        else:
+            raise ValueError(f"Unknown endpoint: {endpoint}")
         
-        def run_async_in_thread():
-            """Run async function in a separate thread with proper event loop handling"""
-            # Create a new event loop for this thread
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            try:
-                if endpoint == "humanity_verification":
-                    return loop.run_until_complete(store_humanity_verification(data))
-                elif endpoint == "similarity_check":
-                    return loop.run_until_complete(store_similarity_check(data))
-                else:
-                    raise ValueError(f"Unknown endpoint: {endpoint}")
-            finally:
-                loop.close()
-        
-        # Run the async function in a separate thread to avoid signal issues
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(run_async_in_thread)
-            entity_key = future.result(timeout=30)  # 30 second timeout
-            
-            if endpoint == "humanity_verification":
-                print(f"✅ Humanity verification stored in Golem DB with entity key: {entity_key}")
-            elif endpoint == "similarity_check":
-                print(f"✅ Similarity check stored in Golem DB with entity key: {entity_key}")
-            
-            return True
+        return True
             
     except Exception as e:
         print(f"❌ Failed to notify Golem DB: {e}")
         return False
+
 # ========= UTILITY FUNCTIONS =========
+@on_golem_loop
 async def get_writer_address() -> str:
     """Get the Golem DB writer address"""
     client = await get_golem_client()
     return client.get_account_address()
 
 # ========= FETCH FUNCTIONS =========
+def _entity_key_hex(entity_key: Any) -> str:
+    return entity_key if isinstance(entity_key, str) else entity_key.as_hex_string()
+
+def _merge_entity(entity_key_hex: str, storage_value: bytes, metadata) -> dict:
+    """Decode an entity payload and attach its string and numeric annotations"""
+    annotations_dict = {}
+    for annotation in metadata.string_annotations:
+        annotations_dict[annotation.key] = annotation.value
+    for annotation in metadata.numeric_annotations:
+        annotations_dict[annotation.key] = annotation.value
+    
+    entity_data = decode_payload(storage_value, annotations_dict, str(metadata.owner))
+    
+    return {
+        **entity_data,
+        'entity_key': entity_key_hex,
+        'annotations': annotations_dict
+    }
+
+def _sort_key(record: dict):
+    annotations = record.get('annotations', {})
+    return annotations.get('timestamp_unix') or timestamp_to_unix(record.get('timestamp'))
+
+@on_golem_loop
 async def fetch_verification_by_entity_key(entity_key_hex: str) -> Optional[dict]:
     """Fetch a specific verification from Golem DB by entity_key"""
     client = await get_golem_client()
     
     try:
-        # Get metadata for the specific entity key
         entity_key = GenericBytes.from_hex_string(entity_key_hex)
-        metadata = await client.get_entity_metadata(entity_key)
-        
-        # Get the actual data using get_storage_value
-        storage_value = await client.get_storage_value(entity_key)
+        metadata, storage_value = await asyncio.gather(
+            client.get_entity_metadata(entity_key),
+            client.get_storage_value(entity_key)
+        )
         
         if storage_value:
-            # Decode the JSON data
-            entity_data = json.loads(storage_value.decode('utf-8'))
-            
-            # Add all annotations to the response
-            annotations_dict = {}
-            for annotation in metadata.string_annotations:
-                annotations_dict[annotation.key] = annotation.value
-            
-            # Merge entity data with annotations
             return {
-                **entity_data,
-                'entity_key': entity_key_hex,
-                'annotations': annotations_dict,
+                **_merge_entity(entity_key_hex, storage_value, metadata),
                 'source': 'golem_db'
             }
     except Exception as e:
@@ -222,180 +325,81 @@ async def fetch_verification_by_entity_key(entity_key_hex: str) -> Optional[dict
     
     return None
 
-async def fetch_latest_verification_by_timestamp() -> Optional[dict]:
-    """Fetch the latest humanity verification from Golem DB based on timestamp annotation"""
+@on_golem_loop
+async def fetch_owner_entity_keys() -> list[str]:
+    """Hex keys of every entity owned by the writer account"""
     client = await get_golem_client()
-    
-    # Get account address
-    account_address = client.get_account_address()
-    
-    # Get all entities owned by this account
-    entity_keys = await client.get_entities_of_owner(account_address)
-    
-    latest_verification = None
-    latest_timestamp = None
-    
-    for entity_key in entity_keys:
-        try:
-            # Get metadata to check if this is a humanity verification
-            metadata = await client.get_entity_metadata(entity_key)
-            
-            # Check if this is a humanity verification with timestamp
-            is_humanity_verification = False
-            verification_timestamp = None
-            
-            for annotation in metadata.string_annotations:
-                if annotation.key == "recordType" and annotation.value == "humanity_verification":
-                    is_humanity_verification = True
-                elif annotation.key == "timestamp":
-                    verification_timestamp = annotation.value
-            
-            if is_humanity_verification and verification_timestamp:
-                # Parse timestamp to compare
-                try:
-                    timestamp_dt = datetime.fromisoformat(verification_timestamp.replace('Z', '+00:00'))
-                    
-                    # Check if this is the latest
-                    if latest_timestamp is None or timestamp_dt > latest_timestamp:
-                        # Get the actual data using get_storage_value
-                        entity_key_hex = entity_key.as_hex_string()
-                        storage_value = await client.get_storage_value(GenericBytes.from_hex_string(entity_key_hex))
-                        
-                        if storage_value:
-                            # Decode the JSON data
-                            entity_data = json.loads(storage_value.decode('utf-8'))
-                            
-                            # Add all annotations to the response
-                            annotations_dict = {}
-                            for annotation in metadata.string_annotations:
-                                annotations_dict[annotation.key] = annotation.value
-                            
-                            # Merge entity data with annotations
-                            latest_verification = {
-                                **entity_data,
-                                'entity_key': entity_key_hex,
-                                'annotations': annotations_dict
-                            }
-                            latest_timestamp = timestamp_dt
-                            
-                except ValueError as e:
-                    logger.error(f"Error parsing timestamp {verification_timestamp}: {e}")
-                    continue
-                    
-        except Exception as e:
-            logger.error(f"Error processing entity {entity_key}: {e}")
-            continue
-    
-    return latest_verification
+    entity_keys = await client.get_entities_of_owner(client.get_account_address())
+    return [_entity_key_hex(entity_key) for entity_key in entity_keys]
 
-async def fetch_all_verifications() -> list[dict]:
-    """Fetch all humanity verifications from Golem DB, sorted by timestamp (newest first)"""
+@on_golem_loop
+async def query_records(record_type: str, user_id: Optional[str] = None,
+                        since: Optional[datetime] = None, until: Optional[datetime] = None) -> list[dict]:
+    """Fetch this writer's records matching an annotation query, newest first"""
     client = await get_golem_client()
+    owner = client.get_account_address().lower()
     
-    # Get account address
-    account_address = client.get_account_address()
-    
-    # Get all entities owned by this account
-    entity_keys = await client.get_entities_of_owner(account_address)
+    query = build_query(record_type, user_id, since, until)
+    results = await client.query_entities(query)
     
-    verifications = []
+    # The query matches every owner's entities, so metadata is needed to keep only ours
+    metadatas = await asyncio.gather(
+        *[client.get_entity_metadata(GenericBytes.from_hex_string(_entity_key_hex(result.entity_key)))
+          for result in results],
+        return_exceptions=True
+    )
     
-    for entity_key in entity_keys:
-        try:
-            # Get metadata to check if this is a humanity verification
-            metadata = await client.get_entity_metadata(entity_key)
-            
-            # Check if this is a humanity verification
-            is_humanity_verification = False
-            verification_timestamp = None
-            
-            for annotation in metadata.string_annotations:
-                if annotation.key == "recordType" and annotation.value == "humanity_verification":
-                    is_humanity_verification = True
-                elif annotation.key == "timestamp":
-                    verification_timestamp = annotation.value
-            
-            if is_humanity_verification and verification_timestamp:
-                try:
-                    # Get the actual data using get_storage_value
-                    entity_key_hex = entity_key.as_hex_string()
-                    storage_value = await client.get_storage_value(GenericBytes.from_hex_string(entity_key_hex))
-                    
-                    if storage_value:
-                        # Decode the JSON data
-                        entity_data = json.loads(storage_value.decode('utf-8'))
-                        
-                        # Add all annotations to the response
-                        annotations_dict = {}
-                        for annotation in metadata.string_annotations:
-                            annotations_dict[annotation.key] = annotation.value
-                        
-                        # Merge entity data with annotations
-                        verification_data = {
-                            **entity_data,
-                            'entity_key': entity_key_hex,
-                            'annotations': annotations_dict
-                        }
-                        verifications.append(verification_data)
-                        
-                except Exception as e:
-                    logger.error(f"Error processing entity data {entity_key}: {e}")
-                    continue
-                    
-        except Exception as e:
-            logger.error(f"Error processing entity {entity_key}: {e}")
+    records = []
+    for result, metadata in zip(results, metadatas):
+        entity_key_hex = _entity_key_hex(result.entity_key)
+        if isinstance(metadata, Exception):
+            logger.error(f"Error fetching metadata for entity {entity_key_hex}: {metadata}")
+            continue
+        if str(metadata.owner).lower() != owner:
             continue
+        try:
+            records.append(_merge_entity(entity_key_hex, result.storage_value, metadata))
+        except (ValueError, zlib.error) as e:
+            logger.error(f"Error decoding entity {entity_key_hex}: {e}")
     
-    # Sort by timestamp (newest first)
-    verifications.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
-    return verifications
+    records.sort(key=_sort_key, reverse=True)
+    return records
+
+async def fetch_latest_verification_by_timestamp(user_id: Optional[str] = None) -> Optional[dict]:
+    """Fetch the latest humanity verification from Golem DB, for one user when user_id is given"""
+    verifications = await query_records("humanity_verification", user_id)
+    return verifications[0] if verifications else None
+
+async def fetch_all_verifications(user_id: Optional[str] = None, since: Optional[datetime] = None,
+                                  until: Optional[datetime] = None) -> list[dict]:
+    """Fetch humanity verifications from Golem DB, sorted by timestamp (newest first)"""
+    return await query_records("humanity_verification", user_id, since, until)
+
+async def fetch_similarity_checks(user_id: Optional[str] = None, since: Optional[datetime] = None,
+                                  until: Optional[datetime] = None) -> list[dict]:
+    """Fetch similarity checks from Golem DB, sorted by timestamp (newest first)"""
+    return await query_records("similarity_check", user_id, since, until)
 
 # ========= SYNCHRONOUS WRAPPER FUNCTIONS =========
-def fetch_latest_verification_sync() -> Optional[dict]:
+def fetch_latest_verification_sync(user_id: Optional[str] = None) -> Optional[dict]:
     """
     Synchronous wrapper for fetching latest verification from Golem DB
     Use this function from Flask routes
     """
     try:
-        import threading
-        import concurrent.futures
-        
-        def run_async_in_thread():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(fetch_latest_verification_by_timestamp())
-            finally:
-                loop.close()
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(run_async_in_thread)
-            return future.result(timeout=30)  # 30 second timeout
+        return golem_manager.run_sync(fetch_latest_verification_by_timestamp(user_id), timeout=30)
             
     except Exception as e:
         logger.error(f"❌ Failed to fetch latest verification: {e}")
         return None
 
-def fetch_all_verifications_sync() -> list[dict]:
+def fetch_all_verifications_sync(user_id: Optional[str] = None) -> list[dict]:
     """
     Synchronous wrapper for fetching all verifications from Golem DB
     Use this function from Flask routes
     """
     try:
-        import threading
-        import concurrent.futures
-        
-        def run_async_in_thread():
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                return loop.run_until_complete(fetch_all_verifications())
-            finally:
-                loop.close()
-        
-        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-            future = executor.submit(run_async_in_thread)
-            return future.result(timeout=30)  # 30 second timeout
+        return golem_manager.run_sync(fetch_all_verifications(user_id), timeout=30)
             
     except Exception as e:
         logger.error(f"❌ Failed to fetch verifications: {e}")
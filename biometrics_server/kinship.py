@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Kinship Scoring Engine for HumanID Biometrics Server
+Vectorized, weighted per-locus allele sharing between two STR profiles with
+a calibrated probability and a per-chromosome breakdown
+"""
+
+import os
+import sys
+import time
+import zlib
+import logging
+import argparse
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# ========= ENV & GLOBALS =========
+ALGORITHM_VERSION = "kinship/1"
+WEIGHTS_FILE = os.getenv("KINSHIP_WEIGHTS_FILE", "")
+MIN_FREQUENCY = float(os.getenv("KINSHIP_MIN_FREQUENCY", "0.01"))
+CALIBRATION_MIDPOINT = float(os.getenv("KINSHIP_CALIBRATION_MIDPOINT", "0.5"))
+CALIBRATION_SLOPE = float(os.getenv("KINSHIP_CALIBRATION_SLOPE", "12"))
+
+# Same cut-offs as similarity_check.sh
+SAME_PERSON_THRESHOLD = 0.98
+RELATED_PERSON_THRESHOLD = 0.50
+
+# Keys pack (chromosome code, position, allele hash) into one int64:
+# 11 bits of chromosome, 32 bits of position, 20 bits of allele hash
+ALLELE_BITS = 20
+ALLELE_MASK = (1 << ALLELE_BITS) - 1
+POSITION_BITS = 32
+MAX_POSITION = (1 << POSITION_BITS) - 1
+MAX_CHROMOSOMES = 1 << 11
+
+class LocusTable:
+    """One profile as sorted arrays of (locus, allele) keys and per-locus allele counts"""
+
+    def __init__(self, keys: np.ndarray):
+        self.keys = np.unique(keys)
+        self.loci, self.allele_counts = np.unique(self.keys >> ALLELE_BITS, return_counts=True)
+
+def _chromosome_code(chrom_codes: Dict[bytes, int], chrom: bytes) -> int:
+    code = chrom_codes.get(chrom)
+    if code is None:
+        code = len(chrom_codes)
+        if code >= MAX_CHROMOSOMES:
+            raise ValueError(f"More than {MAX_CHROMOSOMES} chromosomes in one comparison")
+        chrom_codes[chrom] = code
+    return code
+
+def parse_profile(data: bytes, chrom_codes: Dict[bytes, int]) -> LocusTable:
+    """Parse CHROM<TAB>POS<TAB>REF<TAB>ALT lines; header and malformed lines are skipped
+
+    chrom_codes is shared by both profiles of a comparison and extended in place.
+    """
+    return parse_lines(data.split(b'\n'), chrom_codes)
+
+def parse_lines(lines: Iterable[bytes], chrom_codes: Dict[bytes, int]) -> LocusTable:
+    """Build a LocusTable from profile lines, e.g. the lines of a str_profile.ParsedProfile
+
+    Lines whose POS does not fit in POSITION_BITS are skipped like other
+    malformed lines, so they cannot spill into the chromosome bits of a key.
+    """
+    keys: List[int] = []
+    append, crc32, known_code = keys.append, zlib.crc32, chrom_codes.get
+    for line in lines:
+        if not line or line[0] == 0x23:  # '#'
+            continue
+        fields = line.rstrip(b'\r').split(b'\t', 4)
+        if len(fields) < 4 or not fields[1].isdigit():
+            continue
+        position = int(fields[1])
+        if position > MAX_POSITION:
+            continue
+        code = known_code(fields[0])
+        if code is None:
+            code = _chromosome_code(chrom_codes, fields[0])
+        locus_bits = ((code << POSITION_BITS) | position) << ALLELE_BITS
+        ref_crc = crc32(b'>', crc32(fields[2]))
+        alts = fields[3]
+        if b',' in alts:
+            for alt in alts.split(b','):
+                append(locus_bits | (crc32(alt, ref_crc) & ALLELE_MASK))
+        else:
+            append(locus_bits | (crc32(alts, ref_crc) & ALLELE_MASK))
+    return LocusTable(np.array(keys, dtype=np.int64))
+
+class LocusWeights:
+    """Per-locus weights, by default the inverse population frequency
+
+    Loaded from a TSV of CHROM, POS and FREQ; loci missing from it weigh 1.
+    """
+
+    def __init__(self, table: Optional[Dict[bytes, Tuple[np.ndarray, np.ndarray]]] = None):
+        self.table = table or {}
+
+    @classmethod
+    def from_file(cls, path: str) -> "LocusWeights":
+        rows: Dict[bytes, List[Tuple[int, float]]] = {}
+        with open(path, 'rb') as f:
+            for line in f:
+                if line.startswith(b'#') or not line.strip():
+                    continue
+                chrom, pos, freq = line.split(b'\t')[:3]
+                weight = 1.0 / max(float(freq), MIN_FREQUENCY)
+                rows.setdefault(chrom, []).append((int(pos), weight))
+        table = {}
+        for chrom, entries in rows.items():
+            entries.sort()
+            table[chrom] = (np.array([p for p, _ in entries], dtype=np.int64),
+                            np.array([w for _, w in entries], dtype=np.float64))
+        logger.info(f"⚖️  Loaded kinship weights for {sum(len(e) for e in rows.values())} loci")
+        return cls(table)
+
+    def lookup(self, loci: np.ndarray, chrom_names: List[bytes]) -> np.ndarray:
+        weights = np.ones(len(loci), dtype=np.float64)
+        if not self.table:
+            return weights
+        chroms = loci >> POSITION_BITS
+        positions = loci & ((1 << POSITION_BITS) - 1)
+        for code, chrom in enumerate(chrom_names):
+            if chrom not in self.table:
+                continue
+            table_positions, table_weights = self.table[chrom]
+            mask = chroms == code
+            index = np.searchsorted(table_positions, positions[mask])
+            index = np.minimum(index, len(table_positions) - 1)
+            found = table_positions[index] == positions[mask]
+            weights[np.flatnonzero(mask)[found]] = table_weights[index[found]]
+        return weights
+
+def calibrate(similarity: float) -> float:
+    """Logistic calibration of the weighted similarity to a probability of relatedness"""
+    return float(1.0 / (1.0 + np.exp(-CALIBRATION_SLOPE * (similarity - CALIBRATION_MIDPOINT))))
+
+def classify(similarity: float) -> str:
+    if similarity >= SAME_PERSON_THRESHOLD:
+        return "SAME_PERSON"
+    if similarity >= RELATED_PERSON_THRESHOLD:
+        return "RELATED_PERSON"
+    return "UNRELATED_PERSON"
+
+def score(a: LocusTable, b: LocusTable, chrom_names: List[bytes],
+          weights: Optional[LocusWeights] = None) -> Dict[str, Any]:
+    """Weighted allele sharing over the union of loci, overall and per chromosome
+
+    A locus scores shared alleles / max(allele count) and 0 when only one
+    profile has it.
+    """
+    union = np.union1d(a.loci, b.loci)
+    if len(union) == 0:
+        return {'similarity': 0.0, 'probability_score': calibrate(0.0), 'similarity_result': classify(0.0),
+                'loci_compared': 0, 'shared_loci': 0, 'chromosomes': {}}
+
+    counts_a = np.zeros(len(union), dtype=np.int64)
+    counts_a[np.searchsorted(union, a.loci)] = a.allele_counts
+    counts_b = np.zeros(len(union), dtype=np.int64)
+    counts_b[np.searchsorted(union, b.loci)] = b.allele_counts
+
+    shared_keys = np.intersect1d(a.keys, b.keys, assume_unique=True)
+    shared = np.bincount(np.searchsorted(union, shared_keys >> ALLELE_BITS), minlength=len(union))
+    sharing = shared / np.maximum(counts_a, counts_b)
+
+    locus_weights = (weights or LocusWeights()).lookup(union, chrom_names)
+    weighted_sharing = locus_weights * sharing
+    similarity = float(weighted_sharing.sum() / locus_weights.sum())
+
+    chroms = union >> POSITION_BITS
+    chrom_loci = np.bincount(chroms, minlength=len(chrom_names))
+    chrom_sharing = np.bincount(chroms, weights=weighted_sharing, minlength=len(chrom_names))
+    chrom_weight = np.bincount(chroms, weights=locus_weights, minlength=len(chrom_names))
+    chromosomes = {
+        chrom.decode('utf-8', 'replace'): {
+            'loci': int(chrom_loci[code]),
+            'similarity': round(float(chrom_sharing[code] / chrom_weight[code]), 6)
+        }
+        for code, chrom in enumerate(chrom_names) if chrom_loci[code]
+    }
+
+    return {
+        'similarity': round(similarity, 6),
+        'probability_score': round(calibrate(similarity), 6),
+        'similarity_result': classify(similarity),
+        'loci_compared': int(len(union)),
+        'shared_loci': int(np.count_nonzero(shared)),
+        'chromosomes': chromosomes
+    }
+
+_default_weights: Optional[LocusWeights] = None
+
+def default_weights() -> LocusWeights:
+    """Weights from KINSHIP_WEIGHTS_FILE, loaded once; uniform when unset"""
+    global _default_weights
+    if _default_weights is None:
+        _default_weights = LocusWeights.from_file(WEIGHTS_FILE) if WEIGHTS_FILE else LocusWeights()
+    return _default_weights
+
+def compare_profiles(profile_a: bytes, profile_b: bytes,
+                     weights: Optional[LocusWeights] = None) -> Dict[str, Any]:
+    """Parse and score two STR profiles in one pass each"""
+    return compare_lines(profile_a.split(b'\n'), profile_b.split(b'\n'), weights)
+
+def compare_lines(lines_a: Iterable[bytes], lines_b: Iterable[bytes],
+                  weights: Optional[LocusWeights] = None) -> Dict[str, Any]:
+    """Score two profiles given as lines, without re-reading their text"""
+    chrom_codes: Dict[bytes, int] = {}
+    a = parse_lines(lines_a, chrom_codes)
+    b = parse_lines(lines_b, chrom_codes)
+    chrom_names = sorted(chrom_codes, key=chrom_codes.get)
+    return score(a, b, chrom_names, weights if weights is not None else default_weights())
+
+# ========= BENCHMARK =========
+def synthetic_profile(loci: int, chromosomes: int, seed: int) -> bytes:
+    rng = np.random.default_rng(seed)
+    chrom = rng.integers(1, chromosomes + 1, loci)
+    pos = rng.integers(1, 250_000_000, loci)
+    alt = rng.integers(0, 4, loci)
+    bases = np.array(['A', 'C', 'G', 'T'])
+    return "\n".join(
+        f"chr{c}\t{p}\tAT\t{bases[x]}T" for c, p, x in zip(chrom, pos, alt)
+    ).encode('ascii')
+
+def benchmark(loci: int, chromosomes: int = 24, mutation_rate: float = 0.3) -> Dict[str, float]:
+    """Time parsing and scoring of two synthetic profiles that share most loci"""
+    base = synthetic_profile(loci, chromosomes, seed=1).split(b'\n')
+    rng = np.random.default_rng(2)
+    mutated = rng.random(len(base)) < mutation_rate
+    other = b'\n'.join(line[:-2] + b'GT' if flip else line for line, flip in zip(base, mutated))
+    profile = b'\n'.join(base)
+
+    start = time.perf_counter()
+    chrom_codes: Dict[bytes, int] = {}
+    a = parse_profile(profile, chrom_codes)
+    b = parse_profile(other, chrom_codes)
+    parse_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = score(a, b, sorted(chrom_codes, key=chrom_codes.get))
+    score_seconds = time.perf_counter() - start
+
+    return {
+        'loci': loci,
+        'parse_seconds': round(parse_seconds, 3),
+        'score_seconds': round(score_seconds, 3),
+        'parse_loci_per_second': round(2 * loci / parse_seconds),
+        'score_loci_per_second': round(result['loci_compared'] / score_seconds),
+        'similarity': result['similarity']
+    }
+
+def main():
+    """Compare two profiles, or benchmark the engine"""
+    parser = argparse.ArgumentParser(
+        description="Kinship Scoring Engine - weighted STR profile comparison",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Compare two profiles
+  python kinship.py max_str_final.txt dad_str_final.txt
+
+  # Benchmark on two synthetic 2M-locus profiles
+  python kinship.py --benchmark --loci 2000000
+        """
+    )
+    parser.add_argument('profiles', nargs='*', help='Two STR profile files')
+    parser.add_argument('--benchmark', action='store_true', help='Benchmark on synthetic profiles')
+    parser.add_argument('--loci', type=int, default=1_000_000, help='Loci per synthetic profile')
+    args = parser.parse_args()
+
+    import json
+
+    if args.benchmark:
+        print(json.dumps(benchmark(args.loci), indent=2))
+    elif len(args.profiles) == 2:
+        with open(args.profiles[0], 'rb') as fa, open(args.profiles[1], 'rb') as fb:
+            print(json.dumps(compare_profiles(fa.read(), fb.read()), indent=2))
+    else:
+        parser.print_usage()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -4,22 +4,30 @@ FastAPI Biometrics Server
 Handles file uploads for humanity verification and similarity checking
 """
 
+import time
+
+# Measured before the remaining imports so startup_seconds covers them
+PROCESS_START = time.monotonic()
+
 import os
 import json
+import base64
+import asyncio
 import uuid
 import hashlib
 import subprocess
 import tempfile
 import logging
-import random
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
-from fastapi.responses import JSONResponse
-from cryptography.fernet import Fernet
-import requests
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+import aiofiles
+
+from storage import create_blob_store, MetadataStore, BlobNotFoundError, RECORD_KINDS, record_kind
+from metrics import metrics
 
 # Initialize FastAPI app
 app = FastAPI(title="Biometrics Server", version="1.0.0")
@@ -65,116 +73,170 @@ handler.setFormatter(DemoFormatter('%(asctime)s | %(levelname)-8s | %(message)s'
 logger.addHandler(handler)
 
 # Configuration
-UPLOAD_FOLDER = '/tmp/biometrics_uploads'
-ENCRYPTED_FOLDER = '/tmp/biometrics_encrypted'
+SIMILARITY_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "similarity_check.sh")
 ALLOWED_EXTENSIONS = {'txt', 'csv', 'json'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB max file size
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Uploads are hashed and analyzed 1MB at a time
+MAX_SKETCH_SIZE = 64 * 1024  # A profile sketch is about 6KB of JSON
+# Sketch estimates this many standard errors (and at least SKETCH_MIN_MARGIN) from a
+# decision threshold are not trusted, and the device is asked for the full profile
+SKETCH_CONFIDENCE_Z = float(os.getenv("SKETCH_CONFIDENCE_Z", "3"))
+SKETCH_MIN_MARGIN = float(os.getenv("SKETCH_MIN_MARGIN", "0.01"))
+# Same cut-offs as kinship.py and similarity_check.sh
+SAME_PERSON_THRESHOLD = 0.98
+RELATED_PERSON_THRESHOLD = 0.50
+# A Golem DB notification that takes longer is abandoned; the check or verification still succeeds
+GOLEM_NOTIFY_TIMEOUT = float(os.getenv("GOLEM_NOTIFY_TIMEOUT", "30"))
 
-# Ensure directories exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(ENCRYPTED_FOLDER, exist_ok=True)
+# Encrypted blobs and metadata live in the configured storage backend
+blob_store = create_blob_store()
+metadata_store = MetadataStore(blob_store)
 
-# Encryption key (in production, this should be stored securely)
-ENCRYPTION_KEY = Fernet.generate_key()
-cipher_suite = Fernet(ENCRYPTION_KEY)
+# Encryption key ring: comma-separated Fernet keys, the first one encrypts and
+# all of them decrypt, so keys can be rotated without losing stored files
+ENCRYPTION_KEYS = [key.strip() for key in os.getenv("ENCRYPTION_KEYS", "").split(",") if key.strip()]
+_cipher_suite = None
 
-# Import Golem DB integration
-try:
-    from golem_endpoints import store_humanity_verification, store_similarity_check
-    logger.info("✅ GolemDB integration loaded successfully")
-    
-    async def notify_golem(event_type, data):
-        """Async wrapper for GolemDB notifications"""
+def get_cipher_suite():
+    """Build the key ring on first use so cryptography is not imported at startup"""
+    global _cipher_suite
+    if _cipher_suite is None:
+        from cryptography.fernet import Fernet, MultiFernet
+        keys = ENCRYPTION_KEYS
+        if not keys:
+            logger.warning("⚠️  ENCRYPTION_KEYS not set, using an ephemeral key; stored files will not survive a restart")
+            keys = [Fernet.generate_key()]
+        _cipher_suite = MultiFernet([Fernet(key) for key in keys])
+    return _cipher_suite
+
+# Golem DB integration is imported on first use (or during warm-up), since
+# golem_base_sdk pulls in web3 and is not needed to answer liveness probes
+_golem_module = None
+
+def load_golem_endpoints():
+    """Import golem_endpoints once; returns None when it is unavailable"""
+    global _golem_module
+    if _golem_module is None:
         try:
-            if event_type == "humanity_verification":
-                entity_key = await store_humanity_verification(data)
-                logger.info(f"✅ Humanity verification stored in Golem DB with entity key: {entity_key}")
-                return entity_key
-            elif event_type == "similarity_check":
-                entity_key = await store_similarity_check(data)
-                logger.info(f"✅ Similarity check stored in Golem DB with entity key: {entity_key}")
-                return entity_key
-            else:
-                logger.error(f"Unknown event type: {event_type}")
-                return None
-        except Exception as e:
-            logger.error(f"❌ Failed to notify Golem DB: {e}")
-            return None
-            
-except ImportError as e:
-    logger.warning(f"Failed to import golem_endpoints: {e}")
-    async def notify_golem(event_type, data):
+            import golem_endpoints
+            _golem_module = golem_endpoints
+            logger.info("✅ GolemDB integration loaded successfully")
+        except ImportError as e:
+            logger.warning(f"Failed to import golem_endpoints: {e}")
+            _golem_module = False
+    return _golem_module or None
+
+_kinship_module = None
+
+def load_kinship_engine():
+    """Import the NumPy kinship engine once; returns None when NumPy is unavailable"""
+    global _kinship_module
+    if _kinship_module is None:
+        try:
+            import kinship
+            _kinship_module = kinship
+            logger.info("✅ Kinship scoring engine loaded")
+        except ImportError as e:
+            logger.warning(f"Kinship engine unavailable, falling back to similarity_check.sh: {e}")
+            _kinship_module = False
+    return _kinship_module or None
+
+async def notify_golem(event_type, data):
+    """Async wrapper for GolemDB notifications"""
+    golem = load_golem_endpoints()
+    if golem is None:
         logger.info(f"📡 Mock GolemDB notification: {event_type}")
         logger.info(f"   Data: {data}")
         return "mock_entity_key_12345"
+    if not golem.PRIVATE_KEY:
+        logger.warning(f"⚠️  PRIVATE_KEY not set, skipping GolemDB notification: {event_type}")
+        return None
+    
+    try:
+        if event_type == "humanity_verification":
+            entity_key = await asyncio.wait_for(golem.store_humanity_verification(data), GOLEM_NOTIFY_TIMEOUT)
+            logger.info(f"✅ Humanity verification stored in Golem DB with entity key: {entity_key}")
+            return entity_key
+        elif event_type == "similarity_check":
+            entity_key = await asyncio.wait_for(golem.store_similarity_check(data), GOLEM_NOTIFY_TIMEOUT)
+            logger.info(f"✅ Similarity check stored in Golem DB with entity key: {entity_key}")
+            return entity_key
+        else:
+            logger.error(f"Unknown event type: {event_type}")
+            return None
+    except asyncio.TimeoutError:
+        logger.error(f"❌ GolemDB notification timed out after {GOLEM_NOTIFY_TIMEOUT:.0f}s: {event_type}")
+        return None
+    except Exception as e:
+        logger.error(f"❌ Failed to notify Golem DB: {e}")
+        return None
+
+from similarity_jobs import (similarity_job_queue, JobFailedError, JobQueueFullError,
+                             CallbackURLError, validate_callback_url)
+from admission import admission_controller, AdmissionRejected, request_bytes
+from response_cache import verification_cache
+from single_flight import similarity_flight
+from profile_stats import ProfileStats, SCORE_VERSION, score_components, humanity_score as score_profile
+from str_profile import ProfileParser, ProfileFormatError, ParsedProfile, parse_profile_bytes
+from workspace import job_workspace, sweep_stale_workspaces
+from profile_sketch import ProfileSketch, SketchFormatError, SKETCH_VERSION, estimate_similarity
 
 def allowed_file(filename: str) -> bool:
     """Check if file extension is allowed"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def encrypt_file(file_path: str, output_path: str) -> str:
-    """Encrypt a file and return the encrypted file path"""
-    with open(file_path, 'rb') as file:
-        file_data = file.read()
-    
-    encrypted_data = cipher_suite.encrypt(file_data)
-    
-    with open(output_path, 'wb') as encrypted_file:
-        encrypted_file.write(encrypted_data)
-    
-    return output_path
+async def store_encrypted(key: str, data: bytes):
+    """Encrypt data and write it to the blob store"""
+    encrypted_data = await asyncio.to_thread(get_cipher_suite().encrypt, data)
+    await blob_store.put(key, encrypted_data)
 
-def decrypt_file(encrypted_path: str, output_path: str) -> str:
-    """Decrypt a file and return the decrypted file path"""
-    with open(encrypted_path, 'rb') as encrypted_file:
-        encrypted_data = encrypted_file.read()
-    
-    decrypted_data = cipher_suite.decrypt(encrypted_data)
-    
-    with open(output_path, 'wb') as decrypted_file:
-        decrypted_file.write(decrypted_data)
-    
-    return output_path
-
-def get_file_hash(file_path: str) -> str:
-    """Calculate SHA-256 hash of a file"""
-    hash_sha256 = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_sha256.update(chunk)
-    return hash_sha256.hexdigest()
-
-def calculate_humanity_score(file_path: str) -> float:
-    """Calculate humanity score based on file content"""
+async def load_decrypted(key: str) -> bytes:
+    """Read a blob from the blob store and decrypt it"""
+    encrypted_data = await blob_store.get(key)
+    return await asyncio.to_thread(get_cipher_suite().decrypt, encrypted_data)
+
+async def read_upload(file: UploadFile, parser: Optional[ProfileParser] = None):
+    """Read an upload in chunks, hashing (and parsing) it as it arrives
+
+    Returns (content, sha256 hex digest); rejects uploads over MAX_FILE_SIZE
+    as soon as they cross it and malformed profiles at their first bad line.
+    """
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > MAX_FILE_SIZE:
+            raise HTTPException(status_code=413, detail="File too large. Maximum size: 50MB")
+        digest.update(chunk)
+        if parser is not None:
+            await asyncio.to_thread(parser.feed, chunk)
+        chunks.append(chunk)
+    return b''.join(chunks), digest.hexdigest()
+
+async def read_profile_upload(file: UploadFile, sinks=()):
+    """Read and validate an STR profile upload; returns (content, file_hash, ParsedProfile)"""
+    parser = ProfileParser(sinks)
     try:
-        with open(file_path, 'r') as f:
-            content = f.read()
-        
-        # Simple scoring based on content length and patterns
-        score = 0.5  # Base score
-        
-        # Add points for content length
-        if len(content) > 100:
-            score += 0.2
-        if len(content) > 500:
-            score += 0.2
-        
-        # Add points for common patterns
-        if 'human' in content.lower():
-            score += 0.1
-        if 'dna' in content.lower():
-            score += 0.1
-        if 'genetic' in content.lower():
-            score += 0.1
-        
-        # Add some randomness for demo purposes
-        score += random.uniform(0.0, 0.1)
-        
-        return min(score, 1.0)  # Cap at 1.0
-    except Exception as e:
-        logger.error(f"Error calculating humanity score: {e}")
-        return 0.5
+        file_content, file_hash = await read_upload(file, parser)
+        profile = parser.finish()
+    except ProfileFormatError as e:
+        metrics.inc("upload.invalid_profile")
+        raise HTTPException(status_code=422, detail=f"Invalid STR profile: {str(e)}")
+    return file_content, file_hash, profile
+
+def calculate_humanity_score(stats: ProfileStats) -> Dict[str, Any]:
+    """Humanity score from the profile statistics, with its inputs for audit"""
+    return {
+        'humanity_score': score_profile(stats),
+        'score_version': SCORE_VERSION,
+        'score_components': score_components(stats),
+        'profile_stats': stats.to_dict()
+    }
 
 def get_client_info(request) -> Dict[str, str]:
     """Extract client information from request"""
@@ -211,16 +273,164 @@ def log_request_error(endpoint_name: str, error: str):
     """Log request error"""
     logger.error(f"❌ {endpoint_name.upper()} FAILED: {error}")
 
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Shed load before reading the body when an endpoint or the bytes budget is saturated"""
+    limit = admission_controller.match(request.url.path)
+    if limit is None:
+        return await call_next(request)
+    
+    try:
+        reserved = await admission_controller.acquire(limit, request_bytes(request.headers))
+    except AdmissionRejected as e:
+        logger.warning(f"🚦 Rejected {request.url.path} with {e.status_code}: {e.detail}")
+        return JSONResponse(
+            status_code=e.status_code,
+            content={'detail': e.detail},
+            headers={'Retry-After': str(e.retry_after)}
+        )
+    
+    try:
+        return await call_next(request)
+    finally:
+        await admission_controller.release(limit, reserved)
+
+# ========= WARM-UP & READINESS =========
+warmup_state: Dict[str, Any] = {'ready': False, 'phases': {}}
+
+async def warm_metadata_index():
+    await metadata_store.load()
+
+async def warm_key_ring():
+    """Check the key ring round-trips and can still decrypt a stored file"""
+    cipher = await asyncio.to_thread(get_cipher_suite)
+    if cipher.decrypt(cipher.encrypt(b"key-ring-check")) != b"key-ring-check":
+        raise RuntimeError("Key ring failed an encrypt/decrypt round trip")
+    
+    sample = next((
+        metadata for metadata in metadata_store.records.values()
+        if metadata.get('verification_type') == 'first_humanity_verification'
+    ), None)
+    if sample is not None:
+        key = f"{sample['verification_id']}_encrypted.{sample.get('file_extension', 'txt')}"
+        try:
+            await load_decrypted(key)
+        except BlobNotFoundError:
+            logger.warning(f"   ⚠️  Key ring check skipped, sample blob {key} is missing")
+        except Exception:
+            raise RuntimeError(f"Stored file {key} cannot be decrypted with the configured ENCRYPTION_KEYS")
+
+async def warm_kinship_engine():
+    kinship = await asyncio.to_thread(load_kinship_engine)
+    if kinship is None:
+        return "unavailable, using similarity_check.sh"
+    await asyncio.to_thread(kinship.default_weights)
+    return kinship.ALGORITHM_VERSION
+
+async def warm_golem_client():
+    golem = await asyncio.to_thread(load_golem_endpoints)
+    if golem is None:
+        return "unavailable"
+    if not golem.PRIVATE_KEY:
+        return "skipped (PRIVATE_KEY not set)"
+    address = await golem.get_writer_address()
+    return f"connected as {address}"
+
+async def run_warmup_phase(name: str, phase, required: bool):
+    """Run one warm-up phase; required phases retry until they succeed"""
+    delay = 1.0
+    while True:
+        phase_start = time.monotonic()
+        try:
+            detail = await phase()
+            warmup_state['phases'][name] = {'status': 'ok', 'detail': detail}
+            break
+        except Exception as e:
+            warmup_state['phases'][name] = {'status': 'error', 'detail': str(e)}
+            logger.error(f"❌ Warm-up phase {name} failed: {e}")
+            if not required:
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+    elapsed = time.monotonic() - phase_start
+    warmup_state['phases'][name]['seconds'] = round(elapsed, 3)
+    metrics.set(f"warmup_{name}_seconds", elapsed)
+
+async def warm_up():
+    """Open the Golem client, load the metadata index, check the key ring and load the kinship engine"""
+    async def index_then_key_ring():
+        await run_warmup_phase('metadata_index', warm_metadata_index, required=True)
+        await run_warmup_phase('key_ring', warm_key_ring, required=False)
+    
+    await asyncio.gather(
+        index_then_key_ring(),
+        run_warmup_phase('golem_client', warm_golem_client, required=False),
+        run_warmup_phase('kinship_engine', warm_kinship_engine, required=False)
+    )
+    startup_seconds = time.monotonic() - PROCESS_START
+    warmup_state['ready'] = True
+    warmup_state['startup_seconds'] = round(startup_seconds, 3)
+    metrics.set("startup_seconds", startup_seconds)
+    logger.success(f"🚀 Warm-up complete, ready after {startup_seconds:.2f}s")
+
+@app.on_event("startup")
+async def start_warm_up():
+    """Warm up in the background so liveness probes are answered immediately"""
+    await asyncio.to_thread(sweep_stale_workspaces)
+    warmup_state['task'] = asyncio.create_task(warm_up())
+
+@app.on_event("shutdown")
+async def close_storage():
+    """Release pooled storage and Golem DB connections"""
+    await blob_store.close()
+    if _golem_module:
+        await asyncio.to_thread(_golem_module.golem_manager.close)
+
 # FastAPI Endpoints
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
+    """Liveness check endpoint
+    
+    Always 200 while the process serves requests, so a busy server is never
+    restarted; saturation is reported in the body and drives /ready instead.
+    """
+    saturation = admission_controller.saturation()
     return {
         "service": "biometrics_server",
         "status": "healthy",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        "saturation": saturation,
+        "similarity_jobs": similarity_job_queue.stats()
     }
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 once the background warm-up has finished, 503 while saturated
+
+    Load balancers stop routing here when admission control is close to its
+    limits and resume once it has drained.
+    """
+    saturation = admission_controller.saturation()
+    if not warmup_state['ready']:
+        status = "warming_up"
+    elif saturation['saturated']:
+        status = "saturated"
+    else:
+        status = "ready"
+    content = {
+        "service": "biometrics_server",
+        "status": status,
+        "startup_seconds": warmup_state.get('startup_seconds'),
+        "phases": warmup_state['phases'],
+        "saturation": saturation
+    }
+    return JSONResponse(status_code=200 if status == "ready" else 503, content=content)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Server metrics, including startup and warm-up timings"""
+    return metrics.snapshot()
+
 @app.post("/first_humanity_verification")
 async def first_humanity_verification(
     request: Request,
@@ -240,41 +450,33 @@ async def first_humanity_verification(
         if not file.filename or not allowed_file(file.filename):
             raise HTTPException(status_code=400, detail="Invalid file type. Allowed: txt, csv, json")
         
-        # Check file size
-        file_content = await file.read()
-        if len(file_content) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="File too large. Maximum size: 50MB")
+        # Read and validate the upload, hashing it and collecting profile statistics in one pass
+        stats = ProfileStats()
+        sketch = ProfileSketch()
+        file_content, file_hash, profile = await read_profile_upload(file, [stats.add, sketch.add])
+        sketch.panel = profile.panel
         
         # Generate verification ID
         verification_id = str(uuid.uuid4())
         logger.info(f"   🆔 Generated Verification ID: {Fore.GREEN}{verification_id}{Style.RESET_ALL}")
         logger.info(f"   📝 KYC Document ID: {Fore.GREEN}{external_kyc_document_id}{Style.RESET_ALL}")
         
-        # Save uploaded file
         filename = file.filename
         file_extension = filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{verification_id}.{file_extension}"
-        upload_path = os.path.join(UPLOAD_FOLDER, unique_filename)
         
-        with open(upload_path, 'wb') as f:
-            f.write(file_content)
-        
-        logger.info(f"   💾 File saved to: {Fore.CYAN}{upload_path}{Style.RESET_ALL}")
-        
-        # Calculate file hash
-        file_hash = get_file_hash(upload_path)
         logger.info(f"   🔐 File Hash: {Fore.CYAN}{file_hash[:16]}...{Style.RESET_ALL}")
         
-        # Calculate humanity score based on file content
-        logger.info(f"   🧮 Calculating humanity score...")
-        humanity_score = calculate_humanity_score(upload_path)
+        # Score the profile from its statistics
+        score = calculate_humanity_score(stats)
+        humanity_score = score['humanity_score']
+        logger.info(f"   🧮 Humanity score: {Fore.GREEN}{humanity_score}{Style.RESET_ALL} "
+                    f"({stats.variants} variants, {'sorted' if profile.is_sorted else 'unsorted'})")
         
         # Encrypt file
-        encrypted_filename = f"{verification_id}_encrypted.{file_extension}"
-        encrypted_path = os.path.join(ENCRYPTED_FOLDER, encrypted_filename)
+        encrypted_key = f"{verification_id}_encrypted.{file_extension}"
         logger.info(f"   🔒 Encrypting file...")
-        encrypt_file(upload_path, encrypted_path)
-        logger.info(f"   🔐 File encrypted and saved to: {Fore.CYAN}{encrypted_path}{Style.RESET_ALL}")
+        await store_encrypted(encrypted_key, file_content)
+        logger.info(f"   🔐 File encrypted and stored as: {Fore.CYAN}{encrypted_key}{Style.RESET_ALL}")
         
         # Save metadata
         metadata = {
@@ -284,16 +486,18 @@ async def first_humanity_verification(
             'humanity_score': humanity_score,
             'file_hash': file_hash,
             'timestamp': datetime.now().isoformat(),
-            'verification_type': 'first_humanity_verification'
+            'verification_type': 'first_humanity_verification',
+            'file_extension': file_extension,
+            'score_version': score['score_version'],
+            'score_components': score['score_components'],
+            'profile_stats': score['profile_stats'],
+            'panel': profile.panel,
+            'sketch': sketch.to_dict()
         }
         
-        metadata_filename = f"{verification_id}_metadata.json"
-        metadata_path = os.path.join(ENCRYPTED_FOLDER, metadata_filename)
-        
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=2)
-        
-        logger.info(f"   📋 Metadata saved to: {Fore.CYAN}{metadata_path}{Style.RESET_ALL}")
+        await metadata_store.put(metadata)
+        verification_cache.invalidate(user_id)
+        logger.info(f"   📋 Metadata saved for: {Fore.CYAN}{verification_id}{Style.RESET_ALL}")
         
         # Notify GolemDB
         logger.info(f"   📡 Notifying GolemDB...")
@@ -313,18 +517,15 @@ async def first_humanity_verification(
             # Update metadata with entity key
             metadata['golem_entity_key'] = golemdb_entity_key
             # Re-save metadata with entity key
-            with open(metadata_path, 'w') as f:
-                json.dump(metadata, f, indent=2)
+            await metadata_store.put(metadata)
+            verification_cache.invalidate(user_id)
             logger.info(f"   📋 Metadata updated with Golem entity key")
         else:
             logger.warning(f"   ⚠️  GolemDB notification failed")
         
-        # Clean up temporary file
-        os.remove(upload_path)
-        logger.info(f"   🗑️  Temporary file cleaned up")
-        
         # Calculate processing time
         processing_time = (datetime.now() - start_time).total_seconds()
+        metrics.observe("first_humanity_verification", processing_time)
         
         # Prepare result data
         result_data = {
@@ -345,6 +546,8 @@ async def first_humanity_verification(
                 'user_id': user_id,
                 'external_kyc_document_id': external_kyc_document_id,
                 'humanity_score': humanity_score,
+                'score_version': score['score_version'],
+                'score_components': score['score_components'],
                 'file_hash': file_hash,
                 'timestamp': metadata['timestamp']
             },
@@ -359,13 +562,230 @@ async def first_humanity_verification(
         log_request_error("FIRST HUMANITY VERIFICATION", str(e))
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# Bump when the script comparison changes so earlier results are no longer reused
+SCRIPT_ALGORITHM_VERSION = "similarity_check.sh/1"
+# similarity_check.sh only reports a class, so each class has a fixed probability
+SCRIPT_PROBABILITY_SCORES = {'SAME_PERSON': 0.95, 'RELATED_PERSON': 0.75, 'UNRELATED_PERSON': 0.25}
+
+def similarity_algorithm_version() -> str:
+    kinship = load_kinship_engine()
+    return kinship.ALGORITHM_VERSION if kinship is not None else SCRIPT_ALGORITHM_VERSION
+
+def check_same_panel(upload_panel: Optional[str], stored_panel: Optional[str]):
+    """Profiles restricted to different locus panels (or one to none) cannot be compared"""
+    if upload_panel != stored_panel:
+        metrics.inc("similarity_check.panel_mismatch")
+        raise HTTPException(
+            status_code=409,
+            detail=f"Profile panel mismatch: upload uses {upload_panel or 'no panel'}, "
+                   f"stored profile uses {stored_panel or 'no panel'}"
+        )
+
+def similarity_response(check: Dict[str, Any], memoized: bool) -> Dict[str, Any]:
+    return {
+        'success': True,
+        'message': 'Similarity check completed successfully',
+        'check_id': check['check_id'],
+        'similarity_result': check['similarity_result'],
+        'probability_score': check['probability_score'],
+        'stored_verification_id': check['stored_verification_id'],
+        'golemdb_notified': check.get('golem_entity_key') is not None,
+        'golem_entity_key': check.get('golem_entity_key'),
+        'kinship': check.get('kinship'),
+        'memoized': memoized
+    }
+
+async def run_similarity_script(workspace: str, upload_path: str, stored_content: bytes):
+    """Compare profiles with similarity_check.sh; returns (similarity_result, probability_score)
+
+    Both files hold header-free data lines in byte order, so the script's
+    header stripping and re-sorting are skipped. The script runs inside the
+    job's workspace, where it writes common_strs.txt and similarity_results/.
+    """
+    stored_decrypted_path = os.path.join(workspace, "stored_profile.txt")
+    async with aiofiles.open(stored_decrypted_path, 'wb') as f:
+        await f.write(stored_content)
+    logger.info(f"   🔓 Stored file decrypted to: {Fore.CYAN}{stored_decrypted_path}{Style.RESET_ALL}")
+    
+    # Run similarity check script
+    logger.info(f"   🔬 Running similarity check...")
+    try:
+        # Run in a worker thread so the event loop keeps serving other requests
+        result = await asyncio.to_thread(
+            subprocess.run,
+            [SIMILARITY_SCRIPT, upload_path, stored_decrypted_path],
+            cwd=workspace,
+            capture_output=True,
+            text=True,
+            timeout=30,
+            # Byte-order collation, matching ParsedProfile.canonical()
+            env={**os.environ, 'LC_ALL': 'C'}
+        )
+        
+        if result.returncode != 0:
+            logger.error(f"   ❌ Similarity check script failed: {result.stderr}")
+            raise HTTPException(status_code=500, detail="Similarity check script failed")
+        
+        # Parse similarity result
+        similarity_output = result.stdout.strip()
+        logger.info(f"   📊 Similarity script output: {Fore.CYAN}{similarity_output}{Style.RESET_ALL}")
+        
+        # Extract similarity result and probability
+        if "SAME_PERSON" in similarity_output:
+            similarity_result = "SAME_PERSON"
+        elif "RELATED_PERSON" in similarity_output:
+            similarity_result = "RELATED_PERSON"
+        else:
+            similarity_result = "UNRELATED_PERSON"
+        probability_score = SCRIPT_PROBABILITY_SCORES[similarity_result]
+        
+        logger.info(f"   🎯 Similarity Result: {Fore.GREEN}{similarity_result}{Style.RESET_ALL}")
+        logger.info(f"   📈 Probability Score: {Fore.GREEN}{probability_score}{Style.RESET_ALL}")
+    
+    except HTTPException:
+        raise
+    except subprocess.TimeoutExpired:
+        logger.error("   ⏰ Similarity check script timed out")
+        raise HTTPException(status_code=500, detail="Similarity check script timed out")
+    except Exception as e:
+        logger.error(f"   ❌ Error running similarity check: {e}")
+        raise HTTPException(status_code=500, detail=f"Error running similarity check: {str(e)}")
+    
+    return similarity_result, probability_score
+
+async def run_similarity_check(
+    check_id: str,
+    user_id: str,
+    workspace: str,
+    upload_path: str,
+    upload_profile: ParsedProfile,
+    file_hash: str,
+    stored_metadata: Dict[str, Any],
+    start_time: datetime
+) -> Dict[str, Any]:
+    """Compare an uploaded profile against the user's stored profile, record it and notify GolemDB
+
+    Scratch files go in workspace, which the caller removes.
+    """
+    stored_verification_id = stored_metadata.get('verification_id')
+    
+    # Decrypt stored file
+    stored_encrypted_key = f"{stored_verification_id}_encrypted.{stored_metadata.get('file_extension', 'txt')}"
+    
+    try:
+        stored_content = await load_decrypted(stored_encrypted_key)
+    except BlobNotFoundError:
+        raise HTTPException(status_code=404, detail="Stored encrypted file not found")
+    
+    # Profiles stored before uploads were validated may contain stray lines; skip them
+    stored_profile = await asyncio.to_thread(parse_profile_bytes, stored_content, False)
+    if stored_profile.skipped_lines:
+        logger.warning(f"   ⚠️  Skipped {stored_profile.skipped_lines} malformed lines in stored profile")
+    check_same_panel(upload_profile.panel, stored_profile.panel)
+    
+    kinship = load_kinship_engine()
+    kinship_summary = None
+    if kinship is not None:
+        logger.info(f"   🧬 Scoring kinship...")
+        try:
+            kinship_summary = await asyncio.to_thread(
+                kinship.compare_lines, upload_profile.lines, stored_profile.lines
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid STR profile: {str(e)}")
+        similarity_result = kinship_summary.pop('similarity_result')
+        probability_score = kinship_summary.pop('probability_score')
+        algorithm_version = kinship.ALGORITHM_VERSION
+        logger.info(f"   🎯 Similarity Result: {Fore.GREEN}{similarity_result}{Style.RESET_ALL}")
+        logger.info(f"   📈 Probability Score: {Fore.GREEN}{probability_score}{Style.RESET_ALL} "
+                    f"(similarity {kinship_summary['similarity']} over {kinship_summary['loci_compared']} loci)")
+    else:
+        similarity_result, probability_score = await run_similarity_script(
+            workspace, upload_path, stored_profile.canonical()
+        )
+        algorithm_version = SCRIPT_ALGORITHM_VERSION
+    
+    # Save check metadata
+    check_metadata = {
+        'check_id': check_id,
+        'user_id': user_id,
+        'stored_verification_id': stored_verification_id,
+        'similarity_result': similarity_result,
+        'probability_score': probability_score,
+        'timestamp': datetime.now().isoformat(),
+        'check_type': 'similarity_check',
+        'file_hash': file_hash,
+        'algorithm_version': algorithm_version,
+        'kinship': kinship_summary
+    }
+    
+    await metadata_store.put(check_metadata)
+    verification_cache.invalidate(user_id)
+    logger.info(f"   📋 Metadata saved for: {Fore.CYAN}{check_id}{Style.RESET_ALL}")
+    
+    # Notify GolemDB
+    logger.info(f"   📡 Notifying GolemDB...")
+    golemdb_data = {
+        'check_id': check_id,
+        'user_id': user_id,
+        'stored_verification_id': stored_verification_id,
+        'similarity_result': similarity_result,
+        'probability_score': probability_score,
+        'timestamp': check_metadata['timestamp'],
+        'check_type': 'similarity_check'
+    }
+    
+    golemdb_entity_key = await notify_golem('similarity_check', golemdb_data)
+    if golemdb_entity_key:
+        logger.info(f"   ✅ GolemDB notification sent successfully with entity key: {golemdb_entity_key}")
+        check_metadata['golem_entity_key'] = golemdb_entity_key
+        await metadata_store.put(check_metadata)
+        verification_cache.invalidate(user_id)
+    else:
+        logger.warning(f"   ⚠️  GolemDB notification failed")
+    
+    # Calculate processing time
+    processing_time = (datetime.now() - start_time).total_seconds()
+    metrics.observe("similarity_check", processing_time)
+    
+    # Prepare result data
+    result_data = {
+        'check_id': check_id,
+        'similarity_result': similarity_result,
+        'probability_score': probability_score,
+        'timestamp': check_metadata['timestamp']
+    }
+    
+    # Log success
+    log_request_success("SIMILARITY CHECK", result_data, processing_time)
+    
+    return similarity_response(check_metadata, memoized=False)
+
+def job_accepted_response(job, check_id: str) -> Dict[str, Any]:
+    return {
+        'success': True,
+        'message': 'Similarity check queued',
+        'job_id': job.job_id,
+        'check_id': check_id,
+        'status': job.status,
+        'status_url': f"/similarity_jobs/{job.job_id}",
+        'events_url': f"/similarity_jobs/{job.job_id}/events"
+    }
+
 @app.post("/similarity_check")
 async def similarity_check(
     request: Request,
     file: UploadFile = File(...),
-    user_id: str = Form(...)
+    user_id: str = Form(...),
+    async_mode: bool = Form(False),
+    callback_url: Optional[str] = Form(None)
 ):
-    """Similarity check endpoint"""
+    """Similarity check endpoint
+    
+    With async_mode=true the check is queued and a job id is returned
+    immediately; results are available from /similarity_jobs/{job_id},
+    its /events stream, or a signed POST to callback_url.
+    """
     start_time = datetime.now()
     
     try:
@@ -377,103 +797,231 @@ async def similarity_check(
         if not file.filename or not allowed_file(file.filename):
             raise HTTPException(status_code=400, detail="Invalid file type. Allowed: txt, csv, json")
         
-        # Check file size
-        file_content = await file.read()
-        if len(file_content) > MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="File too large. Maximum size: 50MB")
+        if callback_url:
+            try:
+                await asyncio.to_thread(validate_callback_url, callback_url)
+            except CallbackURLError as e:
+                raise HTTPException(status_code=400, detail=str(e))
         
-        # Generate check ID
-        check_id = str(uuid.uuid4())
-        logger.info(f"   🆔 Generated Check ID: {Fore.GREEN}{check_id}{Style.RESET_ALL}")
+        # Read and validate the upload, hashing it as it arrives
+        _, file_hash, upload_profile = await read_profile_upload(file)
         
-        # Save uploaded file
-        filename = file.filename
-        file_extension = filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{check_id}.{file_extension}"
-        upload_path = os.path.join(UPLOAD_FOLDER, unique_filename)
+        # Find stored verification for this user
+        stored_metadata = await metadata_store.find_verification(user_id)
+        if not stored_metadata:
+            raise HTTPException(status_code=404, detail=f"No stored verification found for user_id: {user_id}")
+        
+        logger.info(f"   🔍 Found stored verification: {Fore.GREEN}{stored_metadata.get('verification_id')}{Style.RESET_ALL}")
+        
+        # Verifications recorded since panels were introduced carry their panel; refuse before decrypting
+        if 'panel' in stored_metadata:
+            check_same_panel(upload_profile.panel, stored_metadata['panel'])
+        
+        # Reuse an earlier result for identical content
+        memoized_check = metadata_store.find_similarity_check(
+            file_hash, stored_metadata.get('verification_id'), similarity_algorithm_version()
+        )
+        if memoized_check is not None:
+            logger.info(f"   ♻️  Reusing similarity check: {Fore.GREEN}{memoized_check['check_id']}{Style.RESET_ALL}")
+            metrics.inc("similarity_check.memoized")
+            response = similarity_response(memoized_check, memoized=True)
+            if not (async_mode or callback_url):
+                return response
+            
+            async def reuse_result():
+                return response
+            
+            try:
+                job = similarity_job_queue.submit(user_id, reuse_result, callback_url)
+            except JobQueueFullError as e:
+                raise HTTPException(status_code=503, detail=str(e))
+            return JSONResponse(status_code=202, content=job_accepted_response(job, memoized_check['check_id']))
+        
+        # Concurrent identical requests share one check
+        flight_key = (user_id, file_hash, stored_metadata.get('verification_id'), similarity_algorithm_version())
+        file_extension = file.filename.rsplit('.', 1)[1].lower()
+        
+        async def start_check(check_id: str) -> Dict[str, Any]:
+            # Each check gets its own workspace, so concurrent checks never share scratch files
+            async with job_workspace(check_id) as workspace:
+                # The script gets the validated, sorted data lines so it can skip its own cleanup
+                upload_path = os.path.join(workspace, f"upload.{file_extension}")
+                async with aiofiles.open(upload_path, 'wb') as f:
+                    await f.write(upload_profile.canonical())
+                logger.info(f"   💾 File saved to: {Fore.CYAN}{upload_path}{Style.RESET_ALL}")
+                
+                result = await run_similarity_check(check_id, user_id, workspace, upload_path, upload_profile,
+                                                    file_hash, stored_metadata, start_time)
+            logger.info(f"   🗑️  Workspace cleaned up")
+            return result
+        
+        # Claim the check now, queued or not, so its check_id is the one every joiner reports
+        call, leader = similarity_flight.claim(flight_key, tag=str(uuid.uuid4()))
+        check_id = call.tag
+        if leader:
+            logger.info(f"   🆔 Generated Check ID: {Fore.GREEN}{check_id}{Style.RESET_ALL}")
+        else:
+            logger.info(f"   🔗 Joining in-flight check: {Fore.GREEN}{check_id}{Style.RESET_ALL}")
+        
+        async def coalesced_check() -> Dict[str, Any]:
+            if leader:
+                return await similarity_flight.run(call, lambda: start_check(check_id))
+            return await similarity_flight.join(call)
+        
+        if not (async_mode or callback_url):
+            return await coalesced_check()
+        
+        async def run_job():
+            try:
+                return await coalesced_check()
+            except HTTPException as e:
+                raise JobFailedError(e.status_code, e.detail)
+        
+        try:
+            job = similarity_job_queue.submit(user_id, run_job, callback_url)
+        except JobQueueFullError as e:
+            if leader:
+                similarity_flight.fail(call, HTTPException(status_code=503, detail=str(e)))
+            raise HTTPException(status_code=503, detail=str(e))
+        
+        return JSONResponse(status_code=202, content=job_accepted_response(job, check_id))
         
-        with open(upload_path, 'wb') as f:
-            f.write(file_content)
+    except HTTPException:
+        raise
+    except Exception as e:
+        processing_time = (datetime.now() - start_time).total_seconds()
+        log_request_error("SIMILARITY CHECK", str(e))
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+def sharing_from_jaccard(jaccard: float, stderr: float) -> Tuple[float, float]:
+    """The Dice coefficient s = 2J / (1 + J) of a Jaccard estimate, and its standard error
+
+    Unweighted allele sharing equals s when the profiles cover the same loci
+    and differ only in alleles, and J when they differ only in which loci
+    they cover. The standard error is scaled by ds/dJ = 2 / (1 + J)^2.
+    """
+    return 2.0 * jaccard / (1.0 + jaccard), stderr * 2.0 / (1.0 + jaccard) ** 2
+
+def full_profile_required(reason: str, estimate: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    metrics.inc("similarity_check_sketch.full_profile_required")
+    logger.info(f"   📤 Full profile required: {Fore.YELLOW}{reason}{Style.RESET_ALL}")
+    return {
+        'success': True,
+        'message': f'Sketch is not conclusive, upload the full profile to /similarity_check: {reason}',
+        'full_profile_required': True,
+        'reason': reason,
+        'sketch': estimate
+    }
+
+@app.post("/similarity_check_sketch")
+async def similarity_check_sketch(
+    request: Request,
+    sketch: str = Form(...),
+    user_id: str = Form(...)
+):
+    """Identity confirmation from a profile sketch
+    
+    The device sends the MinHash sketch of its profile (profile_sketch.py)
+    instead of the profile. It is compared with the sketch stored at
+    enrollment; when the estimated similarity is within the sketch's error
+    of a decision threshold, the answer is full_profile_required and the
+    device falls back to /similarity_check.
+    """
+    start_time = datetime.now()
+    
+    try:
+        # Log request start
+        client_info = get_client_info(request)
+        log_request_start("SIMILARITY CHECK SKETCH", client_info)
         
-        logger.info(f"   💾 File saved to: {Fore.CYAN}{upload_path}{Style.RESET_ALL}")
+        if len(sketch) > MAX_SKETCH_SIZE:
+            raise HTTPException(status_code=413, detail=f"Sketch too large. Maximum size: {MAX_SKETCH_SIZE} bytes")
+        try:
+            upload_sketch = ProfileSketch.from_dict(json.loads(sketch))
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid profile sketch: {str(e)}")
         
         # Find stored verification for this user
-        stored_verification_id = None
-        stored_metadata = None
-        
-        for filename in os.listdir(ENCRYPTED_FOLDER):
-            if filename.endswith('_metadata.json'):
-                metadata_path = os.path.join(ENCRYPTED_FOLDER, filename)
-                try:
-                    with open(metadata_path, 'r') as f:
-                        metadata = json.load(f)
-                    if metadata.get('user_id') == user_id and metadata.get('verification_type') == 'first_humanity_verification':
-                        stored_verification_id = metadata.get('verification_id')
-                        stored_metadata = metadata
-                        break
-                except Exception as e:
-                    logger.warning(f"   ⚠️  Error reading metadata file {filename}: {e}")
-                    continue
-        
-        if not stored_verification_id:
+        stored_metadata = await metadata_store.find_verification(user_id)
+        if not stored_metadata:
             raise HTTPException(status_code=404, detail=f"No stored verification found for user_id: {user_id}")
         
+        stored_verification_id = stored_metadata.get('verification_id')
         logger.info(f"   🔍 Found stored verification: {Fore.GREEN}{stored_verification_id}{Style.RESET_ALL}")
         
-        # Decrypt stored file
-        stored_encrypted_filename = f"{stored_verification_id}_encrypted.{stored_metadata.get('file_extension', 'txt')}"
-        stored_encrypted_path = os.path.join(ENCRYPTED_FOLDER, stored_encrypted_filename)
+        if 'panel' in stored_metadata:
+            check_same_panel(upload_sketch.panel, stored_metadata['panel'])
         
-        if not os.path.exists(stored_encrypted_path):
-            raise HTTPException(status_code=404, detail="Stored encrypted file not found")
+        # Verifications stored before sketches existed, or with another sketch version, need the profile
+        try:
+            stored_sketch = ProfileSketch.from_dict(stored_metadata.get('sketch'))
+        except SketchFormatError:
+            return full_profile_required(f"no {SKETCH_VERSION} sketch stored for this verification")
+        
+        # The sketch estimates unweighted record overlap; weighted kinship scores can differ from it
+        kinship = load_kinship_engine()
+        if kinship is not None and kinship.WEIGHTS_FILE:
+            return full_profile_required("kinship locus weights are configured")
+        
+        jaccard, jaccard_stderr = await asyncio.to_thread(estimate_similarity, upload_sketch, stored_sketch)
+        jaccard_margin = max(SKETCH_MIN_MARGIN, SKETCH_CONFIDENCE_Z * jaccard_stderr)
+        if kinship is not None:
+            # The kinship score lies between J and 2J/(1+J), so the whole range must clear a threshold
+            similarity, stderr = sharing_from_jaccard(jaccard, jaccard_stderr)
+            margin = max(SKETCH_MIN_MARGIN, SKETCH_CONFIDENCE_Z * stderr)
+            low, high = jaccard - jaccard_margin, similarity + margin
+        else:
+            # similarity_check.sh scores the Jaccard similarity itself
+            similarity, stderr, margin = jaccard, jaccard_stderr, jaccard_margin
+            low, high = similarity - margin, similarity + margin
+        estimate = {
+            'jaccard': round(jaccard, 6),
+            'similarity': round(similarity, 6),
+            'stderr': round(stderr, 6),
+            'margin': round(margin, 6),
+            'range': [round(max(0.0, low), 6), round(min(1.0, high), 6)],
+            'records': upload_sketch.records,
+            'stored_records': stored_sketch.records
+        }
+        logger.info(f"   🧮 Sketch similarity: {Fore.CYAN}{similarity:.4f}{Style.RESET_ALL} "
+                    f"(range {low:.4f} to {high:.4f})")
+        
+        for threshold in (SAME_PERSON_THRESHOLD, RELATED_PERSON_THRESHOLD):
+            if low < threshold < high:
+                return full_profile_required(f"estimate range {low:.4f} to {high:.4f} spans {threshold}",
+                                             estimate)
+        
+        if similarity >= SAME_PERSON_THRESHOLD:
+            similarity_result = "SAME_PERSON"
+        elif similarity >= RELATED_PERSON_THRESHOLD:
+            similarity_result = "RELATED_PERSON"
+        else:
+            similarity_result = "UNRELATED_PERSON"
+        if kinship is not None:
+            probability_score = round(kinship.calibrate(similarity), 6)
+        else:
+            probability_score = SCRIPT_PROBABILITY_SCORES[similarity_result]
+        metrics.inc("similarity_check_sketch.decided")
         
-        stored_decrypted_path = os.path.join(UPLOAD_FOLDER, f"{stored_verification_id}_decrypted.txt")
-        decrypt_file(stored_encrypted_path, stored_decrypted_path)
-        logger.info(f"   🔓 Stored file decrypted to: {Fore.CYAN}{stored_decrypted_path}{Style.RESET_ALL}")
+        check_id = str(uuid.uuid4())
+        logger.info(f"   🆔 Generated Check ID: {Fore.GREEN}{check_id}{Style.RESET_ALL}")
         
-        # Run similarity check script
-        logger.info(f"   🔬 Running similarity check...")
-        similarity_script_path = "./similarity_check.sh"
+        # Save check metadata; there is no file hash, so sketch checks are never memoized
+        check_metadata = {
+            'check_id': check_id,
+            'user_id': user_id,
+            'stored_verification_id': stored_verification_id,
+            'similarity_result': similarity_result,
+            'probability_score': probability_score,
+            'timestamp': datetime.now().isoformat(),
+            'check_type': 'similarity_check',
+            'algorithm_version': SKETCH_VERSION,
+            'sketch': estimate
+        }
         
-        try:
-            result = subprocess.run(
-                [similarity_script_path, upload_path, stored_decrypted_path],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            if result.returncode != 0:
-                logger.error(f"   ❌ Similarity check script failed: {result.stderr}")
-                raise HTTPException(status_code=500, detail="Similarity check script failed")
-            
-            # Parse similarity result
-            similarity_output = result.stdout.strip()
-            logger.info(f"   📊 Similarity script output: {Fore.CYAN}{similarity_output}{Style.RESET_ALL}")
-            
-            # Extract similarity result and probability
-            similarity_result = "UNRELATED_PERSON"  # Default
-            probability_score = 0.0
-            
-            if "SAME_PERSON" in similarity_output:
-                similarity_result = "SAME_PERSON"
-                probability_score = 0.95
-            elif "RELATED_PERSON" in similarity_output:
-                similarity_result = "RELATED_PERSON"
-                probability_score = 0.75
-            else:
-                similarity_result = "UNRELATED_PERSON"
-                probability_score = 0.25
-            
-            logger.info(f"   🎯 Similarity Result: {Fore.GREEN}{similarity_result}{Style.RESET_ALL}")
-            logger.info(f"   📈 Probability Score: {Fore.GREEN}{probability_score}{Style.RESET_ALL}")
-            
-        except subprocess.TimeoutExpired:
-            logger.error("   ⏰ Similarity check script timed out")
-            raise HTTPException(status_code=500, detail="Similarity check script timed out")
-        except Exception as e:
-            logger.error(f"   ❌ Error running similarity check: {e}")
-            raise HTTPException(status_code=500, detail=f"Error running similarity check: {str(e)}")
+        await metadata_store.put(check_metadata)
+        verification_cache.invalidate(user_id)
+        logger.info(f"   📋 Metadata saved for: {Fore.CYAN}{check_id}{Style.RESET_ALL}")
         
         # Notify GolemDB
         logger.info(f"   📡 Notifying GolemDB...")
@@ -483,122 +1031,211 @@ async def similarity_check(
             'stored_verification_id': stored_verification_id,
             'similarity_result': similarity_result,
             'probability_score': probability_score,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': check_metadata['timestamp'],
             'check_type': 'similarity_check'
         }
         
         golemdb_entity_key = await notify_golem('similarity_check', golemdb_data)
         if golemdb_entity_key:
             logger.info(f"   ✅ GolemDB notification sent successfully with entity key: {golemdb_entity_key}")
+            check_metadata['golem_entity_key'] = golemdb_entity_key
+            await metadata_store.put(check_metadata)
+            verification_cache.invalidate(user_id)
         else:
             logger.warning(f"   ⚠️  GolemDB notification failed")
         
-        # Clean up files
-        os.remove(upload_path)
-        os.remove(stored_decrypted_path)
-        logger.info(f"   🗑️  Temporary files cleaned up")
-        
         # Calculate processing time
         processing_time = (datetime.now() - start_time).total_seconds()
-        
-        # Prepare result data
-        result_data = {
-            'check_id': check_id,
-            'similarity_result': similarity_result,
-            'probability_score': probability_score,
-            'timestamp': golemdb_data['timestamp']
-        }
-        
-        # Log success
-        log_request_success("SIMILARITY CHECK", result_data, processing_time)
+        metrics.observe("similarity_check_sketch", processing_time)
+        log_request_success("SIMILARITY CHECK SKETCH", check_metadata, processing_time)
         
         return {
-            'success': True,
-            'message': 'Similarity check completed successfully',
-            'check_id': check_id,
-            'similarity_result': similarity_result,
-            'probability_score': probability_score,
-            'stored_verification_id': stored_verification_id,
-            'golemdb_notified': golemdb_entity_key is not None,
-            'golem_entity_key': golemdb_entity_key
+            **similarity_response(check_metadata, memoized=False),
+            'full_profile_required': False,
+            'sketch': estimate
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        processing_time = (datetime.now() - start_time).total_seconds()
-        log_request_error("SIMILARITY CHECK", str(e))
+        log_request_error("SIMILARITY CHECK SKETCH", str(e))
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.get("/similarity_jobs/{job_id}")
+async def get_similarity_job(job_id: str):
+    """Poll the status and result of an asynchronous similarity check"""
+    job = similarity_job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Similarity job not found: {job_id}")
+    return job.to_dict()
+
+@app.get("/similarity_jobs/{job_id}/events")
+async def stream_similarity_job(job_id: str):
+    """Stream status changes of an asynchronous similarity check as Server-Sent Events"""
+    job = similarity_job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Similarity job not found: {job_id}")
+    return StreamingResponse(
+        similarity_job_queue.events(job),
+        media_type="text/event-stream",
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def verification_summary(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a verification, joined with its newest similarity check"""
+    check = metadata_store.latest_check_for(metadata.get('verification_id')) or {}
+    return {
+        'verification_id': metadata.get('verification_id'),
+        'user_id': metadata.get('user_id'),
+        'external_kyc_document_id': metadata.get('external_kyc_document_id'),
+        'humanity_score': metadata.get('humanity_score'),
+        'timestamp': metadata.get('timestamp'),
+        'golem_entity_key': metadata.get('golem_entity_key'),
+        'similarity_result': check.get('similarity_result'),
+        'probability_score': check.get('probability_score')
+    }
+
+def similarity_check_summary(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a similarity check"""
+    return {
+        'check_id': metadata.get('check_id'),
+        'user_id': metadata.get('user_id'),
+        'stored_verification_id': metadata.get('stored_verification_id'),
+        'similarity_result': metadata.get('similarity_result'),
+        'probability_score': metadata.get('probability_score'),
+        'timestamp': metadata.get('timestamp')
+    }
+
 @app.get("/verification_status/{user_id}")
 async def get_verification_status(user_id: str):
     """Get verification status for a user"""
     try:
         logger.info(f"🔍 Checking verification status for user: {Fore.GREEN}{user_id}{Style.RESET_ALL}")
         
-        # Find all verifications for this user
-        verifications = []
-        similarity_checks = []
-        
-        for filename in os.listdir(ENCRYPTED_FOLDER):
-            if filename.endswith('_metadata.json'):
-                metadata_path = os.path.join(ENCRYPTED_FOLDER, filename)
-                try:
-                    with open(metadata_path, 'r') as f:
-                        metadata = json.load(f)
-                    
-                    if metadata.get('user_id') == user_id:
-                        if metadata.get('verification_type') == 'first_humanity_verification':
-                            verifications.append({
-                                'verification_id': metadata.get('verification_id'),
-                                'user_id': metadata.get('user_id'),
-                                'external_kyc_document_id': metadata.get('external_kyc_document_id'),
-                                'humanity_score': metadata.get('humanity_score'),
-                                'timestamp': metadata.get('timestamp'),
-                                'golem_entity_key': metadata.get('golem_entity_key'),
-                                'similarity_result': None,
-                                'probability_score': None
-                            })
-                        elif metadata.get('check_type') == 'similarity_check':
-                            similarity_checks.append({
-                                'check_id': metadata.get('check_id'),
-                                'user_id': metadata.get('user_id'),
-                                'stored_verification_id': metadata.get('stored_verification_id'),
-                                'similarity_result': metadata.get('similarity_result'),
-                                'probability_score': metadata.get('probability_score'),
-                                'timestamp': metadata.get('timestamp')
-                            })
-                except Exception as e:
-                    logger.warning(f"   ⚠️  Error reading metadata file {filename}: {e}")
-                    continue
-        
-        # Match similarity checks with verifications
-        for verification in verifications:
-            for check in similarity_checks:
-                if check['stored_verification_id'] == verification['verification_id']:
-                    verification['similarity_result'] = check['similarity_result']
-                    verification['probability_score'] = check['probability_score']
-                    break
-        
-        logger.info(f"   📊 Found {len(verifications)} verifications and {len(similarity_checks)} similarity checks")
+        verifications = [
+            verification_summary(metadata)
+            for metadata in await metadata_store.history(user_id, kinds=("verification",))
+            if metadata.get('verification_type') == 'first_humanity_verification'
+        ]
+        total_similarity_checks = len(await metadata_store.history(user_id, kinds=("similarity_check",)))
+        
+        logger.info(f"   📊 Found {len(verifications)} verifications and {total_similarity_checks} similarity checks")
         
         return {
             'user_id': user_id,
             'verifications': verifications,
             'total_verifications': len(verifications),
-            'total_similarity_checks': len(similarity_checks)
+            'total_similarity_checks': total_similarity_checks
         }
         
     except Exception as e:
         logger.error(f"❌ Error getting verification status: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 500
+HISTORY_EXPORT_PAGE_SIZE = 500
+
+def encode_cursor(metadata: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just past a record in newest-first order"""
+    return base64.urlsafe_b64encode(json.dumps(MetadataStore.sort_key(metadata)).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str):
+    try:
+        timestamp, record_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return (str(timestamp), str(record_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def normalize_timestamp(value: Optional[str], name: str) -> Optional[str]:
+    """Validate an ISO timestamp query parameter, in the format records are stored with"""
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} timestamp: {value}")
+
+def history_item(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    if record_kind(metadata) == "similarity_check":
+        return {'record_type': 'similarity_check', **similarity_check_summary(metadata)}
+    return {'record_type': 'verification', **verification_summary(metadata)}
+
+@app.get("/verification_history/{user_id}")
+async def get_verification_history(
+    user_id: str,
+    record_type: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = HISTORY_DEFAULT_LIMIT,
+    format: str = "json"
+):
+    """Page through a user's verifications and similarity checks, newest first
+
+    Filter with record_type (verification or similarity_check) and an ISO
+    since (inclusive) / until (exclusive) range. Pass next_cursor back as
+    cursor for the following page, or use format=ndjson to stream every
+    matching record.
+    """
+    if record_type is None:
+        kinds = RECORD_KINDS
+    elif record_type in RECORD_KINDS:
+        kinds = (record_type,)
+    else:
+        raise HTTPException(status_code=400, detail=f"record_type must be one of: {', '.join(RECORD_KINDS)}")
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    
+    since = normalize_timestamp(since, "since")
+    until = normalize_timestamp(until, "until")
+    before = decode_cursor(cursor) if cursor else None
+    
+    if format == "ndjson":
+        async def export():
+            position = before
+            while True:
+                page = await metadata_store.history(user_id, kinds, since, until, position, HISTORY_EXPORT_PAGE_SIZE)
+                for metadata in page:
+                    yield json.dumps(history_item(metadata)) + "\n"
+                if len(page) < HISTORY_EXPORT_PAGE_SIZE:
+                    return
+                position = MetadataStore.sort_key(page[-1])
+        
+        return StreamingResponse(export(), media_type="application/x-ndjson")
+    
+    limit = max(1, min(limit, HISTORY_MAX_LIMIT))
+    page = await metadata_store.history(user_id, kinds, since, until, before, limit + 1)
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    return {
+        'user_id': user_id,
+        'items': [history_item(metadata) for metadata in page],
+        'next_cursor': encode_cursor(page[-1]) if has_more else None
+    }
+
 @app.get("/verification-with-golem/{user_id}")
-async def get_verification_with_golem_db(user_id: str):
-    """Get verification data using local biometrics data enhanced with Golem DB annotations"""
+async def get_verification_with_golem_db(user_id: str, request: Request):
+    """Get verification data using local biometrics data enhanced with Golem DB annotations
+
+    Responses are cached per user for a few seconds and invalidated on writes.
+    Polls that send the previous ETag in If-None-Match get an empty 304.
+    """
+    content, etag = await verification_cache.get_or_fetch(
+        user_id, lambda: fetch_verification_with_golem_db(user_id)
+    )
+    headers = {
+        'ETag': etag,
+        'Cache-Control': f"private, max-age={int(verification_cache.ttl)}"
+    }
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=content, headers=headers)
+
+async def fetch_verification_with_golem_db(user_id: str) -> Dict[str, Any]:
+    """Build the /verification-with-golem response from local metadata and Golem DB"""
     try:
-        from golem_endpoints import fetch_verification_by_entity_key
-        
         logger.info(f"🔍 Fetching verification with Golem DB integration for user: {Fore.GREEN}{user_id}{Style.RESET_ALL}")
         
         # Step 1: Get verification data from local biometrics server (this backend's own data)
@@ -615,10 +1252,12 @@ async def get_verification_with_golem_db(user_id: str):
         
         # Step 2: Try to fetch from Golem DB using verification_id to find entity_key
         try:
-            from golem_endpoints import fetch_latest_verification_by_timestamp
+            golem = load_golem_endpoints()
             
             # First try to get the verification with entity_key from Golem DB
-            verification_with_annotations = await fetch_latest_verification_by_timestamp()
+            verification_with_annotations = None
+            if golem is not None:
+                verification_with_annotations = await golem.fetch_latest_verification_by_timestamp(user_id)
             
             if verification_with_annotations is not None:
                 logger.info(f"   ✅ Found verification in Golem DB with entity key: {Fore.GREEN}{verification_with_annotations.get('entity_key', 'N/A')}{Style.RESET_ALL}")
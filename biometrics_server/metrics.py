@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Metrics Registry for HumanID Biometrics Server
+In-process counters, gauges and timings served by the /metrics endpoint
+"""
+
+import threading
+from typing import Dict, Any
+
+class Metrics:
+    """Thread-safe registry of named counters, gauges and timings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        """Record one duration; keeps count, total and max"""
+        with self._lock:
+            timing = self.timings.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+            timing['count'] += 1
+            timing['total_seconds'] += seconds
+            timing['max_seconds'] = max(timing['max_seconds'], seconds)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'timings': {name: dict(timing) for name, timing in self.timings.items()}
+            }
+
+# Shared registry used across the server
+metrics = Metrics()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Streaming Profile Statistics for HumanID Biometrics Server
+Statistics over an STR profile, collected while it is parsed on upload, and
+the deterministic humanity score derived from them
+"""
+
+import math
+from typing import Dict, Any, List, Optional
+
+# Bump when the statistics or the score formula change
+SCORE_VERSION = "profile-stats/2"
+
+# Indel length buckets (by absolute length difference between REF and ALT)
+INDEL_BUCKETS = ((1, "1"), (2, "2"), (3, "3"), (4, "4"), (10, "5-10"), (50, "11-50"))
+INDEL_OVERFLOW_BUCKET = ">50"
+
+AUTOSOMES = {str(n) for n in range(1, 23)}
+
+# A profile with this many variant loci gets full marks for volume
+TARGET_LOCI = 10000
+# Typical heterozygous / homozygous-alt ratio of human genomes
+EXPECTED_HET_HOM_RATIO = 1.75
+
+SCORE_WEIGHTS = {
+    'volume': 0.3,
+    'autosome_coverage': 0.3,
+    'indel_shape': 0.25,
+    'het_hom_ratio': 0.15,
+}
+
+def _indel_bucket(length: int) -> str:
+    for limit, name in INDEL_BUCKETS:
+        if length <= limit:
+            return name
+    return INDEL_OVERFLOW_BUCKET
+
+def _is_het(genotype: bytes) -> Optional[bool]:
+    """True for heterozygous, False for homozygous, None when missing"""
+    alleles = genotype.split(b':', 1)[0].replace(b'|', b'/').split(b'/')
+    if len(alleles) != 2 or b'.' in alleles:
+        return None
+    return alleles[0] != alleles[1]
+
+class ProfileStats:
+    """Accumulates STR profile statistics, one parsed record at a time
+
+    Records are CHROM, POS, REF, ALT and an optional GT field, as handed out
+    by the str_profile parser. Without a GT field a multi-allelic ALT counts
+    as heterozygous and single-ALT loci have no known zygosity.
+    """
+
+    def __init__(self):
+        self.variants = 0
+        self.per_chromosome: Dict[str, int] = {}
+        self.insertions = 0
+        self.deletions = 0
+        self.substitutions = 0
+        self.indel_lengths: Dict[str, int] = {}
+        self.het = 0
+        self.hom = 0
+
+    def add(self, fields: List[bytes]):
+        chrom = fields[0].decode('utf-8', 'replace')
+        self.variants += 1
+        self.per_chromosome[chrom] = self.per_chromosome.get(chrom, 0) + 1
+
+        ref_length = len(fields[2])
+        alts = fields[3].split(b',')
+        for alt in alts:
+            difference = len(alt) - ref_length
+            if difference == 0:
+                self.substitutions += 1
+                continue
+            if difference > 0:
+                self.insertions += 1
+            else:
+                self.deletions += 1
+            bucket = _indel_bucket(abs(difference))
+            self.indel_lengths[bucket] = self.indel_lengths.get(bucket, 0) + 1
+
+        zygosity = _is_het(fields[4]) if len(fields) > 4 else (True if len(alts) > 1 else None)
+        if zygosity is True:
+            self.het += 1
+        elif zygosity is False:
+            self.hom += 1
+
+    def het_hom_ratio(self) -> Optional[float]:
+        return self.het / self.hom if self.hom else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        ratio = self.het_hom_ratio()
+        return {
+            'variants': self.variants,
+            'per_chromosome': dict(sorted(self.per_chromosome.items())),
+            'insertions': self.insertions,
+            'deletions': self.deletions,
+            'substitutions': self.substitutions,
+            'indel_lengths': self.indel_lengths,
+            'het': self.het,
+            'hom': self.hom,
+            'het_hom_ratio': round(ratio, 4) if ratio is not None else None
+        }
+
+def score_components(stats: ProfileStats) -> Dict[str, float]:
+    """Each component of the humanity score, in [0, 1]"""
+    volume = min(1.0, math.log10(1 + stats.variants) / math.log10(1 + TARGET_LOCI))
+
+    autosomes = {chrom[3:] if chrom.lower().startswith('chr') else chrom for chrom in stats.per_chromosome}
+    autosome_coverage = len(autosomes & AUTOSOMES) / len(AUTOSOMES)
+
+    # Human indels are mostly short and roughly balanced between insertions and deletions
+    indels = stats.insertions + stats.deletions
+    if indels:
+        short = sum(count for bucket, count in stats.indel_lengths.items()
+                    if bucket in ("1", "2", "3", "4", "5-10")) / indels
+        balance = 1.0 - abs(stats.insertions - stats.deletions) / indels
+        indel_shape = (short + balance) / 2
+    else:
+        indel_shape = 0.0
+
+    ratio = stats.het_hom_ratio()
+    if ratio is None:
+        het_hom = 0.5 if stats.het else 0.0
+    elif ratio == 0:
+        het_hom = 0.0
+    else:
+        het_hom = math.exp(-abs(math.log(ratio / EXPECTED_HET_HOM_RATIO)))
+
+    return {
+        'volume': round(volume, 4),
+        'autosome_coverage': round(autosome_coverage, 4),
+        'indel_shape': round(indel_shape, 4),
+        'het_hom_ratio': round(het_hom, 4),
+    }
+
+def humanity_score(stats: ProfileStats) -> float:
+    """Deterministic humanity score: the weighted sum of the score components"""
+    components = score_components(stats)
+    return round(sum(SCORE_WEIGHTS[name] * value for name, value in components.items()), 4)
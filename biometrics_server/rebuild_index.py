@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Metadata Index Rebuild for HumanID Biometrics Server
+Restores verification and similarity metadata from the records on Golem DB,
+or reports drift between local metadata and chain state
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+from typing import Dict, Any, Optional
+
+from storage import create_blob_store, MetadataStore
+
+# Set up logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s | %(levelname)-8s | %(message)s',
+    datefmt='%H:%M:%S'
+)
+logger = logging.getLogger(__name__)
+
+# ========= ENV & GLOBALS =========
+CHECKPOINT_PATH = os.getenv("REBUILD_CHECKPOINT_PATH", "/tmp/biometrics_rebuild_checkpoint.json")
+DEFAULT_CONCURRENCY = 8
+DEFAULT_PAGE_SIZE = 100
+
+# Fields copied from a Golem record into local metadata, per record type
+RECORD_FIELDS = {
+    'humanity_verification': (
+        'verification_id', 'user_id', 'external_kyc_document_id', 'humanity_score',
+        'file_hash', 'timestamp', 'verification_type'
+    ),
+    'similarity_check': (
+        'check_id', 'user_id', 'stored_verification_id', 'similarity_result',
+        'probability_score', 'timestamp', 'check_type'
+    ),
+}
+
+def to_local_metadata(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Map a decoded Golem record to a local metadata record; None for foreign entities"""
+    fields = RECORD_FIELDS.get(record.get('record_type'))
+    if fields is None:
+        return None
+    metadata = {field: record.get(field) for field in fields}
+    metadata['golem_entity_key'] = record['entity_key']
+    return metadata
+
+def drift(local: Dict[str, Any], chain: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields whose local value differs from chain state"""
+    return {
+        field: {'local': local.get(field), 'chain': value}
+        for field, value in chain.items() if local.get(field) != value
+    }
+
+class Checkpoint:
+    """Entity keys already processed, persisted after every page
+
+    Keys whose fetch failed are never marked done, so the next run retries them.
+    """
+
+    def __init__(self, path: str, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self.done: set = set()
+
+    def load(self):
+        if self.enabled and os.path.exists(self.path):
+            with open(self.path) as f:
+                self.done = set(json.load(f).get('done', []))
+            logger.info(f"Resuming from checkpoint: {len(self.done)} entities already processed")
+
+    def save(self):
+        if not self.enabled:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'done': sorted(self.done)}, f)
+        os.replace(tmp_path, self.path)
+
+async def find_file_extension(metadata_store: MetadataStore, verification_id: str) -> Optional[str]:
+    """Recover the upload extension from the encrypted blob, if it survived"""
+    keys = await metadata_store.blob_store.list_keys(prefix=f"{verification_id}_encrypted.")
+    return keys[0].rsplit('.', 1)[1] if keys else None
+
+async def rebuild(check: bool, concurrency: int, page_size: int, checkpoint: Checkpoint) -> Dict[str, Any]:
+    import golem_endpoints as golem
+
+    metadata_store = MetadataStore(create_blob_store())
+    await metadata_store.load()
+    local = dict(metadata_store.records)
+
+    entity_keys = await golem.fetch_owner_entity_keys()
+    pending = [key for key in entity_keys if key not in checkpoint.done]
+    full_pass = len(pending) == len(entity_keys)
+    logger.info(f"Owner has {len(entity_keys)} entities, {len(pending)} to process")
+
+    report = {'chain_records': 0, 'restored': 0, 'repaired': 0, 'unchanged': 0,
+              'errors': 0, 'failed': [], 'missing_locally': [], 'mismatched': {}, 'missing_on_chain': []}
+    seen = set()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def process(entity_key: str) -> bool:
+        """Process one entity; False when it could not be fetched or stored"""
+        async with semaphore:
+            try:
+                record = await golem.fetch_verification_by_entity_key(entity_key)
+                if record is None:
+                    raise RuntimeError("entity could not be fetched")
+                await apply(record)
+                return True
+            except Exception as e:
+                logger.warning(f"Entity {entity_key} failed, it will be retried on the next run: {e}")
+                report['errors'] += 1
+                report['failed'].append(entity_key)
+                return False
+
+    async def apply(record: Dict[str, Any]):
+        if record.get('app') not in (None, golem.APP_TAG):
+            return
+        chain = to_local_metadata(record)
+        if chain is None:
+            return
+
+        record_id = MetadataStore.record_id(chain)
+        seen.add(record_id)
+        report['chain_records'] += 1
+        existing = local.get(record_id)
+        if existing is None:
+            report['missing_locally'].append(record_id)
+            if not check:
+                if chain.get('verification_id'):
+                    file_extension = await find_file_extension(metadata_store, record_id)
+                    if file_extension:
+                        chain['file_extension'] = file_extension
+                await metadata_store.put(chain)
+                report['restored'] += 1
+        elif drift(existing, chain):
+            report['mismatched'][record_id] = drift(existing, chain)
+            if not check:
+                await metadata_store.put({**existing, **chain})
+                report['repaired'] += 1
+        else:
+            report['unchanged'] += 1
+
+    for page_start in range(0, len(pending), page_size):
+        page = pending[page_start:page_start + page_size]
+        results = await asyncio.gather(*[process(key) for key in page])
+        if not check:
+            checkpoint.done.update(key for key, ok in zip(page, results) if ok)
+            checkpoint.save()
+        logger.info(f"Processed {min(page_start + page_size, len(pending))}/{len(pending)} entities")
+
+    # Only a full pass without failures can tell which local records have no chain counterpart
+    if full_pass and not report['failed']:
+        report['missing_on_chain'] = sorted(record_id for record_id in local if record_id not in seen)
+
+    await metadata_store.blob_store.close()
+    await asyncio.to_thread(golem.golem_manager.close)
+    return report
+
+def main():
+    """Main function with CLI interface"""
+    parser = argparse.ArgumentParser(
+        description="Rebuild the local metadata index from Golem DB",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Restore metadata after losing local storage (resumes if interrupted)
+  python rebuild_index.py
+
+  # Report drift between local metadata and Golem DB without writing
+  python rebuild_index.py --check
+
+  # Ignore the checkpoint and process every entity again
+  python rebuild_index.py --restart
+        """
+    )
+
+    parser.add_argument('--check', action='store_true',
+                       help='Only report drift; write nothing and ignore the checkpoint')
+    parser.add_argument('--restart', action='store_true',
+                       help='Discard the checkpoint and process every entity')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH,
+                       help=f'Checkpoint file (default: {CHECKPOINT_PATH})')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                       help=f'Entities fetched in parallel (default: {DEFAULT_CONCURRENCY})')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE,
+                       help=f'Entities per checkpointed page (default: {DEFAULT_PAGE_SIZE})')
+
+    args = parser.parse_args()
+
+    checkpoint = Checkpoint(args.checkpoint, enabled=not args.check)
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+    checkpoint.load()
+
+    try:
+        report = asyncio.run(rebuild(args.check, args.concurrency, args.page_size, checkpoint))
+    except KeyboardInterrupt:
+        logger.info("Interrupted; rerun to resume from the checkpoint")
+        sys.exit(1)
+    except Exception as e:
+        logger.error(f"Rebuild failed: {e}")
+        sys.exit(1)
+
+    print(json.dumps(report, indent=2))
+
+    if report['failed']:
+        logger.warning(f"{len(report['failed'])} entities could not be processed; rerun to retry them")
+        sys.exit(1)
+
+    if args.check and (report['missing_locally'] or report['mismatched'] or report['missing_on_chain']):
+        logger.warning("Drift detected between local metadata and Golem DB")
+        sys.exit(2)
+
+if __name__ == "__main__":
+    main()
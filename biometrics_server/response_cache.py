@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Response Cache for HumanID Biometrics Server
+Short-lived per-key cache of JSON responses with write invalidation,
+coalesced misses and ETags for conditional polling
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from typing import Dict, Any, Callable, Awaitable, Tuple
+
+from metrics import metrics
+from single_flight import SingleFlight
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# ========= ENV & GLOBALS =========
+VERIFICATION_CACHE_TTL = float(os.getenv("VERIFICATION_CACHE_TTL", "5"))
+VERIFICATION_CACHE_MAX_ENTRIES = int(os.getenv("VERIFICATION_CACHE_MAX_ENTRIES", "10000"))
+
+def compute_etag(content: Any) -> str:
+    """Strong ETag over the canonical JSON encoding of a response"""
+    body = json.dumps(content, sort_keys=True, default=str).encode("utf-8")
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+class _CacheEntry:
+    def __init__(self, content: Any, etag: str, expires: float):
+        self.content = content
+        self.etag = etag
+        self.expires = expires
+
+class ResponseCache:
+    """Per-key response cache with a TTL and explicit invalidation
+
+    Concurrent misses for one key share a single fetch. A fetch that was
+    overtaken by invalidate() still answers its callers but is not cached,
+    so a write is never hidden behind a response computed before it.
+    """
+
+    def __init__(self, name: str, ttl: float, max_entries: int):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: Dict[str, _CacheEntry] = {}
+        self._flight = SingleFlight(name)
+        self._generations: Dict[str, int] = {}
+
+    async def get_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """Return (content, etag) for key, fetching at most once per miss"""
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires > time.monotonic():
+            metrics.inc(f"{self.name}_cache.hits")
+            return entry.content, entry.etag
+
+        metrics.inc(f"{self.name}_cache.misses")
+        return await self._flight.do(key, lambda: self._fetch(key, fetch))
+
+    async def _fetch(self, key: str, fetch: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        generation = self._generations.get(key, 0)
+        content = await fetch()
+        etag = compute_etag(content)
+        if self._generations.get(key, 0) == generation:
+            self._entries[key] = _CacheEntry(content, etag, time.monotonic() + self.ttl)
+            if len(self._entries) > self.max_entries:
+                self._prune()
+        return content, etag
+
+    def _prune(self):
+        """Drop expired entries, then the soonest-expiring ones if still over the limit"""
+        now = time.monotonic()
+        self._entries = {key: entry for key, entry in self._entries.items() if entry.expires > now}
+        if len(self._entries) > self.max_entries:
+            keep = sorted(self._entries.items(), key=lambda item: item[1].expires)[-self.max_entries:]
+            self._entries = dict(keep)
+
+    def invalidate(self, key: str):
+        """Drop the cached response for key after a write"""
+        self._generations[key] = self._generations.get(key, 0) + 1
+        self._entries.pop(key, None)
+        # Later callers must not join a fetch that started before the write
+        self._flight.forget(key)
+
+# Cache of /verification-with-golem responses, keyed by user_id
+verification_cache = ResponseCache("verification", VERIFICATION_CACHE_TTL, VERIFICATION_CACHE_MAX_ENTRIES)
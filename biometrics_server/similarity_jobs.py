@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Asynchronous Similarity Jobs for HumanID Biometrics Server
+Runs similarity checks on a bounded worker pool and delivers results by
+polling, Server-Sent Events or a signed webhook
+"""
+
+import os
+import json
+import hmac
+import time
+import uuid
+import asyncio
+import socket
+import hashlib
+import logging
+import ipaddress
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable, Awaitable, AsyncIterator, Set
+from urllib.parse import urlsplit
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# ========= ENV & GLOBALS =========
+JOB_WORKERS = int(os.getenv("SIMILARITY_JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("SIMILARITY_JOB_QUEUE_SIZE", "100"))
+JOB_RETENTION_SECONDS = int(os.getenv("SIMILARITY_JOB_RETENTION_SECONDS", "3600"))
+WEBHOOK_SECRET = os.getenv("SIMILARITY_WEBHOOK_SECRET", "")
+WEBHOOK_TIMEOUT = float(os.getenv("SIMILARITY_WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("SIMILARITY_WEBHOOK_MAX_ATTEMPTS", "3"))
+# Webhooks are delivered outside the job workers, at most this many at a time
+WEBHOOK_CONCURRENCY = int(os.getenv("SIMILARITY_WEBHOOK_CONCURRENCY", "8"))
+# Comma-separated host names that may receive webhooks even when they resolve to
+# private addresses, e.g. an internal results service
+WEBHOOK_ALLOWED_HOSTS = {host.strip().lower() for host in
+                         os.getenv("SIMILARITY_WEBHOOK_ALLOWED_HOSTS", "").split(",") if host.strip()}
+SSE_HEARTBEAT_SECONDS = 15
+
+TERMINAL_STATES = {"completed", "failed"}
+
+class JobQueueFullError(Exception):
+    """Raised when the job queue cannot accept more work"""
+
+class JobFailedError(Exception):
+    """Raised by a job runner to report a failure with an HTTP status code"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class CallbackURLError(ValueError):
+    """A callback_url that results must not be sent to"""
+
+def _is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+def validate_callback_url(url: str, secret: str = None):
+    """Refuse webhooks that would go out unsigned or to internal addresses
+
+    The host is resolved and every address it resolves to must be public
+    (not private, loopback, link-local or reserved), unless the host is in
+    SIMILARITY_WEBHOOK_ALLOWED_HOSTS. This blocks callbacks to cloud
+    metadata endpoints, localhost and cluster services. Resolving blocks,
+    so async callers run it in a thread.
+    """
+    if not (secret if secret is not None else WEBHOOK_SECRET):
+        raise CallbackURLError("callback_url requires SIMILARITY_WEBHOOK_SECRET to be configured")
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise CallbackURLError("callback_url must be an http(s) URL")
+    host = parts.hostname.lower()
+    if host in WEBHOOK_ALLOWED_HOSTS:
+        return
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, ValueError) as e:
+        raise CallbackURLError(f"callback_url host cannot be resolved: {e}")
+    blocked = sorted(address for address in addresses if not _is_public_address(address))
+    if blocked:
+        raise CallbackURLError(f"callback_url resolves to a non-public address ({blocked[0]})")
+
+class SimilarityJob:
+    """A queued similarity check and its eventual result"""
+
+    def __init__(self, user_id: str, runner: Callable[[], Awaitable[Dict[str, Any]]],
+                 callback_url: Optional[str] = None):
+        self.job_id = str(uuid.uuid4())
+        self.user_id = user_id
+        self.callback_url = callback_url
+        self.status = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.created_at = datetime.now().isoformat()
+        self.updated_at = self.created_at
+        self.finished_monotonic: Optional[float] = None
+        self._runner = runner
+        self._changed = asyncio.Condition()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id,
+            'user_id': self.user_id,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'webhook': self.callback_url is not None
+        }
+
+    async def _set_status(self, status: str):
+        self.status = status
+        self.updated_at = datetime.now().isoformat()
+        if status in TERMINAL_STATES:
+            self.finished_monotonic = time.monotonic()
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def wait_for_change(self, last_status: str, timeout: float) -> bool:
+        """Wait until the status differs from last_status; False on timeout"""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self.status != last_status),
+                    timeout
+                )
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+def sign_payload(body: bytes, timestamp: str, secret: str = None) -> str:
+    """Compute the webhook signature over '<timestamp>.<body>'"""
+    key = (secret if secret is not None else WEBHOOK_SECRET).encode("utf-8")
+    message = timestamp.encode("utf-8") + b"." + body
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+class SimilarityJobQueue:
+    """Bounded queue of similarity jobs drained by a fixed pool of workers"""
+
+    def __init__(self, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.jobs: Dict[str, SimilarityJob] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker_tasks = []
+        self._running = 0
+        self._deliveries: Set[asyncio.Task] = set()
+        self._delivery_slots: Optional[asyncio.Semaphore] = None
+
+    def _ensure_started(self):
+        """Start the worker pool on first use, inside the running event loop"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._delivery_slots = asyncio.Semaphore(WEBHOOK_CONCURRENCY)
+            for index in range(self.workers):
+                task = asyncio.create_task(self._worker(index))
+                self._worker_tasks.append(task)
+            logger.info(f"🧵 Similarity job pool started with {self.workers} workers")
+
+    def _prune(self):
+        """Forget finished jobs older than the retention window"""
+        cutoff = time.monotonic() - JOB_RETENTION_SECONDS
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.finished_monotonic is not None and job.finished_monotonic < cutoff
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def submit(self, user_id: str, runner: Callable[[], Awaitable[Dict[str, Any]]],
+               callback_url: Optional[str] = None) -> SimilarityJob:
+        """Queue a job; raises JobQueueFullError when the queue is saturated"""
+        self._ensure_started()
+        self._prune()
+        job = SimilarityJob(user_id, runner, callback_url)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFullError(f"Similarity job queue is full ({self.queue_size} jobs)")
+        self.jobs[job.job_id] = job
+        logger.info(f"   📥 Queued similarity job {job.job_id} ({self._queue.qsize()} waiting)")
+        return job
+
+    def get(self, job_id: str) -> Optional[SimilarityJob]:
+        return self.jobs.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'workers': self.workers,
+            'running': self._running,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'queue_size': self.queue_size,
+            'webhooks_pending': len(self._deliveries)
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            self._running += 1
+            try:
+                await self._run(job)
+            finally:
+                self._running -= 1
+                self._queue.task_done()
+
+    async def _run(self, job: SimilarityJob):
+        await job._set_status("running")
+        try:
+            job.result = await job._runner()
+            await job._set_status("completed")
+            logger.info(f"   ✅ Similarity job {job.job_id} completed")
+        except JobFailedError as e:
+            job.error = {'status_code': e.status_code, 'detail': e.detail}
+            await job._set_status("failed")
+            logger.error(f"   ❌ Similarity job {job.job_id} failed: {e.detail}")
+        except Exception as e:
+            job.error = {'status_code': 500, 'detail': f"Internal server error: {str(e)}"}
+            await job._set_status("failed")
+            logger.error(f"   ❌ Similarity job {job.job_id} failed: {e}")
+
+        if job.callback_url:
+            # Retries against a slow callback must not hold a similarity worker
+            task = asyncio.create_task(self._deliver(job))
+            self._deliveries.add(task)
+            task.add_done_callback(self._deliveries.discard)
+
+    async def _deliver(self, job: SimilarityJob):
+        async with self._delivery_slots:
+            try:
+                await deliver_webhook(job)
+            except Exception as e:
+                logger.error(f"   ❌ Webhook for job {job.job_id} failed: {e}")
+
+    async def events(self, job: SimilarityJob) -> AsyncIterator[str]:
+        """Yield Server-Sent Events for each status change until the job finishes"""
+        last_status = None
+        while True:
+            if job.status != last_status:
+                last_status = job.status
+                yield f"event: status\ndata: {json.dumps(job.to_dict())}\n\n"
+                if last_status in TERMINAL_STATES:
+                    return
+            elif not await job.wait_for_change(last_status, SSE_HEARTBEAT_SECONDS):
+                yield ": keep-alive\n\n"
+
+async def deliver_webhook(job: SimilarityJob) -> bool:
+    """POST the job result to its callback URL, signed with HMAC-SHA256
+
+    The URL is checked again first, since its host may resolve differently
+    than when the job was submitted.
+    """
+    import httpx
+    
+    try:
+        await asyncio.to_thread(validate_callback_url, job.callback_url)
+    except CallbackURLError as e:
+        logger.error(f"   ❌ Not delivering webhook for job {job.job_id}: {e}")
+        return False
+    
+    body = json.dumps(job.to_dict()).encode("utf-8")
+    timestamp = str(int(time.time()))
+    headers = {
+        'Content-Type': 'application/json',
+        'X-HumanID-Job-Id': job.job_id,
+        'X-HumanID-Timestamp': timestamp,
+        'X-HumanID-Signature': f"sha256={sign_payload(body, timestamp)}"
+    }
+
+    async with httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT) as client:
+        for attempt in range(1, WEBHOOK_MAX_ATTEMPTS + 1):
+            try:
+                response = await client.post(job.callback_url, content=body, headers=headers)
+                if response.status_code < 300:
+                    logger.info(f"   📬 Webhook delivered for job {job.job_id}")
+                    return True
+                logger.warning(f"   ⚠️  Webhook for job {job.job_id} returned {response.status_code}")
+            except httpx.HTTPError as e:
+                logger.warning(f"   ⚠️  Webhook attempt {attempt} for job {job.job_id} failed: {e}")
+            if attempt < WEBHOOK_MAX_ATTEMPTS:
+                await asyncio.sleep(2 ** (attempt - 1))
+
+    logger.error(f"   ❌ Giving up on webhook for job {job.job_id}")
+    return False
+
+# Shared queue used by the FastAPI app
+similarity_job_queue = SimilarityJobQueue()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Request Coalescing for HumanID Biometrics Server
+Single-flight execution: concurrent calls with the same key share one
+in-flight computation and its result
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from metrics import metrics
+
+class _Call:
+    """One in-flight computation: the future its callers share and the leader's tag"""
+
+    def __init__(self, key: Hashable, future: asyncio.Future, tag: Any):
+        self.key = key
+        self.future = future
+        self.tag = tag
+
+class SingleFlight:
+    """Runs at most one computation per key at a time
+
+    The computation runs as its own task, so a caller that goes away does
+    not cancel it for the others. A call can also be claimed first and run
+    later, e.g. by a queued job: callers arriving in between join it and
+    see the leader's tag. Counters singleflight.<name>.leaders and
+    .coalesced are kept, plus the coalesce_rate gauge (coalesced / calls).
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._leaders = 0
+        self._coalesced = 0
+
+    def claim(self, key: Hashable, tag: Any = None) -> Tuple[_Call, bool]:
+        """The call for key and whether this caller leads it
+
+        A leader must finish the call with run() or fail(); the others
+        await join(). The returned call's tag is the leader's tag.
+        """
+        call = self._calls.get(key)
+        if call is not None:
+            self._record(coalesced=True)
+            return call, False
+
+        self._record(coalesced=False)
+        call = _Call(key, asyncio.get_running_loop().create_future(), tag)
+        self._calls[key] = call
+        call.future.add_done_callback(lambda _: self._done(call))
+        return call, True
+
+    async def run(self, call: _Call, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run a claimed call's computation as its own task and share the result"""
+        task = asyncio.ensure_future(fn())
+        task.add_done_callback(lambda _: self._settle(call, task))
+        return await asyncio.shield(call.future)
+
+    async def join(self, call: _Call) -> Any:
+        return await asyncio.shield(call.future)
+
+    def fail(self, call: _Call, error: BaseException):
+        """End a claimed call that will not run, failing anyone who joined it"""
+        if not call.future.done():
+            call.future.set_exception(error)
+        self._done(call)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]], tag: Any = None) -> Any:
+        """Return fn()'s result, joining the in-flight call for key when there is one"""
+        call, leader = self.claim(key, tag)
+        if leader:
+            return await self.run(call, fn)
+        return await self.join(call)
+
+    @staticmethod
+    def _settle(call: _Call, task: asyncio.Task):
+        if call.future.done():
+            return
+        if task.cancelled():
+            call.future.set_exception(RuntimeError("computation was cancelled"))
+        elif task.exception() is not None:
+            call.future.set_exception(task.exception())
+        else:
+            call.future.set_result(task.result())
+
+    def _done(self, call: _Call):
+        if self._calls.get(call.key) is call:
+            del self._calls[call.key]
+        # Mark the exception retrieved when every caller has gone away
+        call.future.exception()
+
+    def forget(self, key: Hashable):
+        """Let later callers start a fresh computation, e.g. after a write"""
+        self._calls.pop(key, None)
+
+    def _record(self, coalesced: bool):
+        if coalesced:
+            self._coalesced += 1
+            metrics.inc(f"singleflight.{self.name}.coalesced")
+        else:
+            self._leaders += 1
+            metrics.inc(f"singleflight.{self.name}.leaders")
+        metrics.set(f"singleflight.{self.name}.coalesce_rate",
+                    round(self._coalesced / (self._leaders + self._coalesced), 4))
+
+# Concurrent identical /similarity_check requests, keyed by user, upload hash,
+# stored verification and algorithm version
+similarity_flight = SingleFlight("similarity_check")
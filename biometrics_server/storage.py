@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+"""
+Storage Backends for HumanID Biometrics Server
+Non-blocking blob storage for encrypted profiles and metadata, on the local
+filesystem or on any S3-compatible object store (AWS S3, MinIO, ...)
+"""
+
+import os
+import json
+import time
+import heapq
+import bisect
+import itertools
+import uuid
+import hmac
+import asyncio
+import hashlib
+import logging
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+import aiofiles
+import aiofiles.os
+
+# Set up logger
+logger = logging.getLogger(__name__)
+
+# ========= ENV & GLOBALS =========
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", "/tmp/biometrics_encrypted")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL", "http://localhost:9000")
+S3_BUCKET = os.getenv("S3_BUCKET", "biometrics")
+S3_PREFIX = os.getenv("S3_PREFIX", "")
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID", "")
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY", "")
+S3_MAX_CONNECTIONS = int(os.getenv("S3_MAX_CONNECTIONS", "20"))
+S3_MULTIPART_THRESHOLD = int(os.getenv("S3_MULTIPART_THRESHOLD", str(8 * 1024 * 1024)))
+S3_PART_SIZE = max(int(os.getenv("S3_PART_SIZE", str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+S3_PART_CONCURRENCY = int(os.getenv("S3_PART_CONCURRENCY", "4"))
+
+METADATA_SUFFIX = "_metadata.json"
+METADATA_LOAD_CONCURRENCY = 16
+METADATA_REFRESH_INTERVAL = float(os.getenv("METADATA_REFRESH_INTERVAL", "5"))
+# A user still unknown after a refresh is not looked for again for this long
+METADATA_MISS_TTL = float(os.getenv("METADATA_MISS_TTL", "30"))
+METADATA_MAX_MISSES = 10000
+
+class BlobNotFoundError(Exception):
+    """Raised when a requested blob does not exist"""
+
+# ========= BLOB STORE INTERFACE =========
+class BlobStore:
+    """Async key/value blob storage"""
+
+    async def put(self, key: str, data: bytes) -> None:
+        raise NotImplementedError
+
+    async def get(self, key: str, byte_range: Optional[Tuple[int, Optional[int]]] = None) -> bytes:
+        """Read a blob, or the inclusive byte range (start, end) of it; end=None reads to EOF"""
+        raise NotImplementedError
+
+    async def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def list_keys(self, prefix: str = "", suffix: str = "") -> List[str]:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+# ========= LOCAL FILESYSTEM =========
+class LocalBlobStore(BlobStore):
+    """Blobs as files under a root directory, using async file I/O"""
+
+    def __init__(self, root: str = LOCAL_STORAGE_ROOT):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    async def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(tmp_path, 'wb') as f:
+            await f.write(data)
+        # Atomic rename so readers never see a partially written blob
+        await aiofiles.os.replace(tmp_path, path)
+
+    async def get(self, key: str, byte_range: Optional[Tuple[int, Optional[int]]] = None) -> bytes:
+        path = self._path(key)
+        try:
+            async with aiofiles.open(path, 'rb') as f:
+                if byte_range is None:
+                    return await f.read()
+                start, end = byte_range
+                await f.seek(start)
+                if end is None:
+                    return await f.read()
+                return await f.read(end - start + 1)
+        except FileNotFoundError:
+            raise BlobNotFoundError(key)
+
+    async def exists(self, key: str) -> bool:
+        return await aiofiles.os.path.exists(self._path(key))
+
+    async def delete(self, key: str) -> None:
+        try:
+            await aiofiles.os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    async def list_keys(self, prefix: str = "", suffix: str = "") -> List[str]:
+        names = await aiofiles.os.listdir(self.root)
+        return sorted(
+            name for name in names
+            if name.startswith(prefix) and name.endswith(suffix) and not name.endswith('.tmp')
+        )
+
+# ========= S3-COMPATIBLE OBJECT STORE =========
+def _sha256_hex(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def _canonical_query(query: Dict[str, str]) -> str:
+    return '&'.join(
+        f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+        for name, value in sorted(query.items())
+    )
+
+def _hmac_sha256(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+class S3BlobStore(BlobStore):
+    """Blobs as objects in an S3-compatible bucket, over a pooled HTTP client
+
+    Requests are signed with AWS Signature Version 4 and use path-style
+    addressing, which works with AWS S3 and local MinIO alike.
+    """
+
+    def __init__(self, endpoint_url: str = S3_ENDPOINT_URL, bucket: str = S3_BUCKET,
+                 access_key_id: str = S3_ACCESS_KEY_ID, secret_access_key: str = S3_SECRET_ACCESS_KEY,
+                 region: str = S3_REGION, prefix: str = S3_PREFIX,
+                 max_connections: int = S3_MAX_CONNECTIONS):
+        # Imported here so the local backend does not pay for httpx at startup
+        import httpx
+        
+        self.endpoint_url = endpoint_url.rstrip('/')
+        self.host = urlparse(self.endpoint_url).netloc
+        self.bucket = bucket
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.region = region
+        self.prefix = prefix
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0, connect=5.0),
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections)
+        )
+
+    def _object_path(self, key: str) -> str:
+        return f"/{self.bucket}/{quote(self.prefix + key, safe='/~')}"
+
+    def _sign(self, method: str, path: str, query: Dict[str, str], payload_hash: str,
+              extra_headers: Dict[str, str]) -> Dict[str, str]:
+        """Build the SigV4 Authorization header set for one request"""
+        now = datetime.now(timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        date_stamp = now.strftime('%Y%m%d')
+
+        headers = {
+            'host': self.host,
+            'x-amz-content-sha256': payload_hash,
+            'x-amz-date': amz_date,
+            **{name.lower(): value for name, value in extra_headers.items()}
+        }
+        signed_headers = ';'.join(sorted(headers))
+        canonical_headers = ''.join(f"{name}:{headers[name].strip()}\n" for name in sorted(headers))
+        canonical_query = _canonical_query(query)
+        canonical_request = '\n'.join([
+            method, path, canonical_query, canonical_headers, signed_headers, payload_hash
+        ])
+
+        scope = f"{date_stamp}/{self.region}/s3/aws4_request"
+        string_to_sign = '\n'.join([
+            'AWS4-HMAC-SHA256', amz_date, scope, _sha256_hex(canonical_request.encode('utf-8'))
+        ])
+        signing_key = _hmac_sha256(('AWS4' + self.secret_access_key).encode('utf-8'), date_stamp)
+        for part in (self.region, 's3', 'aws4_request'):
+            signing_key = _hmac_sha256(signing_key, part)
+        signature = hmac.new(signing_key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+
+        headers['authorization'] = (
+            f"AWS4-HMAC-SHA256 Credential={self.access_key_id}/{scope}, "
+            f"SignedHeaders={signed_headers}, Signature={signature}"
+        )
+        del headers['host']
+        return headers
+
+    async def _request(self, method: str, path: str, query: Optional[Dict[str, str]] = None,
+                       body: bytes = b"", headers: Optional[Dict[str, str]] = None) -> "httpx.Response":
+        query = query or {}
+        signed = self._sign(method, path, query, _sha256_hex(body), headers or {})
+        # Send the exact query string that was signed
+        url = self.endpoint_url + path + (f"?{_canonical_query(query)}" if query else "")
+        return await self.client.request(method, url, content=body if body else None, headers=signed)
+
+    @staticmethod
+    def _raise_for_status(response: "httpx.Response", key: str):
+        if response.status_code == 404:
+            raise BlobNotFoundError(key)
+        if response.status_code >= 300:
+            raise RuntimeError(f"S3 request for {key} failed with {response.status_code}: {response.text[:200]}")
+
+    async def put(self, key: str, data: bytes) -> None:
+        if len(data) > S3_MULTIPART_THRESHOLD:
+            await self._put_multipart(key, data)
+            return
+        response = await self._request('PUT', self._object_path(key), body=data)
+        self._raise_for_status(response, key)
+
+    async def _put_multipart(self, key: str, data: bytes) -> None:
+        """Upload in parts concurrently, aborting the upload on any failure"""
+        path = self._object_path(key)
+        response = await self._request('POST', path, query={'uploads': ''})
+        self._raise_for_status(response, key)
+        upload_id = _xml_find_text(response.content, 'UploadId')
+
+        semaphore = asyncio.Semaphore(S3_PART_CONCURRENCY)
+
+        async def upload_part(part_number: int, chunk: bytes) -> Tuple[int, str]:
+            async with semaphore:
+                part_response = await self._request(
+                    'PUT', path, query={'partNumber': str(part_number), 'uploadId': upload_id}, body=chunk
+                )
+                self._raise_for_status(part_response, key)
+                return part_number, part_response.headers['etag']
+
+        try:
+            parts = await asyncio.gather(*[
+                upload_part(index + 1, data[offset:offset + S3_PART_SIZE])
+                for index, offset in enumerate(range(0, len(data), S3_PART_SIZE))
+            ])
+            manifest = ''.join(
+                f"<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>"
+                for number, etag in sorted(parts)
+            )
+            body = f"<CompleteMultipartUpload>{manifest}</CompleteMultipartUpload>".encode('utf-8')
+            response = await self._request('POST', path, query={'uploadId': upload_id}, body=body)
+            self._raise_for_status(response, key)
+            # S3 may report a failed completion with a 200 and an <Error> body
+            if b'<Error>' in response.content:
+                raise RuntimeError(f"S3 multipart completion for {key} failed: {response.text[:200]}")
+        except Exception:
+            await self._request('DELETE', path, query={'uploadId': upload_id})
+            raise
+
+    async def get(self, key: str, byte_range: Optional[Tuple[int, Optional[int]]] = None) -> bytes:
+        headers = {}
+        if byte_range is not None:
+            start, end = byte_range
+            headers['range'] = f"bytes={start}-{'' if end is None else end}"
+        response = await self._request('GET', self._object_path(key), headers=headers)
+        self._raise_for_status(response, key)
+        return response.content
+
+    async def exists(self, key: str) -> bool:
+        response = await self._request('HEAD', self._object_path(key))
+        if response.status_code == 404:
+            return False
+        self._raise_for_status(response, key)
+        return True
+
+    async def delete(self, key: str) -> None:
+        response = await self._request('DELETE', self._object_path(key))
+        if response.status_code != 404:
+            self._raise_for_status(response, key)
+
+    async def list_keys(self, prefix: str = "", suffix: str = "") -> List[str]:
+        keys = []
+        query = {'list-type': '2', 'prefix': self.prefix + prefix}
+        while True:
+            response = await self._request('GET', f"/{self.bucket}", query=query)
+            self._raise_for_status(response, self.bucket)
+            root = ET.fromstring(response.content)
+            for element in root.iter():
+                if element.tag.endswith('}Key') or element.tag == 'Key':
+                    key = element.text[len(self.prefix):]
+                    if key.endswith(suffix):
+                        keys.append(key)
+            token = _xml_find_text(response.content, 'NextContinuationToken', required=False)
+            if not token:
+                return sorted(keys)
+            query = {**query, 'continuation-token': token}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+def _xml_find_text(content: bytes, tag: str, required: bool = True) -> Optional[str]:
+    """Find the text of the first element with the given local name"""
+    for element in ET.fromstring(content).iter():
+        if element.tag == tag or element.tag.endswith('}' + tag):
+            return element.text
+    if required:
+        raise RuntimeError(f"S3 response is missing <{tag}>")
+    return None
+
+# ========= METADATA STORE =========
+RECORD_KINDS = ("verification", "similarity_check")
+
+def record_kind(metadata: Dict[str, Any]) -> str:
+    return "similarity_check" if metadata.get('check_type') == 'similarity_check' else "verification"
+
+def _newest_first(timeline: List[Tuple[str, str]], low: int, high: int):
+    for index in range(high - 1, low - 1, -1):
+        yield timeline[index]
+
+class MetadataStore:
+    """JSON metadata records in a blob store, indexed in memory by user_id
+
+    Records are stored as '<record_id>_metadata.json'. The index is loaded
+    once and kept current on writes. A lookup triggers an incremental
+    refresh, at most every METADATA_REFRESH_INTERVAL, that lists the store
+    and reads only records it has not seen, picking up writes from other
+    hosts for known and new users alike; users still unknown afterwards are
+    remembered for METADATA_MISS_TTL, so lookups for nonexistent users stay
+    cheap.
+    Each user has one timeline per record kind, sorted by (timestamp,
+    record_id), so history pages are bisected rather than scanned, and the
+    newest similarity check per verification is kept for O(1) joins.
+    Checks are also indexed by (file_hash, verification_id,
+    algorithm_version) so repeated comparisons can be answered from disk.
+    """
+
+    def __init__(self, blob_store: BlobStore):
+        self.blob_store = blob_store
+        self.records: Dict[str, Dict[str, Any]] = {}
+        self.timelines: Dict[str, Dict[str, List[Tuple[str, str]]]] = {}
+        self.latest_checks: Dict[str, Dict[str, Any]] = {}
+        self.checks_by_input: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self.loaded = False
+        self._keys: set = set()
+        self._misses: Dict[str, float] = {}
+        self._last_load = 0.0
+        self._load_lock: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    def record_id(metadata: Dict[str, Any]) -> str:
+        return metadata.get('verification_id') or metadata.get('check_id')
+
+    @classmethod
+    def sort_key(cls, metadata: Dict[str, Any]) -> Tuple[str, str]:
+        return (metadata.get('timestamp') or '', cls.record_id(metadata))
+
+    def _index(self, metadata: Dict[str, Any]):
+        record_id = self.record_id(metadata)
+        if record_id is None:
+            return
+        timeline = self.timelines.setdefault(metadata.get('user_id'), {}).setdefault(record_kind(metadata), [])
+        previous = self.records.get(record_id)
+        if previous is not None:
+            old_key = self.sort_key(previous)
+            old_timeline = self.timelines[previous.get('user_id')][record_kind(previous)]
+            position = bisect.bisect_left(old_timeline, old_key)
+            if position < len(old_timeline) and old_timeline[position] == old_key:
+                del old_timeline[position]
+        bisect.insort(timeline, self.sort_key(metadata))
+        self.records[record_id] = metadata
+
+        if record_kind(metadata) == "similarity_check":
+            verification_id = metadata.get('stored_verification_id')
+            current = self.latest_checks.get(verification_id)
+            if (current is None or self.record_id(current) == record_id or
+                    self.sort_key(metadata) >= self.sort_key(current)):
+                self.latest_checks[verification_id] = metadata
+            if metadata.get('file_hash') and metadata.get('algorithm_version'):
+                input_key = (metadata['file_hash'], verification_id, metadata['algorithm_version'])
+                self.checks_by_input[input_key] = metadata
+
+    async def _read_all(self, keys: List[str]) -> List[Optional[Dict[str, Any]]]:
+        semaphore = asyncio.Semaphore(METADATA_LOAD_CONCURRENCY)
+
+        async def read(key: str) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                try:
+                    return json.loads(await self.blob_store.get(key))
+                except Exception as e:
+                    logger.warning(f"   ⚠️  Error reading metadata {key}: {e}")
+                    return None
+
+        return await asyncio.gather(*[read(key) for key in keys])
+
+    def _lock(self) -> asyncio.Lock:
+        if self._load_lock is None:
+            self._load_lock = asyncio.Lock()
+        return self._load_lock
+
+    async def load(self):
+        """(Re)build the index from every metadata record in the store"""
+        async with self._lock():
+            keys = await self.blob_store.list_keys(suffix=METADATA_SUFFIX)
+            records = await self._read_all(keys)
+            # Build into a fresh store so readers keep a consistent index meanwhile
+            fresh = MetadataStore(self.blob_store)
+            for metadata in records:
+                if metadata:
+                    fresh._index(metadata)
+            self.records, self.timelines = fresh.records, fresh.timelines
+            self.latest_checks, self.checks_by_input = fresh.latest_checks, fresh.checks_by_input
+            self._keys = set(keys)
+            self._misses.clear()
+            self.loaded = True
+            self._last_load = time.monotonic()
+            logger.info(f"📚 Metadata index loaded: {len(keys)} records for {len(self.timelines)} users")
+
+    async def refresh(self):
+        """Index records written by other hosts since the last load; known records are not re-read"""
+        async with self._lock():
+            keys = await self.blob_store.list_keys(suffix=METADATA_SUFFIX)
+            new_keys = [key for key in keys if key not in self._keys]
+            for metadata in await self._read_all(new_keys):
+                if metadata:
+                    self._index(metadata)
+            self._keys.update(new_keys)
+            self._last_load = time.monotonic()
+            if new_keys:
+                logger.info(f"📚 Metadata index refreshed: {len(new_keys)} new records")
+
+    async def put(self, metadata: Dict[str, Any]):
+        key = f"{self.record_id(metadata)}{METADATA_SUFFIX}"
+        await self.blob_store.put(key, json.dumps(metadata, indent=2).encode('utf-8'))
+        self._index(metadata)
+        self._keys.add(key)
+        self._misses.pop(metadata.get('user_id'), None)
+
+    async def _refresh_for(self, user_id: str):
+        if not self.loaded:
+            await self.load()
+            return
+        now = time.monotonic()
+        if now - self._last_load <= METADATA_REFRESH_INTERVAL:
+            return
+        missed = self._misses.get(user_id)
+        if missed is not None and now - missed < METADATA_MISS_TTL:
+            return
+        await self.refresh()
+        if user_id not in self.timelines:
+            if len(self._misses) >= METADATA_MAX_MISSES:
+                self._misses.clear()
+            self._misses[user_id] = time.monotonic()
+
+    async def history(self, user_id: str, kinds: Tuple[str, ...] = RECORD_KINDS,
+                      since: Optional[str] = None, until: Optional[str] = None,
+                      before: Optional[Tuple[str, str]] = None,
+                      limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """A user's records newest first, optionally filtered and paged
+
+        since is inclusive and until exclusive (ISO timestamps); before is
+        the sort key of the last record of the previous page.
+        """
+        await self._refresh_for(user_id)
+        timelines = self.timelines.get(user_id, {})
+        streams = []
+        for kind in kinds:
+            timeline = timelines.get(kind, [])
+            low = bisect.bisect_left(timeline, (since,)) if since else 0
+            high = bisect.bisect_left(timeline, (until,)) if until else len(timeline)
+            if before is not None:
+                high = min(high, bisect.bisect_left(timeline, before))
+            streams.append(_newest_first(timeline, low, high))
+        newest_first = heapq.merge(*streams, reverse=True)
+        return [self.records[record_id] for _, record_id in itertools.islice(newest_first, limit)]
+
+    async def for_user(self, user_id: str) -> List[Dict[str, Any]]:
+        """All metadata records for a user, newest first"""
+        return await self.history(user_id)
+
+    def latest_check_for(self, verification_id: str) -> Optional[Dict[str, Any]]:
+        """The newest similarity check against a verification, if any"""
+        return self.latest_checks.get(verification_id)
+
+    def find_similarity_check(self, file_hash: str, verification_id: str,
+                              algorithm_version: str) -> Optional[Dict[str, Any]]:
+        """A stored check of the same upload against the same verification, if any"""
+        return self.checks_by_input.get((file_hash, verification_id, algorithm_version))
+
+    async def find_verification(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """The user's most recent humanity verification, if any"""
+        for metadata in await self.history(user_id, kinds=("verification",)):
+            if metadata.get('verification_type') == 'first_humanity_verification':
+                return metadata
+        return None
+
+def create_blob_store() -> BlobStore:
+    """Create the blob store selected by STORAGE_BACKEND"""
+    if STORAGE_BACKEND == "s3":
+        logger.info(f"🪣 Using S3 storage: {S3_ENDPOINT_URL}/{S3_BUCKET}/{S3_PREFIX}")
+        return S3BlobStore()
+    if STORAGE_BACKEND != "local":
+        raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    logger.info(f"📁 Using local storage: {LOCAL_STORAGE_ROOT}")
+    return LocalBlobStore()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+STR Profile Parser for HumanID Biometrics Server
+Incremental parser and validator for CHROM<TAB>POS<TAB>REF<TAB>ALT profiles
+whose parsed form is shared by scoring, comparison and the similarity script
+"""
+
+import re
+from typing import Callable, Iterable, List, Optional
+
+# Longest accepted line; anything longer is not an STR profile
+MAX_LINE_LENGTH = 4096
+# Header naming the locus panel a profile was restricted to, e.g. "# Panel: str_v2@3f9c0a1b2c4d"
+PANEL_HEADER = "# Panel:"
+# Largest accepted POS; the kinship engine packs positions into 32 bits
+MAX_POSITION = (1 << 32) - 1
+
+_CHROM = re.compile(rb'[\x21-\x7e]+')
+_REF = re.compile(rb'[ACGTNacgtn]+')
+_ALT = re.compile(rb'[ACGTNacgtn]+|\*|\.|<[\x21-\x3d\x3f-\x7e]+>')
+
+class ProfileFormatError(ValueError):
+    """An upload is not a valid STR profile"""
+
+    def __init__(self, line_number: int, reason: str):
+        self.line_number = line_number
+        self.reason = reason
+        super().__init__(f"line {line_number}: {reason}" if line_number else reason)
+
+class ParsedProfile:
+    """A validated profile: header lines, data lines in file order and their sort state
+
+    Data lines keep their original bytes (without line endings) so that
+    every consumer sees exactly what was uploaded.
+    """
+
+    def __init__(self, header: List[str], lines: List[bytes], is_sorted: bool,
+                 total_bytes: int, skipped_lines: int = 0):
+        self.header = header
+        self.lines = lines
+        self.is_sorted = is_sorted
+        self.total_bytes = total_bytes
+        self.skipped_lines = skipped_lines
+        self._canonical: Optional[bytes] = None
+
+    def canonical(self) -> bytes:
+        """Header-free data lines in byte order, the input similarity_check.sh expects"""
+        if self._canonical is None:
+            lines = self.lines if self.is_sorted else sorted(self.lines)
+            self._canonical = b'\n'.join(lines) + b'\n' if lines else b''
+        return self._canonical
+
+    @property
+    def panel(self) -> Optional[str]:
+        """The profile's locus panel version; None for whole-genome profiles"""
+        for line in self.header:
+            if line.startswith(PANEL_HEADER):
+                value = line[len(PANEL_HEADER):].strip()
+                return value if value and value != 'none' else None
+        return None
+
+    def summary(self):
+        return {
+            'loci': len(self.lines),
+            'panel': self.panel,
+            'header_lines': len(self.header),
+            'is_sorted': self.is_sorted,
+            'total_bytes': self.total_bytes,
+            'skipped_lines': self.skipped_lines
+        }
+
+class ProfileParser:
+    """Validates a profile chunk by chunk and fails on the first malformed line
+
+    Each valid record is also handed, already split into fields, to every
+    sink, so per-record statistics are collected in the same pass. With
+    strict=False malformed lines are counted and skipped instead, which is
+    how profiles stored before validation existed are read.
+    """
+
+    def __init__(self, sinks: Iterable[Callable[[List[bytes]], None]] = (), strict: bool = True):
+        self.sinks = list(sinks)
+        self.strict = strict
+        self.header: List[str] = []
+        self.lines: List[bytes] = []
+        self.is_sorted = True
+        self.total_bytes = 0
+        self.skipped_lines = 0
+        self._line_number = 0
+        self._previous: Optional[bytes] = None
+        self._tail = b''
+
+    def feed(self, chunk: bytes):
+        self.total_bytes += len(chunk)
+        lines = (self._tail + chunk).split(b'\n')
+        self._tail = lines.pop()
+        if len(self._tail) > MAX_LINE_LENGTH:
+            self._reject(self._line_number + len(lines) + 1, f"line longer than {MAX_LINE_LENGTH} bytes")
+            self._tail = b''
+        for line in lines:
+            self._line(line)
+
+    def finish(self) -> ParsedProfile:
+        if self._tail:
+            self._line(self._tail)
+            self._tail = b''
+        if not self.lines and self.strict:
+            raise ProfileFormatError(0, "no CHROM<TAB>POS<TAB>REF<TAB>ALT lines found")
+        return ParsedProfile(self.header, self.lines, self.is_sorted, self.total_bytes, self.skipped_lines)
+
+    def _reject(self, line_number: int, reason: str):
+        if self.strict:
+            raise ProfileFormatError(line_number, reason)
+        self.skipped_lines += 1
+
+    def _line(self, line: bytes):
+        self._line_number += 1
+        if line.endswith(b'\r'):
+            line = line[:-1]
+        if not line:
+            return
+        if line[0] == 0x23:  # '#'
+            self.header.append(line.decode('utf-8', 'replace'))
+            return
+
+        fields = line.split(b'\t')
+        if len(fields) < 4:
+            return self._reject(self._line_number, "expected CHROM<TAB>POS<TAB>REF<TAB>ALT")
+        chrom, pos, ref, alt = fields[:4]
+        if not _CHROM.fullmatch(chrom):
+            return self._reject(self._line_number, "invalid CHROM")
+        if not pos.isdigit() or int(pos) == 0:
+            return self._reject(self._line_number, "POS must be a positive integer")
+        if int(pos) > MAX_POSITION:
+            return self._reject(self._line_number, f"POS must be at most {MAX_POSITION}")
+        if not _REF.fullmatch(ref):
+            return self._reject(self._line_number, "REF must be nucleotides")
+        for allele in alt.split(b','):
+            if not _ALT.fullmatch(allele):
+                return self._reject(self._line_number, "ALT must be comma-separated alleles")
+
+        if self._previous is not None and line < self._previous:
+            self.is_sorted = False
+        self._previous = line
+        self.lines.append(line)
+        for sink in self.sinks:
+            sink(fields)
+
+def parse_profile_bytes(data: bytes, strict: bool = True) -> ParsedProfile:
+    """Parse a whole profile that is already in memory"""
+    parser = ProfileParser(strict=strict)
+    parser.feed(data)
+    return parser.finish()
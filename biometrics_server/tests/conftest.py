@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The server modules import each other by their flat names, as they do in the container
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
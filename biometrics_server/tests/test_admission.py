@@ -0,0 +1,106 @@
+"""Tests for admission control, through the FastAPI middleware"""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+import admission
+import main_fastapi
+from admission import AdmissionController, AdmissionRejected, EndpointLimit, request_bytes
+
+def controller(concurrency=1, max_waiting=0, wait_timeout=0.05, retry_after=7, max_inflight_bytes=1000):
+    limit = EndpointLimit('similarity_check', concurrency, max_waiting, wait_timeout, retry_after)
+    return AdmissionController({'/similarity_check': limit}, max_inflight_bytes)
+
+@pytest.fixture
+def client(monkeypatch):
+    # The app's warm-up is not run, so readiness is set by hand
+    monkeypatch.setitem(main_fastapi.warmup_state, 'ready', True)
+    return TestClient(main_fastapi.app)
+
+def use(monkeypatch, test_controller):
+    monkeypatch.setattr(main_fastapi, "admission_controller", test_controller)
+    return test_controller.limits['/similarity_check']
+
+def test_full_queue_is_rejected_with_429(client, monkeypatch):
+    limit = use(monkeypatch, controller(max_waiting=0))
+    limit.active = 1  # the one slot is held by an in-flight request
+
+    response = client.post("/similarity_check")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "7"
+    assert "Too many concurrent similarity_check requests" in response.json()["detail"]
+    assert limit.rejected == 1
+    assert limit.waiting == 0
+    assert limit.active == 1
+
+def test_wait_timeout_is_rejected_with_503(client, monkeypatch):
+    limit = use(monkeypatch, controller(max_waiting=4, wait_timeout=0.05))
+    limit.active = 1
+
+    response = client.post("/similarity_check")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+    assert "not admitted in time" in response.json()["detail"]
+    assert limit.rejected == 1
+    assert limit.waiting == 0
+
+def test_bytes_budget_is_shared(client, monkeypatch):
+    test_controller = controller(concurrency=4, wait_timeout=0.05, max_inflight_bytes=1000)
+    limit = use(monkeypatch, test_controller)
+    test_controller.inflight_bytes = 900
+
+    response = client.post("/similarity_check", content=b"x" * 200)
+    assert response.status_code == 429
+    assert limit.active == 0
+
+def test_admitted_request_releases_its_slot(client, monkeypatch):
+    test_controller = controller()
+    limit = use(monkeypatch, test_controller)
+
+    response = client.post("/similarity_check")
+    assert response.status_code not in (429, 503)
+    assert limit.active == 0
+    assert test_controller.inflight_bytes == 0
+
+def test_unlimited_paths_are_not_admitted(client, monkeypatch):
+    limit = use(monkeypatch, controller())
+    limit.active = 1
+
+    assert client.get("/metrics").status_code == 200
+
+def test_health_stays_up_while_ready_reports_saturation(client, monkeypatch):
+    limit = use(monkeypatch, controller(concurrency=1, max_waiting=0))
+    assert client.get("/ready").status_code == 200
+
+    limit.active = 1
+    health = client.get("/health")
+    assert health.status_code == 200
+    assert health.json()["saturation"]["saturated"] is True
+
+    ready = client.get("/ready")
+    assert ready.status_code == 503
+    assert ready.json()["status"] == "saturated"
+
+def test_waiting_request_is_admitted_when_a_slot_frees():
+    async def scenario():
+        test_controller = controller(max_waiting=1, wait_timeout=1.0)
+        limit = test_controller.limits['/similarity_check']
+        held = await test_controller.acquire(limit, 10)
+        waiter = asyncio.create_task(test_controller.acquire(limit, 10))
+        await asyncio.sleep(0)
+        assert limit.waiting == 1
+        with pytest.raises(AdmissionRejected) as rejected:
+            await test_controller.acquire(limit, 10)
+        assert rejected.value.status_code == 429
+        await test_controller.release(limit, held)
+        assert await waiter == 10
+        assert (limit.active, limit.waiting, test_controller.inflight_bytes) == (1, 0, 10)
+
+    asyncio.run(scenario())
+
+def test_request_bytes_from_headers():
+    assert request_bytes({'content-length': '1234'}) == 1234
+    assert request_bytes({'transfer-encoding': 'chunked'}) == admission.UNKNOWN_LENGTH_BYTES
+    assert request_bytes({}) == 0
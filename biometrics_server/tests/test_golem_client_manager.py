@@ -0,0 +1,72 @@
+"""Golem client pool: connection failures surface as errors instead of hanging callers"""
+
+import asyncio
+
+import pytest
+
+import golem_client_manager
+from golem_client_manager import GolemClientManager, GolemConfigurationError, GolemUnavailableError
+
+@pytest.fixture
+def make_manager():
+    managers = []
+
+    def make(connect, pool_size=2):
+        manager = GolemClientManager(connect, pool_size=pool_size)
+        managers.append(manager)
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.close(timeout=2)
+
+def test_configuration_error_is_not_retried(make_manager):
+    attempts = []
+
+    async def connect():
+        attempts.append(1)
+        raise GolemConfigurationError("PRIVATE_KEY environment variable is required")
+
+    manager = make_manager(connect)
+    with pytest.raises(GolemConfigurationError):
+        manager.run_sync(manager.acquire(), timeout=5)
+    assert len(attempts) == 2  # once per pool slot
+
+def test_acquire_gives_up_while_golem_is_down(make_manager, monkeypatch):
+    monkeypatch.setattr(golem_client_manager, "RECONNECT_BASE_DELAY", 0.01)
+    monkeypatch.setattr(golem_client_manager, "RECONNECT_MAX_DELAY", 0.05)
+
+    async def connect():
+        raise ConnectionError("connection refused")
+
+    manager = make_manager(connect)
+    with pytest.raises(GolemUnavailableError):
+        manager.run_sync(manager.acquire(timeout=0.3), timeout=5)
+    assert all(failures > 1 for failures in manager.status()['failures'])
+
+def test_run_async_deadline(make_manager):
+    async def connect():
+        return object()
+
+    manager = make_manager(connect)
+    cancelled = []
+
+    async def stuck():
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    with pytest.raises(GolemUnavailableError):
+        asyncio.run(manager.run_async(stuck(), timeout=0.2))
+    manager.run_sync(asyncio.sleep(0.05), timeout=5)
+    assert cancelled
+
+def test_writer_fails_queued_writes_when_no_client_connects(make_manager):
+    async def connect():
+        raise GolemConfigurationError("PRIVATE_KEY environment variable is required")
+
+    manager = make_manager(connect)
+    with pytest.raises(GolemConfigurationError):
+        asyncio.run(manager.run_async(manager.create_entities(["create"]), timeout=5))
@@ -0,0 +1,123 @@
+"""Tests for the compact Golem DB payload encoding"""
+
+import os
+import json
+import zlib
+from types import SimpleNamespace
+
+import msgpack
+import pytest
+
+pytest.importorskip("golem_base_sdk")
+
+import golem_endpoints
+from golem_base_sdk import Annotation
+from golem_endpoints import (encode_payload, decode_payload, PAYLOAD_MAGIC, PAYLOAD_VERSION,
+                             FLAG_ZLIB, COMPRESS_THRESHOLD)
+
+OWNER = "0x00000000000000000000000000000000000000aa"
+
+def verification_record(**extra):
+    record = {
+        "schema": "humanity_verification_v1",
+        "verification_id": "v-1",
+        "user_id": "user-1",
+        "external_kyc_document_id": "kyc-1",
+        "humanity_score": 0.8125,
+        "file_hash": "ab" * 32,
+        "timestamp": "2025-01-02T03:04:05",
+        "verification_type": "first_humanity_verification",
+        "written_by": OWNER,
+        "app": golem_endpoints.APP_TAG,
+        "record_type": "humanity_verification",
+    }
+    record.update(extra)
+    return record
+
+def verification_annotations(record):
+    # The string annotations store_humanity_verification writes, as read back
+    annotations = {key: record[key] for key in (
+        "app", "schema", "user_id", "verification_id", "external_kyc_document_id",
+        "verification_type", "timestamp", "file_hash")}
+    annotations["recordType"] = record["record_type"]
+    annotations["humanity_score"] = str(record["humanity_score"])
+    annotations["timestamp_unix"] = golem_endpoints.timestamp_to_unix(record["timestamp"])
+    annotations["humanity_score_bp"] = golem_endpoints.score_to_basis_points(record["humanity_score"])
+    return annotations
+
+def test_round_trip_rebuilds_derived_fields_from_annotations():
+    record = verification_record()
+    payload = encode_payload(record)
+    assert payload[:len(PAYLOAD_MAGIC)] == PAYLOAD_MAGIC
+    assert payload[len(PAYLOAD_MAGIC)] == PAYLOAD_VERSION
+    # Every field of this record is carried by annotations or entity metadata
+    assert msgpack.unpackb(payload[len(PAYLOAD_MAGIC) + 2:]) == {}
+
+    decoded = decode_payload(payload, verification_annotations(record), OWNER)
+    assert decoded == record
+    assert isinstance(decoded["humanity_score"], float)
+
+def test_round_trip_keeps_fields_without_annotations():
+    record = verification_record(details={"loci": 1200, "flags": [1, 2]}, raw=b"\x00\x01")
+    payload = encode_payload(record)
+    assert payload[len(PAYLOAD_MAGIC) + 1] == 0
+    assert decode_payload(payload, verification_annotations(record), OWNER) == record
+
+def test_similarity_check_round_trip():
+    record = {
+        "schema": "similarity_check_v1",
+        "check_id": "c-1",
+        "user_id": "user-2",
+        "stored_verification_id": "v-1",
+        "similarity_result": "same_person",
+        "probability_score": 0.97,
+        "timestamp": "2025-01-02T03:04:05",
+        "check_type": "similarity_check",
+        "written_by": OWNER,
+        "app": golem_endpoints.APP_TAG,
+        "record_type": "similarity_check",
+    }
+    annotations = {key: record[key] for key in (
+        "app", "schema", "user_id", "check_id", "stored_verification_id",
+        "check_type", "timestamp", "similarity_result")}
+    annotations["recordType"] = "similarity_check"
+    annotations["probability_score"] = "0.97"
+    assert decode_payload(encode_payload(record), annotations, OWNER) == record
+
+def test_large_payload_is_compressed():
+    record = verification_record(notes="repeat " * 200)
+    payload = encode_payload(record)
+    assert payload[len(PAYLOAD_MAGIC) + 1] == FLAG_ZLIB
+    body = zlib.decompress(payload[len(PAYLOAD_MAGIC) + 2:])
+    assert len(body) >= COMPRESS_THRESHOLD
+    assert len(payload) < len(body)
+    assert decode_payload(payload, verification_annotations(record), OWNER) == record
+
+def test_incompressible_payload_is_stored_raw():
+    record = verification_record(noise=os.urandom(512))
+    payload = encode_payload(record)
+    assert payload[len(PAYLOAD_MAGIC) + 1] == 0
+    assert decode_payload(payload, verification_annotations(record), OWNER) == record
+
+def test_legacy_json_payload_is_read_as_is():
+    record = verification_record()
+    payload = json.dumps(record).encode('utf-8')
+    assert decode_payload(payload, verification_annotations(record), "someone-else") == record
+
+def test_unsupported_version_is_rejected():
+    payload = PAYLOAD_MAGIC + bytes([PAYLOAD_VERSION + 1, 0]) + msgpack.packb({})
+    with pytest.raises(ValueError, match="Unsupported payload version"):
+        decode_payload(payload, {}, OWNER)
+
+def test_merge_entity_decodes_entity_metadata():
+    record = verification_record()
+    annotations = verification_annotations(record)
+    metadata = SimpleNamespace(
+        owner=OWNER,
+        string_annotations=[Annotation(key=k, value=v) for k, v in annotations.items() if isinstance(v, str)],
+        numeric_annotations=[Annotation(key=k, value=v) for k, v in annotations.items() if isinstance(v, int)],
+    )
+    merged = golem_endpoints._merge_entity("0xkey", encode_payload(record), metadata)
+    assert merged.pop("entity_key") == "0xkey"
+    assert merged.pop("annotations") == annotations
+    assert merged == record
@@ -0,0 +1,149 @@
+"""Tests for the NumPy kinship scoring engine"""
+
+import numpy as np
+import pytest
+
+import kinship
+from kinship import (LocusWeights, parse_lines, compare_profiles, calibrate, classify,
+                     ALLELE_BITS, POSITION_BITS, MAX_POSITION, MIN_FREQUENCY)
+
+@pytest.fixture(autouse=True)
+def uniform_default_weights(monkeypatch):
+    monkeypatch.setattr(kinship, "WEIGHTS_FILE", "")
+    monkeypatch.setattr(kinship, "_default_weights", None)
+
+def profile(*records):
+    return b"\n".join(b"\t".join(record) for record in records)
+
+PROFILE = profile(
+    (b"chr1", b"100", b"A", b"AT"),
+    (b"chr1", b"250", b"C", b"CA,CAA"),
+    (b"chr2", b"100", b"G", b"GT"),
+    (b"chr2", b"900", b"T", b"TA"),
+    (b"chrX", b"42", b"A", b"AC"),
+)
+
+def test_keys_pack_chromosome_position_and_allele():
+    codes = {}
+    table = parse_lines([b"# header", b"chr1\t100\tA\tAT", b"chr7\t%d\tA\tAT" % MAX_POSITION], codes)
+    assert codes == {b"chr1": 0, b"chr7": 1}
+    chroms = table.keys >> (ALLELE_BITS + POSITION_BITS)
+    positions = (table.keys >> ALLELE_BITS) & MAX_POSITION
+    assert sorted(zip(chroms.tolist(), positions.tolist())) == [(0, 100), (1, MAX_POSITION)]
+    assert (table.loci == table.keys >> ALLELE_BITS).all()
+
+def test_chromosome_codes_are_shared_between_profiles():
+    codes = {}
+    a = parse_lines([b"chr2\t5\tA\tAT"], codes)
+    b = parse_lines([b"chr1\t5\tA\tAT", b"chr2\t5\tA\tAT"], codes)
+    assert codes == {b"chr2": 0, b"chr1": 1}
+    assert np.intersect1d(a.keys, b.keys).size == 1
+
+def test_multi_allelic_alt_counts_one_key_per_allele():
+    table = parse_lines([b"chr1\t100\tA\tAT,ATT,ATTT", b"chr1\t100\tA\tAT"], {})
+    assert len(table.keys) == 3
+    assert table.allele_counts.tolist() == [3]
+
+def test_malformed_and_oversized_lines_are_skipped():
+    codes = {}
+    table = parse_lines([b"", b"chr1\tx\tA\tAT", b"chr1\t100\tA", b"chr9\t%d\tA\tAT" % (MAX_POSITION + 1),
+                         b"chr1\t100\tA\tAT\r"], codes)
+    assert len(table.keys) == 1
+    assert codes == {b"chr1": 0}
+
+def test_identical_profiles_score_near_one():
+    result = compare_profiles(PROFILE, PROFILE)
+    assert result['similarity'] == pytest.approx(1.0)
+    assert result['similarity_result'] == "SAME_PERSON"
+    assert result['loci_compared'] == result['shared_loci'] == 5
+    assert result['probability_score'] > 0.99
+
+def test_disjoint_profiles_score_near_zero():
+    other = PROFILE.replace(b"\tAT", b"\tATG").replace(b"\tCA,CAA", b"\tCG").replace(b"\tTA", b"\tTG") \
+                   .replace(b"\tGT", b"\tGA").replace(b"\tAC", b"\tAG")
+    result = compare_profiles(PROFILE, other)
+    assert result['similarity'] == 0.0
+    assert result['shared_loci'] == 0
+    assert result['similarity_result'] == "UNRELATED_PERSON"
+    assert result['probability_score'] < 0.01
+
+def test_partial_sharing_uses_the_larger_allele_count():
+    a = profile((b"chr1", b"100", b"A", b"AT,ATT"), (b"chr1", b"200", b"A", b"AT"))
+    b = profile((b"chr1", b"100", b"A", b"AT"), (b"chr1", b"300", b"A", b"AT"))
+    result = compare_profiles(a, b)
+    # Locus 100 shares 1 of 2 alleles; loci 200 and 300 are in one profile only
+    assert result['loci_compared'] == 3
+    assert result['shared_loci'] == 1
+    assert result['similarity'] == pytest.approx(0.5 / 3, abs=1e-6)
+
+def test_empty_profiles():
+    result = compare_profiles(b"# nothing\n", b"")
+    assert result['similarity'] == 0.0
+    assert result['loci_compared'] == 0
+    assert result['chromosomes'] == {}
+
+def test_weights_file_is_read_as_inverse_frequency(tmp_path):
+    path = tmp_path / "weights.tsv"
+    path.write_bytes(b"# CHROM\tPOS\tFREQ\nchr1\t250\t0.5\nchr1\t100\t0.25\nchr2\t900\t0\n")
+    weights = LocusWeights.from_file(str(path))
+
+    codes = {}
+    table = parse_lines(PROFILE.split(b"\n"), codes)
+    chrom_names = sorted(codes, key=codes.get)
+    loci = [(chrom_names[locus >> POSITION_BITS], locus & MAX_POSITION) for locus in table.loci.tolist()]
+    assert dict(zip(loci, weights.lookup(table.loci, chrom_names).tolist())) == {
+        (b"chr1", 100): 4.0,
+        (b"chr1", 250): 2.0,
+        (b"chr2", 100): 1.0,                    # not listed
+        (b"chr2", 900): 1.0 / MIN_FREQUENCY,    # frequency floored
+        (b"chrX", 42): 1.0,                     # no weights for the chromosome
+    }
+
+def test_default_weights_are_uniform():
+    weights = kinship.default_weights()
+    assert weights.table == {}
+    assert kinship.default_weights() is weights
+    assert LocusWeights().lookup(np.array([1, 2, 3], dtype=np.int64), [b"chr1"]).tolist() == [1.0, 1.0, 1.0]
+
+def test_weights_move_the_score():
+    a = profile((b"chr1", b"100", b"A", b"AT"), (b"chr1", b"200", b"A", b"AT"))
+    b = profile((b"chr1", b"100", b"A", b"AT"), (b"chr1", b"200", b"A", b"AG"))
+    uniform = compare_profiles(a, b)['similarity']
+    assert uniform == pytest.approx(0.5)
+
+    positions = np.array([100, 200], dtype=np.int64)
+    shared_rare = LocusWeights({b"chr1": (positions, np.array([9.0, 1.0]))})
+    differing_rare = LocusWeights({b"chr1": (positions, np.array([1.0, 9.0]))})
+    assert compare_profiles(a, b, shared_rare)['similarity'] == pytest.approx(0.9)
+    assert compare_profiles(a, b, differing_rare)['similarity'] == pytest.approx(0.1)
+
+def test_breakdown_sums_to_the_totals():
+    other = profile(
+        (b"chr1", b"100", b"A", b"AT"),
+        (b"chr1", b"250", b"C", b"CA"),
+        (b"chr2", b"100", b"G", b"GA"),
+        (b"chr3", b"7", b"A", b"AT"),
+    )
+    result = compare_profiles(PROFILE, other)
+    chromosomes = result['chromosomes']
+    assert set(chromosomes) == {"chr1", "chr2", "chrX", "chr3"}
+    assert sum(c['loci'] for c in chromosomes.values()) == result['loci_compared'] == 6
+    # With uniform weights the overall score is the loci-weighted mean of the chromosomes
+    weighted = sum(c['loci'] * c['similarity'] for c in chromosomes.values()) / result['loci_compared']
+    assert weighted == pytest.approx(result['similarity'], abs=1e-5)
+    assert chromosomes["chr1"] == {'loci': 2, 'similarity': 0.75}
+    assert chromosomes["chrX"]['similarity'] == 0.0
+
+def test_calibration_is_monotonic_around_the_midpoint():
+    scores = np.linspace(0.0, 1.0, 101)
+    probabilities = [calibrate(s) for s in scores]
+    assert all(later > earlier for earlier, later in zip(probabilities, probabilities[1:]))
+    assert calibrate(kinship.CALIBRATION_MIDPOINT) == pytest.approx(0.5)
+    assert 0.0 < probabilities[0] < 0.01 and 0.99 < probabilities[-1] < 1.0
+
+@pytest.mark.parametrize("similarity, label", [
+    (1.0, "SAME_PERSON"), (0.98, "SAME_PERSON"), (0.97, "RELATED_PERSON"),
+    (0.5, "RELATED_PERSON"), (0.49, "UNRELATED_PERSON"), (0.0, "UNRELATED_PERSON"),
+])
+def test_classify_uses_the_script_cut_offs(similarity, label):
+    assert classify(similarity) == label
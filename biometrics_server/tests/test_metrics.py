@@ -0,0 +1,56 @@
+"""Tests for the metrics registry and the timings /metrics reports"""
+
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main_fastapi
+from metrics import Metrics
+from storage import LocalBlobStore, MetadataStore
+
+PROFILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_profile.txt")
+
+def test_observe_keeps_count_total_and_max():
+    registry = Metrics()
+    for seconds in (0.5, 2.0, 1.0):
+        registry.observe("similarity_check", seconds)
+    registry.inc("similarity_check.memoized")
+    registry.set("startup_seconds", 3.5)
+
+    snapshot = registry.snapshot()
+    assert snapshot['timings'] == {'similarity_check': {'count': 3, 'total_seconds': 3.5, 'max_seconds': 2.0}}
+    assert snapshot['counters'] == {'similarity_check.memoized': 1}
+    assert snapshot['gauges'] == {'startup_seconds': 3.5}
+
+    # Snapshots are copies
+    snapshot['timings']['similarity_check']['count'] = 0
+    assert registry.timings['similarity_check']['count'] == 3
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    blob_store = LocalBlobStore(str(tmp_path / "store"))
+    monkeypatch.setattr(main_fastapi, "blob_store", blob_store)
+    monkeypatch.setattr(main_fastapi, "metadata_store", MetadataStore(blob_store))
+    monkeypatch.setattr(main_fastapi, "metrics", Metrics())
+    return TestClient(main_fastapi.app)
+
+def test_request_durations_are_reported(client):
+    assert client.get("/metrics").json()['timings'] == {}
+
+    with open(PROFILE, 'rb') as f:
+        response = client.post("/first_humanity_verification",
+                               data={'user_id': "metrics-user", 'external_kyc_document_id': "doc"},
+                               files={'file': ("profile.txt", f)})
+    assert response.status_code == 200
+
+    # A rejected upload is not timed
+    response = client.post("/first_humanity_verification",
+                           data={'user_id': "metrics-user-2", 'external_kyc_document_id': "doc"},
+                           files={'file': ("profile.txt", b"not a profile\n")})
+    assert response.status_code == 422
+
+    timings = client.get("/metrics").json()['timings']
+    assert list(timings) == ["first_humanity_verification"]
+    assert timings["first_humanity_verification"]['count'] == 1
+    assert timings["first_humanity_verification"]['max_seconds'] > 0
@@ -0,0 +1,58 @@
+"""Profile sketches: estimates, serialisation, and the device copy of the module"""
+
+import os
+import re
+
+import pytest
+
+import profile_sketch
+from profile_sketch import ProfileSketch, SketchFormatError, estimate_similarity
+
+DEVICE_COPY = os.path.join(os.path.dirname(__file__), "..", "..", "genome_device", "profile_sketch.py")
+
+def sketch_of(records):
+    sketch = ProfileSketch()
+    for chrom, pos, alt in records:
+        sketch.add([chrom, b"%d" % pos, b"A", alt])
+    return sketch
+
+def records(start, stop, alt=b"AT"):
+    return [(b"chr%d" % (pos % 22 + 1), pos, alt) for pos in range(start, stop)]
+
+@pytest.mark.parametrize("overlap", [0, 5000, 9000, 10000])
+def test_estimate_tracks_jaccard(overlap):
+    a = records(0, 10000)
+    b = records(10000 - overlap, 20000 - overlap)
+    jaccard = overlap / (20000 - overlap)
+    estimate, stderr = estimate_similarity(sketch_of(a), sketch_of(b))
+    assert abs(estimate - jaccard) < max(0.02, 4 * stderr)
+
+def test_tiny_sketches_are_never_certain():
+    estimate, stderr = estimate_similarity(sketch_of(records(0, 4)), sketch_of(records(0, 4)))
+    assert estimate == 1.0
+    assert stderr > 0.1
+
+def test_round_trip():
+    sketch = sketch_of(records(0, 3000))
+    sketch.panel = "str_v2@3f9c0a1b2c4d"
+    restored = ProfileSketch.from_dict(sketch.to_dict())
+    assert restored.values == sketch.values
+    assert (restored.records, restored.panel) == (3000, "str_v2@3f9c0a1b2c4d")
+
+def test_sketches_from_another_implementation_are_refused():
+    data = sketch_of(records(0, 100)).to_dict()
+    data['fingerprint'] = "0" * 16
+    with pytest.raises(SketchFormatError, match="drifted"):
+        ProfileSketch.from_dict(data)
+    del data['fingerprint']
+    with pytest.raises(SketchFormatError):
+        ProfileSketch.from_dict(data)
+
+def module_code(path):
+    """The module without its docstring, which names the other copy"""
+    with open(path) as f:
+        return re.sub(r'^#!.*?\n"""\n.*?"""\n', '', f.read(), count=1, flags=re.S)
+
+@pytest.mark.skipif(not os.path.exists(DEVICE_COPY), reason="genome_device is not checked out")
+def test_device_copy_is_identical():
+    assert module_code(DEVICE_COPY) == module_code(profile_sketch.__file__)
@@ -0,0 +1,84 @@
+"""Tests for rebuilding the metadata index from Golem DB records"""
+
+import asyncio
+
+import pytest
+
+pytest.importorskip("golem_base_sdk")
+
+import golem_endpoints
+import rebuild_index
+from rebuild_index import Checkpoint, rebuild
+from storage import LocalBlobStore, MetadataStore
+
+def chain_record(index):
+    return {
+        'record_type': 'humanity_verification', 'app': golem_endpoints.APP_TAG,
+        'entity_key': f"0x{index:02x}", 'verification_id': f"v{index}", 'user_id': f"user{index}",
+        'humanity_score': 0.9, 'file_hash': "ab", 'timestamp': "2025-01-01T00:00:00",
+        'verification_type': 'first_humanity_verification',
+    }
+
+@pytest.fixture
+def chain(tmp_path, monkeypatch):
+    """Five entities on chain; keys listed in chain['broken'] fail to fetch"""
+    state = {'records': {f"0x{i:02x}": chain_record(i) for i in range(5)}, 'broken': {}, 'fetches': []}
+
+    async def fetch_owner_entity_keys():
+        return list(state['records'])
+
+    async def fetch_verification_by_entity_key(entity_key):
+        state['fetches'].append(entity_key)
+        failure = state['broken'].get(entity_key)
+        if failure == 'raise':
+            raise ConnectionError("node went away")
+        if failure == 'none':
+            return None
+        return state['records'][entity_key]
+
+    monkeypatch.setattr(golem_endpoints, "fetch_owner_entity_keys", fetch_owner_entity_keys)
+    monkeypatch.setattr(golem_endpoints, "fetch_verification_by_entity_key", fetch_verification_by_entity_key)
+    monkeypatch.setattr(golem_endpoints.golem_manager, "close", lambda: None)
+    monkeypatch.setattr(rebuild_index, "create_blob_store", lambda: LocalBlobStore(str(tmp_path / "store")))
+    return state
+
+def local_ids(tmp_path):
+    store = MetadataStore(LocalBlobStore(str(tmp_path / "store")))
+    asyncio.run(store.load())
+    return sorted(store.records)
+
+def test_failed_entities_are_retried_on_the_next_run(tmp_path, chain):
+    chain['broken'] = {"0x01": 'none', "0x03": 'raise'}
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.json"))
+
+    report = asyncio.run(rebuild(False, 2, 2, checkpoint))
+    assert sorted(report['failed']) == ["0x01", "0x03"]
+    assert report['errors'] == 2
+    assert report['restored'] == 3
+    assert checkpoint.done == {"0x00", "0x02", "0x04"}
+    assert local_ids(tmp_path) == ["v0", "v2", "v4"]
+
+    # The failed keys stay out of the saved checkpoint, so a resumed run fetches only them
+    chain['broken'] = {}
+    chain['fetches'].clear()
+    resumed = Checkpoint(checkpoint.path)
+    resumed.load()
+    report = asyncio.run(rebuild(False, 2, 2, resumed))
+    assert sorted(chain['fetches']) == ["0x01", "0x03"]
+    assert report['failed'] == [] and report['restored'] == 2
+    assert resumed.done == set(chain['records'])
+    assert local_ids(tmp_path) == ["v0", "v1", "v2", "v3", "v4"]
+
+def test_missing_on_chain_is_not_reported_after_failures(tmp_path, chain):
+    store = MetadataStore(LocalBlobStore(str(tmp_path / "store")))
+    asyncio.run(store.put({'verification_id': "v9", 'user_id': "user9", 'timestamp': "2025-01-01T00:00:00"}))
+
+    chain['broken'] = {"0x02": 'raise'}
+    report = asyncio.run(rebuild(True, 4, 10, Checkpoint("", enabled=False)))
+    assert report['failed'] == ["0x02"]
+    assert report['missing_on_chain'] == []
+    assert sorted(report['missing_locally']) == ["v0", "v1", "v3", "v4"]
+
+    chain['broken'] = {}
+    report = asyncio.run(rebuild(True, 4, 10, Checkpoint("", enabled=False)))
+    assert report['missing_on_chain'] == ["v9"]
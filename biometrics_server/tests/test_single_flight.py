@@ -0,0 +1,78 @@
+"""Request coalescing: joiners share the leader's result and tag"""
+
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+def test_concurrent_calls_share_one_computation():
+    flight = SingleFlight("test")
+    runs = []
+
+    async def compute():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        return await asyncio.gather(*[flight.do("key", compute, tag=i) for i in range(5)])
+
+    assert asyncio.run(scenario()) == ["result"] * 5
+    assert len(runs) == 1
+
+def test_a_claimed_call_reports_the_leader_tag_until_it_runs():
+    flight = SingleFlight("test")
+
+    async def scenario():
+        call, leader = flight.claim("key", tag="first")
+        joined, joined_leader = flight.claim("key", tag="second")
+        assert leader and not joined_leader
+        assert joined.tag == "first"
+
+        waiter = asyncio.ensure_future(flight.join(joined))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+
+        async def compute():
+            return {"check_id": call.tag}
+
+        assert await flight.run(call, compute) == {"check_id": "first"}
+        assert await waiter == {"check_id": "first"}
+
+        # The key is free again once the call is done
+        _, leader = flight.claim("key", tag="third")
+        assert leader
+
+    asyncio.run(scenario())
+
+def test_failing_a_claimed_call_fails_its_joiners_and_frees_the_key():
+    flight = SingleFlight("test")
+
+    async def scenario():
+        call, _ = flight.claim("key", tag="queued")
+        joined, _ = flight.claim("key")
+        flight.fail(call, RuntimeError("queue full"))
+        with pytest.raises(RuntimeError, match="queue full"):
+            await flight.join(joined)
+        _, leader = flight.claim("key")
+        assert leader
+
+    asyncio.run(scenario())
+
+def test_a_caller_going_away_does_not_cancel_the_computation():
+    flight = SingleFlight("test")
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do("key", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("key", compute))
+        await asyncio.sleep(0.005)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == "done"
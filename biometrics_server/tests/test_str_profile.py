@@ -0,0 +1,39 @@
+"""Profile validation: what the upload endpoints accept and reject"""
+
+import pytest
+
+from str_profile import ProfileParser, ProfileFormatError, parse_profile_bytes, MAX_POSITION
+
+def test_accepts_a_valid_profile():
+    profile = parse_profile_bytes(b"# Panel: none\nchr2\t100\tA\tAT,ATT\nchr1\t99\tC\tCA\n")
+    assert profile.lines == [b"chr2\t100\tA\tAT,ATT", b"chr1\t99\tC\tCA"]
+    assert not profile.is_sorted
+    assert profile.panel is None
+
+@pytest.mark.parametrize("line, reason", [
+    (b"chr1\t0\tA\tAT", "POS must be a positive integer"),
+    (b"chr1\t12a\tA\tAT", "POS must be a positive integer"),
+    (b"chr1\t%d\tA\tAT" % (MAX_POSITION + 1), "POS must be at most"),
+    (b"chr1\t99999999999999999999\tA\tAT", "POS must be at most"),
+    (b"chr1\t100\tX\tAT", "REF must be nucleotides"),
+    (b"chr1\t100\tA", "expected CHROM<TAB>POS<TAB>REF<TAB>ALT"),
+])
+def test_rejects_malformed_lines(line, reason):
+    with pytest.raises(ProfileFormatError) as error:
+        parse_profile_bytes(b"chr1\t1\tA\tAT\n" + line + b"\n")
+    assert error.value.line_number == 2
+    assert reason in error.value.reason
+
+def test_largest_position_is_accepted():
+    assert parse_profile_bytes(b"chr1\t%d\tA\tAT\n" % MAX_POSITION).lines
+
+def test_lenient_parser_skips_out_of_range_positions():
+    profile = parse_profile_bytes(b"chr1\t%d\tA\tAT\nchr1\t5\tA\tAT\n" % (MAX_POSITION + 1), strict=False)
+    assert profile.lines == [b"chr1\t5\tA\tAT"]
+    assert profile.skipped_lines == 1
+
+def test_lines_split_across_chunks():
+    parser = ProfileParser()
+    for chunk in (b"chr1\t1", b"0\tA\tA", b"T\nchr2\t5\tG\tGA\n"):
+        parser.feed(chunk)
+    assert parser.finish().lines == [b"chr1\t10\tA\tAT", b"chr2\t5\tG\tGA"]
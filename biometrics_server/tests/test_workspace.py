@@ -0,0 +1,56 @@
+"""Job workspaces: created and removed off the event loop, even when the job fails"""
+
+import os
+import asyncio
+import threading
+
+import pytest
+
+import workspace
+from workspace import job_workspace
+
+@pytest.fixture(autouse=True)
+def workspace_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(workspace, "WORKSPACE_DIR", str(tmp_path))
+    monkeypatch.setattr(workspace, "WORKSPACE_TMPFS", False)
+    return tmp_path
+
+def test_workspace_is_removed_on_exit(workspace_dir):
+    async def scenario():
+        async with job_workspace("check1") as path:
+            assert os.path.basename(path).startswith("job_check1_")
+            with open(os.path.join(path, "upload.txt"), "w") as f:
+                f.write("data")
+            assert workspace._active == 1
+        return path
+
+    path = asyncio.run(scenario())
+    assert not os.path.exists(path)
+    assert workspace._active == 0
+
+def test_workspace_is_removed_when_the_job_fails(workspace_dir):
+    async def scenario():
+        async with job_workspace("check2"):
+            raise RuntimeError("comparison failed")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+    assert os.listdir(workspace_dir) == []
+    assert workspace._active == 0
+
+def test_filesystem_calls_run_off_the_event_loop(monkeypatch):
+    threads = []
+    original = workspace.shutil.rmtree
+
+    def rmtree(path, ignore_errors=False):
+        threads.append(threading.current_thread())
+        original(path, ignore_errors)
+
+    monkeypatch.setattr(workspace.shutil, "rmtree", rmtree)
+
+    async def scenario():
+        async with job_workspace("check3"):
+            pass
+
+    asyncio.run(scenario())
+    assert threads and threads[0] is not threading.main_thread()
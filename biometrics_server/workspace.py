@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Job Workspaces for HumanID Biometrics Server
+Every similarity comparison gets its own scratch directory, optionally on
+tmpfs, that is removed when the job ends however it ends
+"""
+
+import os
+import asyncio
+import time
+import shutil
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# WORKSPACE_TMPFS=true keeps scratch files in memory when /dev/shm is available
+WORKSPACE_TMPFS = os.getenv("WORKSPACE_TMPFS", "false").lower() == "true"
+TMPFS_DIR = "/dev/shm/biometrics_workspaces"
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", "/tmp/biometrics_workspaces")
+# Workspaces older than this at startup belong to a crashed process
+STALE_WORKSPACE_SECONDS = int(os.getenv("STALE_WORKSPACE_SECONDS", "3600"))
+WORKSPACE_PREFIX = "job_"
+
+def workspace_root() -> str:
+    if WORKSPACE_TMPFS and os.path.isdir("/dev/shm"):
+        return TMPFS_DIR
+    return WORKSPACE_DIR
+
+_active = 0
+
+def _create_workspace(job_id: str) -> str:
+    root = workspace_root()
+    os.makedirs(root, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f"{WORKSPACE_PREFIX}{job_id}_", dir=root)
+
+@asynccontextmanager
+async def job_workspace(job_id: str) -> AsyncIterator[str]:
+    """A fresh directory for one job; it and everything written to it are removed on exit
+
+    The directory is created and removed on a worker thread, so removing a
+    large workspace never stalls the event loop.
+    """
+    global _active
+    path = await asyncio.to_thread(_create_workspace, job_id)
+    _active += 1
+    metrics.set("workspaces.active", _active)
+    try:
+        yield path
+    finally:
+        try:
+            # The removal thread runs to the end even if this job is cancelled meanwhile
+            await asyncio.to_thread(shutil.rmtree, path, True)
+        finally:
+            _active -= 1
+            metrics.set("workspaces.active", _active)
+
+def sweep_stale_workspaces(max_age: float = STALE_WORKSPACE_SECONDS) -> int:
+    """Remove workspaces left behind by a process that did not exit cleanly"""
+    root = workspace_root()
+    if not os.path.isdir(root):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        try:
+            if name.startswith(WORKSPACE_PREFIX) and os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        except OSError:
+            continue
+    if removed:
+        logger.info(f"Removed {removed} stale job workspaces from {root}")
+    metrics.inc("workspaces.swept", removed)
+    return removed
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+BGZF Reader
+Multi-threaded decompression of BGZF (bgzip) files: independently compressed
+blocks are inflated on a thread pool and reassembled in order
+"""
+
+import io
+import os
+import sys
+import gzip
+import time
+import zlib
+import struct
+import logging
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BGZF_THREADS = int(os.getenv("BGZF_THREADS", str(min(4, os.cpu_count() or 1))))
+# Blocks inflated per task; a block holds at most 64KB of data
+BLOCKS_PER_TASK = 16
+MAX_BLOCK_SIZE = 65536
+
+# gzip member header with FEXTRA set, XLEN=6 and a 'BC' subfield holding BSIZE
+_HEADER = struct.Struct('<4BI2BH2BHH')
+_HEADER_SIZE = _HEADER.size
+EOF_BLOCK = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+
+def is_bgzf(path: str) -> bool:
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER_SIZE)
+    if len(header) < _HEADER_SIZE:
+        return False
+    id1, id2, cm, flg, _, _, _, xlen, si1, si2, slen, _ = _HEADER.unpack(header)
+    return (id1, id2, cm) == (0x1f, 0x8b, 8) and bool(flg & 4) and xlen == 6 \
+        and (si1, si2, slen) == (66, 67, 2)
+
+def read_blocks(f) -> Iterator[bytes]:
+    """Yield raw BGZF blocks (header, deflate data and trailer) in file order"""
+    while True:
+        header = f.read(_HEADER_SIZE)
+        if not header:
+            return
+        if len(header) < _HEADER_SIZE:
+            raise ValueError("Truncated BGZF block header")
+        id1, id2, _, flg, _, _, _, xlen, si1, si2, _, bsize = _HEADER.unpack(header)
+        if (id1, id2) != (0x1f, 0x8b) or not flg & 4 or (si1, si2) != (66, 67):
+            raise ValueError("Not a BGZF block")
+        rest = f.read(bsize + 1 - _HEADER_SIZE)
+        if len(rest) != bsize + 1 - _HEADER_SIZE:
+            raise ValueError("Truncated BGZF block")
+        yield header + rest
+
+def inflate_block(block: bytes) -> bytes:
+    data = zlib.decompress(block[_HEADER_SIZE:-8], -15)
+    crc, isize = struct.unpack('<II', block[-8:])
+    if len(data) != isize or zlib.crc32(data) != crc:
+        raise ValueError("BGZF block failed its CRC check")
+    return data
+
+def _inflate_blocks(blocks: List[bytes]) -> bytes:
+    # zlib releases the GIL while inflating, so tasks run in parallel
+    return b''.join(inflate_block(block) for block in blocks)
+
+def inflate_chunks(f, threads: int = BGZF_THREADS) -> Iterator[bytes]:
+    """Decompressed data in order, BLOCKS_PER_TASK blocks per chunk
+
+    At most threads * 4 tasks are in flight, so memory stays bounded.
+    """
+    if threads <= 1:
+        for block in read_blocks(f):
+            yield inflate_block(block)
+        return
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = deque()
+        batch: List[bytes] = []
+        for block in read_blocks(f):
+            batch.append(block)
+            if len(batch) == BLOCKS_PER_TASK:
+                pending.append(pool.submit(_inflate_blocks, batch))
+                batch = []
+                if len(pending) >= threads * 4:
+                    yield pending.popleft().result()
+        if batch:
+            pending.append(pool.submit(_inflate_blocks, batch))
+        while pending:
+            yield pending.popleft().result()
+
+class BGZFStream(io.RawIOBase):
+    """Raw stream over inflate_chunks; wrap in io.BufferedReader for line iteration"""
+
+    def __init__(self, path: str, threads: int = BGZF_THREADS):
+        self._file = open(path, 'rb')
+        self._chunks = inflate_chunks(self._file, threads)
+        self._buffer = memoryview(b'')
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buffer = memoryview(chunk)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._chunks.close()
+            self._file.close()
+        super().close()
+
+def open_bgzf(path: str, threads: int = BGZF_THREADS) -> io.BufferedReader:
+    return io.BufferedReader(BGZFStream(path, threads), buffer_size=MAX_BLOCK_SIZE * BLOCKS_PER_TASK)
+
+def compress(src: str, dst: str, level: int = 6):
+    """Write src as BGZF, as bgzip would; used to prepare benchmark input"""
+    block_data = MAX_BLOCK_SIZE - 256
+    with open(src, 'rb') as fin, open(dst, 'wb') as fout:
+        while True:
+            data = fin.read(block_data)
+            if not data:
+                break
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            cdata = compressor.compress(data) + compressor.flush()
+            bsize = _HEADER_SIZE + len(cdata) + 8 - 1
+            fout.write(_HEADER.pack(0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, 66, 67, 2, bsize))
+            fout.write(cdata)
+            fout.write(struct.pack('<II', zlib.crc32(data), len(data)))
+        fout.write(EOF_BLOCK)
+
+def benchmark(path: str, threads: Optional[List[int]] = None) -> List[dict]:
+    """MB/s of decompressed output: gzip module versus this reader at several thread counts"""
+    results = []
+
+    def measure(name: str, opener) -> dict:
+        start = time.perf_counter()
+        total = 0
+        with opener() as f:
+            for line in f:
+                total += len(line)
+        seconds = time.perf_counter() - start
+        return {'reader': name, 'mb': round(total / 1e6, 1), 'seconds': round(seconds, 3),
+                'mb_per_second': round(total / 1e6 / seconds, 1)}
+
+    results.append(measure('gzip', lambda: gzip.open(path, 'rb')))
+    for count in threads or [1, 2, 4, os.cpu_count() or 1]:
+        results.append(measure(f'bgzf x{count}', lambda: open_bgzf(path, count)))
+    return results
+
+def main():
+    """Benchmark BGZF decompression, or bgzip a file"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)-8s | %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    parser = argparse.ArgumentParser(
+        description="BGZF Reader - multi-threaded bgzip decompression",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Compare single-threaded gzip with threaded BGZF decompression
+  python bgzf.py --benchmark genome.vcf.gz
+
+  # Create BGZF input for the benchmark
+  python bgzf.py --compress genome.vcf genome.vcf.gz
+        """
+    )
+    parser.add_argument('files', nargs='+', help='Input file (and output file with --compress)')
+    parser.add_argument('--benchmark', action='store_true', help='Measure decompression MB/s')
+    parser.add_argument('--compress', action='store_true', help='Write the first file as BGZF to the second')
+    parser.add_argument('--threads', type=int, nargs='*', help='Thread counts to benchmark')
+    args = parser.parse_args()
+
+    if args.compress and len(args.files) == 2:
+        compress(args.files[0], args.files[1])
+    elif args.benchmark:
+        if not is_bgzf(args.files[0]):
+            logger.error(f"{args.files[0]} is not BGZF")
+            sys.exit(1)
+        for result in benchmark(args.files[0], args.threads):
+            print(f"{result['reader']:>10}: {result['mb_per_second']:>8} MB/s ({result['mb']} MB in {result['seconds']}s)")
+    else:
+        parser.print_usage()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
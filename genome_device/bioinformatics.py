@@ -7,9 +7,14 @@ Handles STR profile generation and file processing
 import os
 import sys
 import logging
-import subprocess
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
+
+from str_pipeline import (generate_profile, add_quality_arguments, quality_filter_from_args,
+                          add_panel_arguments, panel_from_args)
+from quality_filter import QualityFilter
+from locus_panel import LocusPanel
+from external_sort import SORT_MEMORY_MB
 
 # Configure logging
 logging.basicConfig(
@@ -22,23 +27,21 @@ logger = logging.getLogger(__name__)
 class BioinformaticsProcessor:
     """Bioinformatics processor for STR profile generation"""
     
-    def __init__(self):
+    def __init__(self, keep_intermediates: bool = False, workers: int = 1,
+                 sort_memory_mb: int = SORT_MEMORY_MB, quality_filter: Optional[QualityFilter] = None,
+                 panel: Optional[LocusPanel] = None):
         self.script_dir = Path(__file__).parent
-        self.generate_script = self.script_dir / "generate_str_profile.sh"
-        
-        # Validate script exists
-        if not self.generate_script.exists():
-            raise FileNotFoundError(f"Generate script not found: {self.generate_script}")
-        
-        # Make script executable
-        os.chmod(self.generate_script, 0o755)
+        self.keep_intermediates = keep_intermediates
+        self.workers = workers
+        self.sort_memory_mb = sort_memory_mb
+        self.quality_filter = quality_filter
+        self.panel = panel
         
         logger.info(f"Bioinformatics processor initialized")
-        logger.info(f"Generate script: {self.generate_script}")
     
     def generate_str_profile(self, vcf_file: str, output_name: str = None) -> Tuple[str, str]:
         """
-        Generate STR profile using the bash script
+        Generate STR profile with the streaming pipeline
         
         Args:
             vcf_file: Path to VCF file
@@ -57,41 +60,18 @@ class BioinformaticsProcessor:
         if not output_name:
             output_name = Path(vcf_file).stem
         
-        # Prepare command
-        cmd = [str(self.generate_script), vcf_file, output_name]
-        
-        logger.info(f"Running command: {' '.join(cmd)}")
-        
         try:
-            # Run the script
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minute timeout
-            )
-            
-            if result.returncode != 0:
-                logger.error(f"Script failed with return code {result.returncode}")
-                logger.error(f"STDERR: {result.stderr}")
-                raise RuntimeError(f"STR profile generation failed: {result.stderr}")
-            
-            # Check for generated files
-            final_str_file = self.script_dir / f"{output_name}_str_final.txt"
-            profile_summary = self.script_dir / f"{output_name}_profile_summary.txt"
-            
-            if not final_str_file.exists():
-                raise FileNotFoundError(f"Expected output file not found: {final_str_file}")
+            # Stream the VCF once; only the final profile and summary are written
+            result = generate_profile(vcf_file, output_name, str(self.script_dir),
+                                      self.keep_intermediates, self.workers, self.sort_memory_mb,
+                                      self.quality_filter, self.panel)
             
             logger.info(f"STR profile generated successfully")
-            logger.info(f"Final STR file: {final_str_file}")
-            logger.info(f"Profile summary: {profile_summary}")
+            logger.info(f"Final STR file: {result.final_path}")
+            logger.info(f"Profile summary: {result.summary_path}")
             
-            return str(final_str_file), str(profile_summary) if profile_summary.exists() else None
+            return result.final_path, result.summary_path
             
-        except subprocess.TimeoutExpired:
-            logger.error("STR profile generation timed out")
-            raise RuntimeError("STR profile generation timed out")
         except Exception as e:
             logger.error(f"Error generating STR profile: {e}")
             raise
@@ -115,12 +95,22 @@ Examples:
     
     parser.add_argument('vcf_file', help='Path to VCF file')
     parser.add_argument('--output-name', help='Name for output files (default: VCF filename)')
+    parser.add_argument('--keep-intermediates', action='store_true',
+                       help='Keep the raw profile, indel VCF and variant type breakdown for debugging')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Generate the profile per chromosome on this many processes (0: one per core)')
+    parser.add_argument('--sort-memory', type=int, default=SORT_MEMORY_MB,
+                       help=f'MB of profile lines to sort in memory before spilling to disk (default: {SORT_MEMORY_MB})')
+    add_quality_arguments(parser)
+    add_panel_arguments(parser)
     
     args = parser.parse_args()
     
     try:
         # Initialize processor
-        processor = BioinformaticsProcessor()
+        processor = BioinformaticsProcessor(args.keep_intermediates, args.workers or os.cpu_count() or 1,
+                                            args.sort_memory, quality_filter_from_args(args),
+                                            panel_from_args(args))
         
         # Generate STR profile
         str_file, summary_file = processor.generate_str_profile(
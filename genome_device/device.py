@@ -10,14 +10,25 @@ import sys
 import json
 import uuid
 import time
+import itertools
+import shutil
 import logging
-import subprocess
+import threading
 import argparse
 from pathlib import Path
-from typing import Dict, Any, Optional, Tuple
+from typing import Callable, Dict, Any, Optional, Tuple
 import requests
 from datetime import datetime
 
+from str_pipeline import (PipelineResult, generate_profile, add_quality_arguments, quality_filter_from_args,
+                          add_panel_arguments, panel_from_args)
+from quality_filter import QualityFilter
+from locus_panel import LocusPanel
+from external_sort import SORT_MEMORY_MB
+from profile_cache import ProfileCache
+from profile_sketch import sketch_file
+from profile_stream import ProfileStream, StreamCancelled, multipart_body, stream_header, stream_trailer
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -29,25 +40,29 @@ logger = logging.getLogger(__name__)
 class GenomeDevice:
     """Genome device for STR profile generation and biometric verification"""
     
-    def __init__(self, server_url: str = "https://biometrics-server.biokami.com"):
+    def __init__(self, server_url: str = "https://biometrics-server.biokami.com",
+                 keep_intermediates: bool = False, workers: int = 1,
+                 sort_memory_mb: int = SORT_MEMORY_MB, use_cache: bool = True,
+                 output_dir: Optional[str] = None, quality_filter: Optional[QualityFilter] = None,
+                 panel: Optional[LocusPanel] = None, pipelined: bool = False):
         self.server_url = server_url.rstrip('/')
-        self.script_dir = Path(__file__).parent
-        self.generate_script = self.script_dir / "generate_str_profile.sh"
-        
-        # Validate script exists
-        if not self.generate_script.exists():
-            raise FileNotFoundError(f"Generate script not found: {self.generate_script}")
-        
-        # Make script executable
-        os.chmod(self.generate_script, 0o755)
+        self.pipelined = pipelined
+        self.keep_intermediates = keep_intermediates
+        self.workers = workers
+        self.sort_memory_mb = sort_memory_mb
+        self.quality_filter = quality_filter
+        self.panel = panel
+        self.output_dir = output_dir
+        # Intermediate files are for debugging a fresh run, so they bypass the cache
+        self.cache = ProfileCache() if use_cache and not keep_intermediates else None
         
         logger.info(f"Genome Device initialized")
         logger.info(f"Server URL: {self.server_url}")
-        logger.info(f"Generate script: {self.generate_script}")
     
     def generate_str_profile(self, vcf_file: str, output_name: str = None) -> Tuple[str, str]:
         """
-        Generate STR profile using the bash script
+        Generate STR profile with the streaming pipeline, reusing a cached
+        profile of the same VCF content when there is one
         
         Args:
             vcf_file: Path to VCF file
@@ -56,6 +71,18 @@ class GenomeDevice:
         Returns:
             Tuple of (final_str_file_path, profile_summary_path)
         """
+        result = self.build_profile(vcf_file, output_name)
+        return result.final_path, result.summary_path
+    
+    def build_profile(self, vcf_file: str, output_name: str = None,
+                      sink: Optional[Callable[[bytes], None]] = None) -> PipelineResult:
+        """
+        Generate STR profile as generate_str_profile does, passing each
+        profile line to sink as the VCF is scanned (not on a cache hit)
+        
+        Returns:
+            PipelineResult whose paths point at the profile and summary
+        """
         logger.info(f"Generating STR profile from: {vcf_file}")
         
         # Validate VCF file exists
@@ -66,41 +93,33 @@ class GenomeDevice:
         if not output_name:
             output_name = Path(vcf_file).stem
         
-        # Prepare command
-        cmd = [str(self.generate_script), vcf_file, output_name]
-        
-        logger.info(f"Running command: {' '.join(cmd)}")
-        
         try:
-            # Run the script
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=300  # 5 minute timeout
-            )
-            
-            if result.returncode != 0:
-                logger.error(f"Script failed with return code {result.returncode}")
-                logger.error(f"STDERR: {result.stderr}")
-                raise RuntimeError(f"STR profile generation failed: {result.stderr}")
-            
-            # Check for generated files
-            final_str_file = self.script_dir / f"{output_name}_str_final.txt"
-            profile_summary = self.script_dir / f"{output_name}_profile_summary.txt"
-            
-            if not final_str_file.exists():
-                raise FileNotFoundError(f"Expected output file not found: {final_str_file}")
+            if self.cache is not None:
+                result = self.cache.generate(vcf_file, self.workers, self.sort_memory_mb, sink,
+                                             quality_filter=self.quality_filter, panel=self.panel)
+                final_path, summary_path = result.final_path, result.summary_path
+                if self.output_dir:
+                    # Copies, so that eviction never removes the user's files
+                    out = Path(self.output_dir)
+                    out.mkdir(parents=True, exist_ok=True)
+                    final_path = shutil.copyfile(final_path, out / f"{output_name}_str_final.txt")
+                    summary_path = shutil.copyfile(summary_path, out / f"{output_name}_profile_summary.txt")
+            else:
+                # Stream the VCF once; only the final profile and summary are written
+                result = generate_profile(vcf_file, output_name, self.output_dir or ".",
+                                          self.keep_intermediates, self.workers, self.sort_memory_mb,
+                                          self.quality_filter, self.panel, sink)
+                final_path, summary_path = result.final_path, result.summary_path
             
             logger.info(f"STR profile generated successfully")
-            logger.info(f"Final STR file: {final_str_file}")
-            logger.info(f"Profile summary: {profile_summary}")
+            logger.info(f"Final STR file: {final_path}")
+            logger.info(f"Profile summary: {summary_path}")
             
-            return str(final_str_file), str(profile_summary) if profile_summary.exists() else None
+            result.final_path, result.summary_path = str(final_path), str(summary_path)
+            return result
             
-        except subprocess.TimeoutExpired:
-            logger.error("STR profile generation timed out")
-            raise RuntimeError("STR profile generation timed out")
+        except StreamCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error generating STR profile: {e}")
             raise
@@ -163,6 +182,131 @@ class GenomeDevice:
                     logger.error(f"Server response: {e.response.text}")
             raise
     
+    def pipelined_upload(self, vcf_file: str, endpoint: str, user_id: str,
+                         external_kyc_document_id: str = None, output_name: str = None) -> Dict[str, Any]:
+        """
+        Generate the STR profile and upload it while the VCF is scanned
+        
+        Profile lines are streamed into a chunked request body as they are
+        found, so scanning and upload overlap. They arrive in VCF order, or
+        region by region in file order with workers, so the upload is the
+        same for every run of the same input; the counts follow the lines in
+        a trailer. The request is opened with the first line and holds a
+        server admission slot for the rest of the scan. The uploaded bytes
+        are hashed as they are sent. A cached profile is uploaded directly,
+        since there is nothing left to overlap.
+        
+        Args:
+            vcf_file: Path to VCF file
+            endpoint: API endpoint ('first_humanity_verification' or 'similarity_check')
+            user_id: User identifier
+            external_kyc_document_id: KYC document ID (required for first verification)
+            output_name: Optional name for output files
+            
+        Returns:
+            Server response as dictionary
+        """
+        if not os.path.exists(vcf_file):
+            raise FileNotFoundError(f"VCF file not found: {vcf_file}")
+        if not output_name:
+            output_name = Path(vcf_file).stem
+        
+        if self.cache is not None and self.cache.lookup(vcf_file, quality_filter=self.quality_filter,
+                                                        panel=self.panel) is not None:
+            logger.info("Profile is cached, uploading it directly")
+            str_file, summary_file = self.generate_str_profile(vcf_file, output_name)
+            return self.upload_file(str_file, endpoint, user_id, external_kyc_document_id)
+        
+        stream = ProfileStream(stream_header(vcf_file, self.quality_filter, self.panel))
+        
+        def produce():
+            try:
+                result = self.build_profile(vcf_file, output_name, stream.add_line)
+                stream.finish(stream_trailer(result.total_variants, result.profile_lines))
+            except StreamCancelled:
+                pass
+            except BaseException as e:
+                stream.fail(e)
+        
+        form_data = {'user_id': user_id}
+        if external_kyc_document_id:
+            form_data['external_kyc_document_id'] = external_kyc_document_id
+        url = f"{self.server_url}/{endpoint}"
+        
+        logger.info(f"Generating and uploading to {url}")
+        logger.info(f"User ID: {user_id}")
+        
+        start = time.monotonic()
+        producer = threading.Thread(target=produce, name="profile-producer", daemon=True)
+        producer.start()
+        try:
+            # The request is only opened once the first chunk of lines is ready
+            chunks = stream.chunks()
+            first = next(chunks)
+            logger.info(f"First profile chunk after {time.monotonic() - start:.1f}s, uploading while scanning")
+            content_type, body = multipart_body(form_data, f"{output_name}_str_final.txt",
+                                                itertools.chain([first], chunks))
+            response = requests.post(url, data=body, headers={'Content-Type': content_type}, timeout=60)
+            response.raise_for_status()
+            result = response.json()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Upload failed: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Server response: {e.response.text}")
+            raise
+        finally:
+            stream.cancel()
+            producer.join()
+        
+        file_hash = stream.sha256.hexdigest()
+        logger.info(f"Generated and uploaded {stream.lines:,} lines ({stream.bytes_sent:,} bytes) in {time.monotonic() - start:.1f}s")
+        logger.info(f"Upload sha256: {file_hash}")
+        server_hash = result.get('metadata', {}).get('file_hash')
+        if server_hash and server_hash != file_hash:
+            logger.warning(f"Server recorded a different file hash: {server_hash}")
+        return result
+    
+    def upload_sketch(self, file_path: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Send only the MinHash sketch of a profile to /similarity_check_sketch
+        
+        Args:
+            file_path: Path to the STR profile to sketch
+            user_id: User identifier
+            
+        Returns:
+            Server response, or None when the server needs the full profile
+        """
+        sketch = sketch_file(file_path)
+        payload = json.dumps(sketch.to_dict())
+        url = f"{self.server_url}/similarity_check_sketch"
+        
+        profile_size = os.path.getsize(file_path)
+        if profile_size <= len(payload):
+            logger.info(f"Profile ({profile_size:,} bytes) is no larger than its sketch, uploading the profile")
+            return None
+        
+        logger.info(f"Sending profile sketch to {url}")
+        logger.info(f"Sketch: {sketch.records:,} records in {len(payload):,} bytes (profile: {profile_size:,} bytes)")
+        
+        try:
+            response = requests.post(url, data={'user_id': user_id, 'sketch': payload}, timeout=60)
+            if response.status_code == 404 and 'No stored verification' not in response.text:
+                logger.warning("Server does not accept sketches, uploading the full profile")
+                return None
+            response.raise_for_status()
+            result = response.json()
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Sketch upload failed: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Server response: {e.response.text}")
+            raise
+        
+        if result.get('full_profile_required'):
+            logger.info(f"Server requested the full profile: {result.get('reason')}")
+            return None
+        return result
+    
     def humanity_verification(self, vcf_file: str, user_id: str, 
                             external_kyc_document_id: str, output_name: str = None) -> Dict[str, Any]:
         """
@@ -181,22 +325,32 @@ class GenomeDevice:
         logger.info("HUMANITY VERIFICATION MODE")
         logger.info("=" * 60)
         
-        # Generate STR profile
-        str_file, summary_file = self.generate_str_profile(vcf_file, output_name)
-        
-        # Upload to server
-        response = self.upload_file(
-            str_file, 
-            'first_humanity_verification', 
-            user_id, 
-            external_kyc_document_id
-        )
+        if self.pipelined:
+            # Generate and upload the STR profile at the same time
+            response = self.pipelined_upload(
+                vcf_file,
+                'first_humanity_verification',
+                user_id,
+                external_kyc_document_id,
+                output_name
+            )
+        else:
+            # Generate STR profile
+            str_file, summary_file = self.generate_str_profile(vcf_file, output_name)
+            
+            # Upload to server
+            response = self.upload_file(
+                str_file, 
+                'first_humanity_verification', 
+                user_id, 
+                external_kyc_document_id
+            )
         
         logger.info("Humanity verification completed")
         return response
     
     def identity_confirmation(self, vcf_file: str, user_id: str, 
-                            output_name: str = None) -> Dict[str, Any]:
+                            output_name: str = None, sketch: bool = False) -> Dict[str, Any]:
         """
         Perform identity confirmation (similarity check)
         
@@ -204,6 +358,8 @@ class GenomeDevice:
             vcf_file: Path to VCF file
             user_id: User identifier
             output_name: Optional name for output files
+            sketch: Send a profile sketch first; the full profile is only
+                uploaded if the server cannot decide from the sketch
             
         Returns:
             Server response as dictionary
@@ -212,15 +368,24 @@ class GenomeDevice:
         logger.info("IDENTITY CONFIRMATION MODE")
         logger.info("=" * 60)
         
+        # A sketch needs the finished profile, so it is never pipelined
+        if self.pipelined and not sketch:
+            response = self.pipelined_upload(vcf_file, 'similarity_check', user_id, output_name=output_name)
+            logger.info("Identity confirmation completed")
+            return response
+        
         # Generate STR profile
         str_file, summary_file = self.generate_str_profile(vcf_file, output_name)
         
+        response = self.upload_sketch(str_file, user_id) if sketch else None
+        
         # Upload to server
-        response = self.upload_file(
-            str_file, 
-            'similarity_check', 
-            user_id
-        )
+        if response is None:
+            response = self.upload_file(
+                str_file, 
+                'similarity_check', 
+                user_id
+            )
         
         logger.info("Identity confirmation completed")
         return response
@@ -253,6 +418,12 @@ Examples:
   # Identity confirmation
   python device.py identity-confirmation genome.vcf.gz --user-id user123
   
+  # Identity confirmation sending only a profile sketch when it is conclusive
+  python device.py identity-confirmation genome.vcf.gz --user-id user123 --sketch
+  
+  # Upload the profile while it is being generated
+  python device.py humanity-verification genome.vcf.gz --user-id user123 --kyc-doc-id doc456 --pipelined
+  
   # Custom server URL
   python device.py humanity-verification genome.vcf.gz --user-id user123 --kyc-doc-id doc456 --server-url http://localhost:5000
         """
@@ -268,12 +439,30 @@ Examples:
                        help='Biometrics server URL')
     parser.add_argument('--check-health', action='store_true',
                        help='Check server health before proceeding')
+    parser.add_argument('--keep-intermediates', action='store_true',
+                       help='Keep the raw profile, indel VCF and variant type breakdown for debugging')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Generate the profile per chromosome on this many processes (0: one per core)')
+    parser.add_argument('--sort-memory', type=int, default=SORT_MEMORY_MB,
+                       help=f'MB of profile lines to sort in memory before spilling to disk (default: {SORT_MEMORY_MB})')
+    parser.add_argument('--output-dir',
+                       help='Also write the profile and summary here (default: upload from the profile cache)')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Regenerate the profile even if a cached one exists')
+    parser.add_argument('--sketch', action='store_true',
+                       help='Identity confirmation: send a few-KB profile sketch, uploading the profile only if the server asks')
+    parser.add_argument('--pipelined', action='store_true',
+                       help='Stream the profile to the server while the VCF is scanned')
+    add_quality_arguments(parser)
+    add_panel_arguments(parser)
     
     args = parser.parse_args()
     
     try:
         # Initialize device
-        device = GenomeDevice(args.server_url)
+        device = GenomeDevice(args.server_url, args.keep_intermediates, args.workers or os.cpu_count() or 1,
+                               args.sort_memory, not args.no_cache, args.output_dir,
+                               quality_filter_from_args(args), panel_from_args(args), args.pipelined)
         
         # Check server health if requested
         if args.check_health:
@@ -298,7 +487,8 @@ Examples:
             response = device.identity_confirmation(
                 args.vcf_file,
                 args.user_id,
-                args.output_name
+                args.output_name,
+                args.sketch
             )
         
         # Print results
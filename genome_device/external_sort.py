@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+External Sort
+Bounded-memory byte-order sort of STR profile lines: sorted runs are spilled
+to temporary files and k-way merged, and coordinate-sorted input is put in
+byte order by merging instead of sorting
+"""
+
+import os
+import heapq
+import shutil
+import logging
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SORT_MEMORY_MB = int(os.getenv("STR_SORT_MEMORY_MB", "256"))
+# Approximate per-line overhead of a bytes object held in a list
+LINE_OVERHEAD = 49
+# Runs merged at once; more runs are first merged into intermediate runs
+MERGE_FAN_IN = 64
+
+class _Run:
+    """A sorted run of lines, in memory until spilled to a file"""
+
+    def __init__(self):
+        self.lines: Optional[List[bytes]] = []
+        self.path: Optional[str] = None
+        self._file = None
+
+    def append(self, line: bytes):
+        if self._file is not None:
+            self._file.write(line + b'\n')
+        else:
+            self.lines.append(line)
+
+    def spill(self, tmp_dir: str, name: str, lines: Optional[Iterable[bytes]] = None):
+        """Move the run to a file, which stays open for appends until finish()"""
+        self.path = os.path.join(tmp_dir, name)
+        self._file = open(self.path, 'wb')
+        self._file.writelines(line + b'\n' for line in (self.lines if lines is None else lines))
+        self.lines = None
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.path is None:
+            yield from self.lines
+            return
+        with open(self.path, 'rb') as f:
+            for line in f:
+                yield line[:-1]
+
+class ProfileSorter:
+    """Sorts profile lines (CHROM<TAB>POS<TAB>...) into byte order within a memory cap
+
+    While the input is coordinate-sorted, each chromosome's lines are split
+    into runs by the digit count of POS; every such run is already in byte
+    order, so the output is a merge and nothing is sorted. Input that turns
+    out not to be coordinate-sorted is sorted in memory-capped runs. Either
+    way, in-memory data over the cap is spilled to files in tmp_dir (the
+    system temp directory by default).
+    """
+
+    def __init__(self, memory_mb: int = SORT_MEMORY_MB, tmp_dir: Optional[str] = None):
+        self.memory_limit = memory_mb * 1024 * 1024
+        self.tmp_root = tmp_dir
+        self.count = 0
+        self.coordinate_sorted = True
+        self.spilled_runs = 0
+        self._tmp_dir: Optional[str] = None
+        self._memory = 0
+        # Coordinate mode: (chrom, digits) -> run, and the pending equal-position group
+        self._chrom_runs: Dict[Tuple[bytes, int], _Run] = {}
+        self._finished_chroms = set()
+        self._chrom: Optional[bytes] = None
+        self._pos = -1
+        self._group: List[bytes] = []
+        # General mode: sorted runs and the unsorted buffer
+        self._runs: List[_Run] = []
+        self._buffer: List[bytes] = []
+        # Run files handed over by add_sorted_file(), removed on close()
+        self._adopted: List[str] = []
+
+    def __enter__(self) -> "ProfileSorter":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        for run in self._all_runs():
+            run.finish()
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+        for path in self._adopted:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        self._adopted = []
+
+    def add(self, line: bytes):
+        self.count += 1
+        self._memory += len(line) + LINE_OVERHEAD
+        if self.coordinate_sorted:
+            chrom, pos = line.split(b'\t', 2)[:2]
+            position = int(pos)
+            if chrom == self._chrom and position >= self._pos:
+                if position > self._pos:
+                    self._flush_group()
+                    self._pos = position
+                self._group.append(line)
+            elif chrom != self._chrom and chrom not in self._finished_chroms:
+                self._flush_group()
+                if self._chrom is not None:
+                    self._finished_chroms.add(self._chrom)
+                    for (run_chrom, _), run in self._chrom_runs.items():
+                        if run_chrom == self._chrom:
+                            run.finish()
+                self._chrom, self._pos = chrom, position
+                self._group.append(line)
+            else:
+                logger.info("Profile input is not coordinate-sorted; switching to an external sort")
+                self._leave_coordinate_mode()
+                self._buffer.append(line)
+        else:
+            self._buffer.append(line)
+
+        if self._memory > self.memory_limit:
+            self._spill()
+
+    def add_sorted_file(self, path: str, count: int):
+        """Take over a file of count lines already in byte order as one more sorted run
+
+        The file is merged, not read into memory, and is removed on close().
+        """
+        self._adopted.append(path)
+        if not count:
+            return
+        if self.coordinate_sorted:
+            self._leave_coordinate_mode()
+        run = _Run()
+        run.lines = None
+        run.path = path
+        self._runs.append(run)
+        self.count += count
+
+    def write_sorted(self, tmp_dir: Optional[str] = None, prefix: str = 'run_') -> str:
+        """Write all lines in byte order to a new file in tmp_dir and return its path; call once"""
+        fd, path = tempfile.mkstemp(prefix=prefix, suffix='.txt', dir=tmp_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.writelines(line + b'\n' for line in self.sorted_lines())
+        return path
+
+    def _flush_group(self):
+        if not self._group:
+            return
+        digits = len(self._group[0].split(b'\t', 2)[1])
+        run = self._chrom_runs.get((self._chrom, digits))
+        if run is None:
+            run = self._chrom_runs[(self._chrom, digits)] = _Run()
+        for line in sorted(self._group) if len(self._group) > 1 else self._group:
+            run.append(line)
+        self._group = []
+
+    def _leave_coordinate_mode(self):
+        # Coordinate runs are sorted runs like any other
+        self._flush_group()
+        for run in self._chrom_runs.values():
+            run.finish()
+        self._runs.extend(self._chrom_runs.values())
+        self._chrom_runs = {}
+        self.coordinate_sorted = False
+
+    def _new_run(self, lines: Iterable[bytes]) -> _Run:
+        """A closed run on disk holding lines, which must already be sorted"""
+        run = _Run()
+        run.spill(self._temp_dir(), self._run_name(), lines)
+        run.finish()
+        return run
+
+    def _temp_dir(self) -> str:
+        if self._tmp_dir is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix='str_sort_', dir=self.tmp_root)
+        return self._tmp_dir
+
+    def _run_name(self) -> str:
+        self.spilled_runs += 1
+        return f"run_{self.spilled_runs:06d}"
+
+    def _spill(self):
+        # The pending equal-position group stays in memory; it is small and unsorted
+        if not self.coordinate_sorted and self._buffer:
+            self._runs.append(self._new_run(sorted(self._buffer)))
+            self._buffer = []
+        for (chrom, _), run in self._chrom_runs.items():
+            if run.path is None and run.lines:
+                run.spill(self._temp_dir(), self._run_name())
+            # Only the current chromosome's runs are still appended to
+            if chrom != self._chrom:
+                run.finish()
+        for run in self._runs:
+            if run.path is None and run.lines:
+                run.spill(self._temp_dir(), self._run_name())
+                run.finish()
+        self._memory = 0
+
+    def _all_runs(self) -> List[_Run]:
+        return list(self._chrom_runs.values()) + self._runs
+
+    def sorted_lines(self) -> Iterator[bytes]:
+        """All lines in byte order; call once, after the last add()"""
+        if self.coordinate_sorted:
+            self._flush_group()
+        elif self._buffer:
+            run = _Run()
+            run.lines = sorted(self._buffer)
+            self._buffer = []
+            self._runs.append(run)
+        for run in self._all_runs():
+            run.finish()
+
+        if self.spilled_runs:
+            logger.info(f"Merging {self.spilled_runs} spilled sort runs")
+        if not self.coordinate_sorted:
+            runs = self._runs
+            while len(runs) > MERGE_FAN_IN:
+                runs = [self._new_run(heapq.merge(*runs[i:i + MERGE_FAN_IN]))
+                        for i in range(0, len(runs), MERGE_FAN_IN)]
+            yield from heapq.merge(*runs)
+            return
+
+        # A line starts with CHROM<TAB>, so chromosome blocks in this order are in byte order
+        by_chrom: Dict[bytes, List[_Run]] = {}
+        for (chrom, _), run in self._chrom_runs.items():
+            by_chrom.setdefault(chrom, []).append(run)
+        for chrom in sorted(by_chrom, key=lambda c: c + b'\t'):
+            runs = by_chrom[chrom]
+            yield from runs[0] if len(runs) == 1 else heapq.merge(*runs)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Locus Panel
+Restricts STR profiles to a fixed panel of loci read from a BED file, with a
+sorted-interval index that is probed while the VCF streams
+"""
+
+import bisect
+import hashlib
+import logging
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class PanelFormatError(ValueError):
+    """A BED file that cannot be used as a locus panel"""
+
+def _chrom_key(chrom: bytes) -> bytes:
+    # BED and VCF files disagree on whether chromosomes carry the 'chr' prefix
+    return chrom[3:] if chrom[:3].lower() == b'chr' else chrom
+
+class LocusPanel:
+    """Merged, sorted BED intervals per chromosome
+
+    contains() checks a 1-based VCF position against the 0-based half-open
+    BED intervals with one bisect. str() is the panel version, name@digest,
+    where the digest covers the merged intervals, so the same loci give the
+    same version whatever the BED file's order or formatting. It is written
+    to the profile header and is part of profile cache keys.
+    """
+
+    def __init__(self, name: str, intervals: Dict[bytes, List[Tuple[int, int]]]):
+        self.name = name
+        self._starts: Dict[bytes, List[int]] = {}
+        self._ends: Dict[bytes, List[int]] = {}
+        digest = hashlib.sha256()
+        for chrom in sorted(intervals):
+            merged: List[Tuple[int, int]] = []
+            for start, end in sorted(intervals[chrom]):
+                if merged and start <= merged[-1][1]:
+                    merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+                else:
+                    merged.append((start, end))
+            self._starts[chrom] = [start for start, _ in merged]
+            self._ends[chrom] = [end for _, end in merged]
+            for start, end in merged:
+                digest.update(b'%s\t%d\t%d\n' % (chrom, start, end))
+        self.digest = digest.hexdigest()[:12]
+        self.loci = sum(len(starts) for starts in self._starts.values())
+        self.bases = sum(end - start for chrom in self._starts
+                         for start, end in zip(self._starts[chrom], self._ends[chrom]))
+        self._last_chrom: Optional[bytes] = None
+        self._last: Tuple[List[int], List[int]] = ([], [])
+
+    @classmethod
+    def from_bed(cls, path: str, name: Optional[str] = None) -> "LocusPanel":
+        """Read CHROM, START and END from each BED line; track, browser and # lines are skipped"""
+        intervals: Dict[bytes, List[Tuple[int, int]]] = {}
+        with open(path, 'rb') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip() or line.startswith((b'#', b'track', b'browser')):
+                    continue
+                fields = line.split()
+                try:
+                    start, end = int(fields[1]), int(fields[2])
+                except (IndexError, ValueError):
+                    raise PanelFormatError(f"{path}:{line_number}: expected CHROM START END")
+                if start < 0 or end <= start:
+                    raise PanelFormatError(f"{path}:{line_number}: invalid interval {start}-{end}")
+                intervals.setdefault(_chrom_key(fields[0]), []).append((start, end))
+        if not intervals:
+            raise PanelFormatError(f"{path}: no intervals found")
+        return cls(name or Path(path).name.split('.')[0], intervals)
+
+    def __str__(self) -> str:
+        return f"{self.name}@{self.digest}"
+
+    def contains(self, chrom: bytes, pos: int) -> bool:
+        if chrom != self._last_chrom:
+            key = _chrom_key(chrom)
+            self._last_chrom = chrom
+            self._last = (self._starts.get(key, []), self._ends.get(key, []))
+        starts, ends = self._last
+        i = bisect.bisect_left(starts, pos) - 1
+        return i >= 0 and pos <= ends[i]
+
+    def __getstate__(self):
+        # The lookup cache is per process
+        state = dict(self.__dict__)
+        state['_last_chrom'], state['_last'] = None, ([], [])
+        return state
+
+def main():
+    """Print the version of a BED locus panel"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)-8s | %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Locus Panel - BED panel versions",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Show the version written to profile headers for this panel
+  python locus_panel.py str_panel_v2.bed
+        """
+    )
+    parser.add_argument('bed_file', help='BED file of panel loci')
+    parser.add_argument('--panel-name', help='Panel name (default: BED file name)')
+    args = parser.parse_args()
+
+    panel = LocusPanel.from_bed(args.bed_file, args.panel_name)
+    print(f"Panel: {panel}")
+    print(f"Loci: {panel.loci:,} merged intervals covering {panel.bases:,} bp")
+
+if __name__ == "__main__":
+    main()
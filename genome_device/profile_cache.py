@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Profile Cache
+Content-addressed cache of generated STR profiles, keyed by the VCF's sha256,
+the pipeline version and the generation settings, with size-bounded LRU eviction
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import argparse
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from str_pipeline import PIPELINE_VERSION, PipelineResult, generate_profile
+from external_sort import SORT_MEMORY_MB
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("STR_PROFILE_CACHE_DIR", str(Path.home() / ".cache" / "genome_device" / "profiles")))
+CACHE_MAX_MB = int(os.getenv("STR_PROFILE_CACHE_MB", "512"))
+HASH_CHUNK_SIZE = 1024 * 1024
+ENTRY_NAME = "profile"
+META_FILE = "meta.json"
+HASHES_FILE = "vcf_hashes.json"
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ProfileCache:
+    """Generated profiles stored under cache_dir/<key>/
+
+    The key covers everything the profile content depends on: the VCF bytes,
+    PIPELINE_VERSION and the settings passed to generate_profile that change
+    its output. Worker count and sort memory do not, so they are not part of
+    it. Each use refreshes an entry's mtime; once the cache grows past
+    max_mb the least recently used entries are removed.
+    """
+
+    def __init__(self, cache_dir: Path = CACHE_DIR, max_mb: int = CACHE_MAX_MB):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_mb * 1024 * 1024
+
+    def vcf_hash(self, vcf_file: str) -> str:
+        """sha256 of the VCF, remembered per path until its size or mtime changes"""
+        stat = os.stat(vcf_file)
+        path = os.path.abspath(vcf_file)
+        hashes_path = self.cache_dir / HASHES_FILE
+        try:
+            with open(hashes_path) as f:
+                hashes = json.load(f)
+        except (OSError, ValueError):
+            hashes = {}
+        known = hashes.get(path)
+        if known and known['size'] == stat.st_size and known['mtime_ns'] == stat.st_mtime_ns:
+            return known['sha256']
+
+        logger.info(f"Hashing {vcf_file}")
+        digest = sha256_file(vcf_file)
+        hashes = {known_path: h for known_path, h in hashes.items() if os.path.exists(known_path)}
+        hashes[path] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest}
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.hashes.', dir=self.cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(hashes, f)
+            os.replace(tmp_path, hashes_path)
+        except OSError as e:
+            logger.warning(f"Could not record VCF hash: {e}")
+        return digest
+
+    def key(self, vcf_file: str, settings: Optional[Dict[str, str]] = None) -> str:
+        material = json.dumps({'vcf_sha256': self.vcf_hash(vcf_file), 'pipeline': PIPELINE_VERSION,
+                               'settings': settings or {}}, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _result(self, entry: Path) -> PipelineResult:
+        with open(entry / META_FILE) as f:
+            meta = json.load(f)
+        return PipelineResult(str(entry / f"{ENTRY_NAME}_str_final.txt"),
+                              str(entry / f"{ENTRY_NAME}_profile_summary.txt"),
+                              meta['total_variants'], meta['indel_count'], meta['profile_lines'],
+                              meta['variant_types'], meta.get('filtered_records', 0))
+
+    def get(self, key: str) -> Optional[PipelineResult]:
+        entry = self.cache_dir / key
+        try:
+            result = self._result(entry)
+        except (OSError, ValueError, KeyError):
+            # An entry left incomplete by a crash is regenerated
+            if entry.exists():
+                shutil.rmtree(entry, ignore_errors=True)
+            return None
+        os.utime(entry)
+        return result
+
+    def _settings_key(self, vcf_file: str, settings: Dict[str, Any]):
+        described = {name: str(value) for name, value in settings.items() if value is not None}
+        return self.key(vcf_file, described), described
+
+    def lookup(self, vcf_file: str, **settings) -> Optional[PipelineResult]:
+        """The cached profile for vcf_file and settings, or None without generating it"""
+        return self.get(self._settings_key(vcf_file, settings)[0])
+
+    def generate(self, vcf_file: str, workers: int = 1, sort_memory_mb: int = SORT_MEMORY_MB,
+                 sink: Optional[Callable[[bytes], None]] = None, **settings) -> PipelineResult:
+        """The cached profile for vcf_file, generating and storing it on a miss
+
+        settings (quality_filter, panel) are passed to generate_profile and their
+        str() is part of the key; workers, sort_memory_mb and sink are not.
+        sink only sees profile lines when the profile is generated.
+        """
+        key, described = self._settings_key(vcf_file, settings)
+        result = self.get(key)
+        if result is not None:
+            logger.info(f"Using cached STR profile {key[:12]}")
+            return result
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_entry = Path(tempfile.mkdtemp(prefix=f".{key}.", dir=self.cache_dir))
+        entry = self.cache_dir / key
+        try:
+            result = generate_profile(vcf_file, ENTRY_NAME, str(tmp_entry), workers=workers,
+                                      sort_memory_mb=sort_memory_mb, sink=sink, **settings)
+            with open(tmp_entry / META_FILE, 'w') as f:
+                json.dump({'vcf_file': os.path.abspath(vcf_file), 'pipeline': PIPELINE_VERSION,
+                           'settings': described, **result.to_dict()}, f)
+            try:
+                os.replace(tmp_entry, entry)
+            except OSError:
+                # Another process stored the same profile first
+                logger.info(f"STR profile {key[:12]} was cached concurrently")
+        finally:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+        self.evict(keep=key)
+        return self._result(entry)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Cache entries, least recently used first"""
+        entries = []
+        if not self.cache_dir.exists():
+            return entries
+        for entry in self.cache_dir.iterdir():
+            if not entry.is_dir() or entry.name.startswith('.'):
+                continue
+            size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+            entries.append({'key': entry.name, 'bytes': size, 'last_used': entry.stat().st_mtime})
+        return sorted(entries, key=lambda e: e['last_used'])
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """Remove least recently used entries until the cache fits in max_bytes"""
+        entries = self.entries()
+        total = sum(e['bytes'] for e in entries)
+        removed = 0
+        for e in entries:
+            if total <= self.max_bytes:
+                break
+            if e['key'] == keep:
+                continue
+            shutil.rmtree(self.cache_dir / e['key'], ignore_errors=True)
+            total -= e['bytes']
+            removed += 1
+        if removed:
+            logger.info(f"Evicted {removed} cached STR profiles")
+        return removed
+
+    def clear(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+def main():
+    """Inspect or clear the profile cache"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)-8s | %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    parser = argparse.ArgumentParser(
+        description="Profile Cache - cached STR profiles",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # List cached profiles, least recently used first
+  python profile_cache.py
+
+  # Remove every cached profile
+  python profile_cache.py --clear
+        """
+    )
+    parser.add_argument('--clear', action='store_true', help='Remove every cached profile')
+    args = parser.parse_args()
+
+    cache = ProfileCache()
+    if args.clear:
+        cache.clear()
+        print(f"Cleared {cache.cache_dir}")
+        return
+    entries = cache.entries()
+    for e in entries:
+        print(f"{e['key'][:12]}  {e['bytes'] / 1e6:>8.1f} MB")
+    print(f"{len(entries)} profiles, {sum(e['bytes'] for e in entries) / 1e6:.1f} MB in {cache.cache_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Profile Sketch
+One-permutation b-bit MinHash of an STR profile's (CHROM, POS, REF, ALT)
+records, small enough to confirm an identity without the full profile
+
+The hashing must match biometrics_server/profile_sketch.py exactly; change both
+files and SKETCH_VERSION together. Every sketch carries SKETCH_FINGERPRINT,
+the sketch of a fixed set of records, so a copy whose hashing has drifted
+is refused instead of compared.
+"""
+
+import math
+import base64
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple
+
+# Bump whenever the hashing or layout changes; sketches of different versions are never compared
+SKETCH_VERSION = "oph-b8/1"
+SKETCH_BINS = 4096
+SKETCH_BITS = 8
+
+_PERSON = b'humanid-sketch'
+_BIN_BITS = SKETCH_BINS.bit_length() - 1
+_VALUE_MASK = (1 << SKETCH_BITS) - 1
+_EMPTY = 1 << 64
+
+class SketchFormatError(ValueError):
+    """A sketch that cannot be read or compared"""
+
+class ProfileSketch:
+    """The minimum hash per bin of every (locus, allele) record of a profile
+
+    Each record is hashed once with BLAKE2b; the low bits pick one of
+    SKETCH_BINS bins and the bin keeps the smallest remaining hash. Only the
+    lowest SKETCH_BITS bits of each minimum are kept, so the sketch is a few
+    KB whatever the profile size. Multi-allelic ALTs count one record per
+    allele, as in the kinship engine.
+    """
+
+    def __init__(self, panel: Optional[str] = None, records: int = 0,
+                 values: Optional[List[Optional[int]]] = None):
+        self.panel = panel
+        self.records = records
+        self._minima: Optional[List[int]] = None
+        if values is None:
+            self._minima = [_EMPTY] * SKETCH_BINS
+        self._values = values
+
+    def add(self, fields: List[bytes]):
+        """Add one profile record split into fields; usable as a ProfileParser sink"""
+        minima = self._minima
+        prefix = b'\t'.join(fields[:3]) + b'\t'
+        for allele in fields[3].split(b','):
+            h = int.from_bytes(hashlib.blake2b(prefix + allele, digest_size=8, person=_PERSON).digest(), 'little')
+            value = h >> _BIN_BITS
+            index = h & (SKETCH_BINS - 1)
+            if value < minima[index]:
+                minima[index] = value
+            self.records += 1
+
+    def add_line(self, line: bytes):
+        """Add one profile line; header, blank and malformed lines are skipped"""
+        line = line.rstrip(b'\r\n')
+        if not line or line[0] == 0x23:  # '#'
+            return
+        fields = line.split(b'\t', 4)
+        if len(fields) >= 4 and fields[1].isdigit():
+            self.add(fields)
+
+    @property
+    def values(self) -> List[Optional[int]]:
+        """The b-bit minimum per bin, None for bins no record fell into"""
+        if self._values is None:
+            return [None if m == _EMPTY else m & _VALUE_MASK for m in self._minima]
+        return self._values
+
+    def to_dict(self, fingerprint: bool = True) -> Dict[str, Any]:
+        values = self.values
+        empty = bytearray(SKETCH_BINS // 8)
+        for index, value in enumerate(values):
+            if value is None:
+                empty[index >> 3] |= 1 << (index & 7)
+        return {
+            'version': SKETCH_VERSION,
+            'bins': SKETCH_BINS,
+            'records': self.records,
+            'panel': self.panel,
+            'values': base64.b64encode(bytes(v or 0 for v in values)).decode('ascii'),
+            'empty': base64.b64encode(bytes(empty)).decode('ascii'),
+            'fingerprint': SKETCH_FINGERPRINT if fingerprint else None
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ProfileSketch":
+        if not isinstance(data, dict):
+            raise SketchFormatError("sketch must be a JSON object")
+        if data.get('version') != SKETCH_VERSION or data.get('bins') != SKETCH_BINS:
+            raise SketchFormatError(f"unsupported sketch version {data.get('version')} "
+                                    f"({data.get('bins')} bins), expected {SKETCH_VERSION}")
+        if data.get('fingerprint') != SKETCH_FINGERPRINT:
+            raise SketchFormatError(f"sketch fingerprint {data.get('fingerprint')} does not match "
+                                    f"{SKETCH_FINGERPRINT}; the two profile_sketch.py copies have drifted")
+        try:
+            raw = base64.b64decode(data['values'], validate=True)
+            empty = base64.b64decode(data['empty'], validate=True)
+            records = int(data.get('records', 0))
+        except (KeyError, TypeError, ValueError):
+            raise SketchFormatError("sketch values are not valid base64")
+        if len(raw) != SKETCH_BINS or len(empty) != SKETCH_BINS // 8:
+            raise SketchFormatError(f"sketch must have {SKETCH_BINS} bins")
+        values = [None if empty[i >> 3] & (1 << (i & 7)) else raw[i] for i in range(SKETCH_BINS)]
+        return cls(data.get('panel') or None, records, values)
+
+def _fingerprint() -> str:
+    """Digest of the sketch of fixed records; differs whenever hashing or binning differ"""
+    sketch = ProfileSketch()
+    for index in range(1, 257):
+        sketch.add([b'chr%d' % (index % 23 + 1), b'%d' % (index * 7919), b'A', b'AT,ATT'])
+    return hashlib.blake2b(sketch.to_dict(fingerprint=False)['values'].encode('ascii'),
+                           digest_size=8).hexdigest()
+
+def estimate_similarity(a: ProfileSketch, b: ProfileSketch) -> Tuple[float, float]:
+    """Estimated Jaccard similarity of two profiles' records and its standard error
+
+    A bin empty in both sketches carries no information; one empty in only
+    one sketch is a mismatch. Equal b-bit values also match by chance with
+    probability 2^-b, which is corrected for. The standard error uses the
+    add-one match rate, so sketches of a few records are never certain.
+    """
+    informative = matches = 0
+    for x, y in zip(a.values, b.values):
+        if x is None and y is None:
+            continue
+        informative += 1
+        if x is not None and x == y:
+            matches += 1
+    if informative == 0:
+        return 0.0, 1.0
+    chance = 1.0 / (1 << SKETCH_BITS)
+    p = matches / informative
+    similarity = min(1.0, max(0.0, (p - chance) / (1.0 - chance)))
+    smoothed = (matches + 1) / (informative + 2)
+    stderr = math.sqrt(smoothed * (1.0 - smoothed) / informative) / (1.0 - chance)
+    return similarity, stderr
+
+def sketch_file(path: str) -> ProfileSketch:
+    """Sketch a profile file, taking its panel from the '# Panel:' header line"""
+    sketch = ProfileSketch()
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.startswith(b'# Panel:'):
+                panel = line[len(b'# Panel:'):].strip().decode('utf-8', 'replace')
+                sketch.panel = panel if panel and panel != 'none' else None
+            else:
+                sketch.add_line(line)
+    return sketch
+
+SKETCH_FINGERPRINT = _fingerprint()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Profile Stream
+Hands profile lines from the generating thread to a streaming upload body
+while the VCF is scanned, hashing exactly the bytes that are sent
+"""
+
+import os
+import uuid
+import queue
+import hashlib
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, Optional, Tuple
+
+from str_pipeline import format_number
+from quality_filter import QualityFilter
+from locus_panel import LocusPanel
+
+# Lines are sent in chunks of this size; at most STREAM_QUEUE_CHUNKS chunks
+# wait for the network, so a slow upload pauses generation instead of
+# buffering the profile in memory
+STREAM_CHUNK_SIZE = 256 * 1024
+STREAM_QUEUE_CHUNKS = int(os.getenv("STR_STREAM_QUEUE_CHUNKS", "64"))
+
+_END = object()
+
+class StreamCancelled(Exception):
+    """The upload stopped reading the stream"""
+
+def stream_header(vcf_file: str, quality_filter: Optional[QualityFilter] = None,
+                  panel: Optional[LocusPanel] = None) -> bytes:
+    """The profile header lines known before the VCF is read"""
+    return (
+        "# STR Profile File (streamed)\n"
+        f"# Generated: {datetime.now().ctime()}\n"
+        f"# Source VCF: {vcf_file}\n"
+        f"# Quality Filter: {quality_filter or 'none'}\n"
+        f"# Panel: {panel or 'none'}\n"
+        "# Format: CHROM<TAB>POS<TAB>REF<TAB>ALT\n"
+        "# =============================================================================\n"
+    ).encode('utf-8')
+
+def stream_trailer(total_variants: int, profile_lines: int) -> bytes:
+    """The counts a streamed profile can only give after its last line"""
+    return (
+        f"# Total Variants: {format_number(total_variants)}\n"
+        f"# STR Entries: {format_number(profile_lines)}\n"
+    ).encode('utf-8')
+
+class ProfileStream:
+    """A bounded queue of profile chunks between one producer and one consumer
+
+    The producer calls add_line() for each profile line and finish() or
+    fail() once; the consumer iterates chunks(). Lines go out in the order
+    generate_profile's sink receives them, not sorted; the server accepts
+    either. sha256 and bytes_sent cover what the consumer has taken, so
+    once chunks() is exhausted they describe the uploaded file.
+    """
+
+    def __init__(self, header: bytes, chunk_size: int = STREAM_CHUNK_SIZE,
+                 max_chunks: int = STREAM_QUEUE_CHUNKS):
+        self.chunk_size = chunk_size
+        self.lines = 0
+        self.sha256 = hashlib.sha256()
+        self.bytes_sent = 0
+        self._queue: queue.Queue = queue.Queue(max_chunks)
+        self._buffer = [header]
+        self._buffered = len(header)
+        self._cancelled = threading.Event()
+
+    def add_line(self, line: bytes):
+        self._buffer.append(line + b'\n')
+        self._buffered += len(line) + 1
+        self.lines += 1
+        if self._buffered >= self.chunk_size:
+            self._flush()
+
+    def finish(self, trailer: bytes = b''):
+        if trailer:
+            self._buffer.append(trailer)
+        self._flush()
+        self._put(_END)
+
+    def fail(self, error: BaseException):
+        """End the stream with an error, which chunks() raises to the consumer"""
+        try:
+            self._put(error)
+        except StreamCancelled:
+            pass
+
+    def cancel(self):
+        """Stop the producer at its next chunk; used when the upload ends early"""
+        self._cancelled.set()
+
+    def chunks(self) -> Iterator[bytes]:
+        while True:
+            item = self._queue.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            self.sha256.update(item)
+            self.bytes_sent += len(item)
+            yield item
+
+    def _flush(self):
+        chunk = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if chunk:
+            self._put(chunk)
+
+    def _put(self, item):
+        while not self._cancelled.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise StreamCancelled("profile upload was abandoned")
+
+def multipart_body(fields: Dict[str, str], filename: str,
+                   chunks: Iterator[bytes]) -> Tuple[str, Iterator[bytes]]:
+    """A multipart/form-data body whose file part is read from chunks as it is sent
+
+    Returns (content type, body iterator); passed to requests as data, the
+    body goes out with chunked transfer encoding.
+    """
+    boundary = uuid.uuid4().hex
+
+    def body() -> Iterator[bytes]:
+        for name, value in fields.items():
+            yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                   f'{value}\r\n').encode('utf-8')
+        yield (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+               'Content-Type: text/plain\r\n\r\n').encode('utf-8')
+        yield from chunks
+        yield f'\r\n--{boundary}--\r\n'.encode('utf-8')
+
+    return f'multipart/form-data; boundary={boundary}', body()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Quality Filter
+Drops low-confidence VCF records (QUAL, FILTER, DP, GQ) before they reach
+the STR profile
+"""
+
+from typing import List, Optional
+
+class QualityFilter:
+    """Per-record thresholds; a threshold left as None is not checked
+
+    A record whose value is missing ('.' or absent) fails the threshold for
+    that value. DP is read from the first sample's FORMAT DP, falling back to
+    INFO DP; GQ only exists per sample. str() is the canonical description
+    written to the profile header and used in profile cache keys.
+    """
+
+    def __init__(self, min_qual: Optional[float] = None, pass_only: bool = False,
+                 min_dp: Optional[int] = None, min_gq: Optional[int] = None):
+        self.min_qual = min_qual
+        self.pass_only = pass_only
+        self.min_dp = min_dp
+        self.min_gq = min_gq
+
+    @property
+    def active(self) -> bool:
+        return self.min_qual is not None or self.pass_only or self.min_dp is not None or self.min_gq is not None
+
+    @property
+    def maxsplit(self) -> int:
+        """How far records must be split: through the first sample column when DP or GQ is checked"""
+        return 10 if self.min_dp is not None or self.min_gq is not None else 8
+
+    def __str__(self) -> str:
+        if not self.active:
+            return "none"
+        parts = []
+        if self.min_qual is not None:
+            parts.append(f"QUAL>={self.min_qual:g}")
+        if self.pass_only:
+            parts.append("FILTER=PASS")
+        if self.min_dp is not None:
+            parts.append(f"DP>={self.min_dp}")
+        if self.min_gq is not None:
+            parts.append(f"GQ>={self.min_gq}")
+        return " ".join(parts)
+
+    def reject_reason(self, fields: List[bytes]) -> Optional[str]:
+        """The first threshold the record fails (QUAL, FILTER, DP or GQ), or None when it passes"""
+        if self.min_qual is not None and not _at_least(_field(fields, 5), self.min_qual):
+            return 'QUAL'
+        if self.pass_only and _field(fields, 6) not in (b'PASS', b'.'):
+            return 'FILTER'
+        if self.min_dp is None and self.min_gq is None:
+            return None
+
+        keys = _field(fields, 8).split(b':')
+        values = _field(fields, 9).split(b':')
+        sample = dict(zip(keys, values))
+        if self.min_dp is not None:
+            dp = sample.get(b'DP')
+            if dp in (None, b'', b'.'):
+                dp = _info_value(_field(fields, 7), b'DP')
+            if not _at_least(dp, self.min_dp):
+                return 'DP'
+        if self.min_gq is not None and not _at_least(sample.get(b'GQ'), self.min_gq):
+            return 'GQ'
+        return None
+
+def _field(fields: List[bytes], index: int) -> bytes:
+    return fields[index] if len(fields) > index else b''
+
+def _at_least(value: Optional[bytes], threshold: float) -> bool:
+    try:
+        return float(value) >= threshold
+    except (TypeError, ValueError):
+        return False
+
+def _info_value(info: bytes, key: bytes) -> Optional[bytes]:
+    prefix = key + b'='
+    for entry in info.split(b';'):
+        if entry.startswith(prefix):
+            return entry[len(prefix):]
+    return None
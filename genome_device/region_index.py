@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Region Index
+Splits a VCF into per-chromosome regions for parallel profile generation,
+using a tabix/CSI index for compressed input and a cached byte-offset index
+for plain VCF
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import subprocess
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Plain-VCF regions are cut at line boundaries roughly every REGION_BYTES
+REGION_BYTES = int(os.getenv("STR_REGION_BYTES", str(32 * 1024 * 1024)))
+INDEX_CACHE_DIR = Path(os.getenv("STR_INDEX_CACHE_DIR", str(Path.home() / ".cache" / "genome_device" / "index")))
+INDEX_VERSION = 1
+
+class Region(NamedTuple):
+    """A slice of a VCF: a byte range of a plain file, or a chromosome read through an index tool"""
+    chrom: str
+    start: int = 0
+    end: int = 0
+    tool: str = ''
+
+def _index_tool() -> Optional[str]:
+    for tool in ('bcftools', 'tabix'):
+        if shutil.which(tool):
+            return tool
+    return None
+
+def _ensure_tool_index(path: str, tool: str):
+    """Build the .csi/.tbi index next to the VCF unless one already exists"""
+    if os.path.exists(path + '.csi') or os.path.exists(path + '.tbi'):
+        return
+    logger.info(f"Indexing {path} with {tool}")
+    cmd = ['bcftools', 'index', path] if tool == 'bcftools' else ['tabix', '-p', 'vcf', path]
+    subprocess.run(cmd, check=True, capture_output=True)
+
+def _tool_regions(path: str, tool: str) -> List[Region]:
+    _ensure_tool_index(path, tool)
+    cmd = ['bcftools', 'index', '-s', path] if tool == 'bcftools' else ['tabix', '-l', path]
+    output = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return [Region(line.split('\t')[0], tool=tool) for line in output.splitlines() if line]
+
+def _cache_path(path: str) -> Path:
+    return INDEX_CACHE_DIR / (hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[:24] + '.json')
+
+def build_offset_index(path: str, region_bytes: int = REGION_BYTES) -> List[Region]:
+    """Scan a plain VCF once and cut it into chromosome-homogeneous byte ranges"""
+    regions: List[Region] = []
+    chrom, start, offset = None, 0, 0
+    with open(path, 'rb') as f:
+        for line in f:
+            if line[:1] != b'#':
+                line_chrom = line.split(b'\t', 1)[0].decode('utf-8', 'replace')
+                if line_chrom != chrom or offset - start >= region_bytes:
+                    if chrom is not None:
+                        regions.append(Region(chrom, start, offset))
+                    chrom, start = line_chrom, offset
+            elif chrom is not None:
+                # Comment lines after the header end the current region
+                regions.append(Region(chrom, start, offset))
+                chrom = None
+            offset += len(line)
+    if chrom is not None:
+        regions.append(Region(chrom, start, offset))
+    return regions
+
+def load_offset_index(path: str, region_bytes: int = REGION_BYTES) -> List[Region]:
+    """The byte-offset index of a plain VCF, built once and cached until the file changes"""
+    stat = os.stat(path)
+    key = {'version': INDEX_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+           'region_bytes': region_bytes}
+    cache_path = _cache_path(path)
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached['key'] == key:
+            return [Region(*region) for region in cached['regions']]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    logger.info(f"Building region index for {path}")
+    regions = build_offset_index(path, region_bytes)
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = cache_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': key, 'regions': [list(region) for region in regions]}, f)
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        logger.warning(f"Could not cache region index: {e}")
+    return regions
+
+def plan_regions(path: str) -> Optional[List[Region]]:
+    """Regions covering every record of the VCF, or None when it cannot be split"""
+    with open(path, 'rb') as f:
+        magic = f.read(3)
+    if magic[:2] == b'\x1f\x8b' or magic == b'BCF':
+        tool = _index_tool()
+        if tool is None:
+            logger.warning("Neither bcftools nor tabix is installed; compressed input is processed sequentially")
+            return None
+        if tool == 'tabix' and magic == b'BCF':
+            return None
+        try:
+            return _tool_regions(path, tool)
+        except subprocess.CalledProcessError as e:
+            # Plain gzip (not BGZF) and unsorted input cannot be indexed
+            logger.warning(f"Could not index {path}: {(e.stderr or b'').decode('utf-8', 'replace').strip()}")
+            return None
+    return load_offset_index(path)
+
+@contextmanager
+def open_region(path: str, region: Region) -> Iterator[Iterator[bytes]]:
+    """Stream the record lines of one region"""
+    if not region.tool:
+        with open(path, 'rb') as f:
+            f.seek(region.start)
+            yield _read_range(f, region.end - region.start)
+        return
+
+    if region.tool == 'bcftools':
+        cmd = ['bcftools', 'view', '-H', '-Ov', '-r', region.chrom, path]
+    else:
+        cmd = ['tabix', path, region.chrom]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        yield process.stdout
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"{region.tool} failed for {region.chrom}: {stderr.decode('utf-8', 'replace').strip()}")
+
+def _read_range(f: BinaryIO, length: int) -> Iterator[bytes]:
+    while length > 0:
+        line = f.readline()
+        if not line:
+            return
+        length -= len(line)
+        yield line
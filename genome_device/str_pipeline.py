@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+"""
+STR Profile Pipeline
+Single-pass, streaming VCF-to-STR-profile generation: reads .vcf, .vcf.gz or
+BCF once and writes only the final profile and its summary
+"""
+
+import os
+import sys
+import gzip
+import logging
+import argparse
+import subprocess
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, ExitStack
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, BinaryIO
+
+from bgzf import is_bgzf, open_bgzf
+from external_sort import ProfileSorter, SORT_MEMORY_MB
+from region_index import Region, plan_regions, open_region
+from workspace import job_workspace, publish
+from quality_filter import QualityFilter
+from locus_panel import LocusPanel
+
+logger = logging.getLogger(__name__)
+
+# Bump when the profile content for a given VCF changes
+PIPELINE_VERSION = "str-pipeline/1"
+
+GZIP_MAGIC = b'\x1f\x8b'
+BCF_MAGIC = b'BCF'
+
+@contextmanager
+def open_vcf(path: str) -> Iterator[BinaryIO]:
+    """Open a VCF as a binary line stream
+
+    Plain and gzip-compressed VCF are read directly, BGZF with blocks
+    inflated on a thread pool; BCF is binary and is decoded by a
+    `bcftools view` pipe, so nothing is written to disk.
+    """
+    with open(path, 'rb') as probe:
+        magic = probe.read(3)
+    if magic[:2] == GZIP_MAGIC:
+        with (open_bgzf(path) if is_bgzf(path) else gzip.open(path, 'rb')) as f:
+            if f.peek(3)[:3] != BCF_MAGIC:
+                yield f
+                return
+    elif magic != BCF_MAGIC:
+        with open(path, 'rb') as f:
+            yield f
+        return
+
+    try:
+        process = subprocess.Popen(['bcftools', 'view', '-Ov', path],
+                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError("bcftools is required to read BCF input")
+    try:
+        yield process.stdout
+    finally:
+        process.stdout.close()
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise RuntimeError(f"bcftools view failed: {stderr.decode('utf-8', 'replace').strip()}")
+
+def variant_type(ref: bytes, alts: List[bytes]) -> str:
+    """bcftools-style TYPE of a record: SNP, MNP, INDEL, OTHER or REF, comma-joined when mixed"""
+    types = set()
+    for alt in alts:
+        if alt in (b'.', b'*') or alt == ref:
+            continue
+        if alt.startswith(b'<') or not alt.isalpha():
+            types.add('OTHER')
+        elif len(alt) != len(ref):
+            types.add('INDEL')
+        elif len(ref) == 1:
+            types.add('SNP')
+        else:
+            types.add('MNP')
+    if not types:
+        return 'REF'
+    return ','.join(t for t in ('SNP', 'MNP', 'INDEL', 'OTHER') if t in types)
+
+class PipelineResult:
+    """Outputs and statistics of one profile generation run"""
+
+    def __init__(self, final_path: str, summary_path: str, total_variants: int,
+                 indel_count: int, profile_lines: int, variant_types: Dict[str, int],
+                 filtered_records: int = 0):
+        self.final_path = final_path
+        self.summary_path = summary_path
+        self.total_variants = total_variants
+        self.indel_count = indel_count
+        self.profile_lines = profile_lines
+        self.variant_types = variant_types
+        self.filtered_records = filtered_records
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'final_path': self.final_path,
+            'summary_path': self.summary_path,
+            'total_variants': self.total_variants,
+            'indel_count': self.indel_count,
+            'profile_lines': self.profile_lines,
+            'variant_types': self.variant_types,
+            'filtered_records': self.filtered_records
+        }
+
+class ProfileBuilder:
+    """Collects indel profile lines and variant-type counts from VCF records
+
+    As in generate_str_profile.sh, a VCF without any indel falls back to a
+    profile of all variants; those lines are only kept until the first indel.
+    Lines are held by a ProfileSorter, so memory stays under sort_memory_mb;
+    sort runs are spilled to tmp_dir. Records outside panel or failing
+    quality_filter are counted in variant_types but kept out of the profile.
+    """
+
+    def __init__(self, sort_memory_mb: int = SORT_MEMORY_MB, tmp_dir: Optional[str] = None,
+                 quality_filter: Optional[QualityFilter] = None, panel: Optional[LocusPanel] = None):
+        self.total_variants = 0
+        self.variant_types: Counter = Counter()
+        self.panel = panel
+        self.off_panel = 0
+        self.quality_filter = quality_filter if quality_filter is not None and quality_filter.active else None
+        self.maxsplit = self.quality_filter.maxsplit if self.quality_filter else 8
+        # Records rejected per threshold, and the indel lines (and bytes) they would have added
+        self.filtered: Counter = Counter()
+        self.filtered_indels = 0
+        self.filtered_bytes = 0
+        self.tmp_dir = tmp_dir
+        self._indels = ProfileSorter(sort_memory_mb, tmp_dir)
+        self._fallback: Optional[ProfileSorter] = ProfileSorter(sort_memory_mb, tmp_dir)
+
+    @property
+    def indel_count(self) -> int:
+        return self._indels.count
+
+    def add(self, fields: List[bytes]) -> Optional[bytes]:
+        """Count one record; returns its profile line when it is an indel"""
+        self.total_variants += 1
+        ref, alts = fields[3], fields[4].split(b',')
+        vtype = variant_type(ref, alts)
+        self.variant_types[vtype] += 1
+        if self.panel is not None and not (fields[1].isdigit() and self.panel.contains(fields[0], int(fields[1]))):
+            self.off_panel += 1
+            return None
+        line = b'\t'.join((fields[0], fields[1], ref, fields[4]))
+        if self.quality_filter is not None:
+            reason = self.quality_filter.reject_reason(fields)
+            if reason is not None:
+                self.filtered[reason] += 1
+                if 'INDEL' in vtype:
+                    self.filtered_indels += 1
+                    self.filtered_bytes += len(line) + 1
+                return None
+        if 'INDEL' in vtype:
+            self._indels.add(line)
+            if self._fallback is not None:
+                self._fallback.close()
+                self._fallback = None
+            return line
+        if self._fallback is not None:
+            self._fallback.add(line)
+        return None
+
+    def add_lines(self, lines: Iterable[bytes]):
+        for line in lines:
+            if line[:1] == b'#':
+                continue
+            fields = line.rstrip(b'\r\n').split(b'\t', self.maxsplit)
+            if len(fields) >= 5:
+                self.add(fields)
+
+    def _profile_sorter(self) -> ProfileSorter:
+        return self._indels if self._indels.count or self._fallback is None else self._fallback
+
+    def profile_count(self) -> int:
+        return self._profile_sorter().count
+
+    def profile_lines(self) -> Iterator[bytes]:
+        """Profile lines in byte order, the order `sort` gives under LC_ALL=C; iterate once"""
+        return self._profile_sorter().sorted_lines()
+
+    def close(self):
+        """Remove any sort runs spilled to disk"""
+        self._indels.close()
+        if self._fallback is not None:
+            self._fallback.close()
+
+    def state(self, prefix: str = 'region_') -> Dict[str, Any]:
+        """Picklable partial result of one region
+
+        The region's lines are not part of it: they are written, sorted, to
+        run files in tmp_dir, and only their paths and counts are returned.
+        Whoever merge()s the state owns those files.
+        """
+        fallback = self._fallback if self._fallback is not None and not self._indels.count else None
+        state = {
+            'total_variants': self.total_variants,
+            'variant_types': dict(self.variant_types),
+            'off_panel': self.off_panel,
+            'filtered': dict(self.filtered),
+            'filtered_indels': self.filtered_indels,
+            'filtered_bytes': self.filtered_bytes,
+            'indel_count': self._indels.count,
+            'indel_run': self._indels.write_sorted(self.tmp_dir, f"{prefix}indels_") if self._indels.count else None,
+            'fallback_count': fallback.count if fallback is not None else 0,
+            'fallback_run': fallback.write_sorted(self.tmp_dir, f"{prefix}fallback_") if fallback and fallback.count else None
+        }
+        self.close()
+        return state
+
+    @staticmethod
+    def discard(state: Dict[str, Any]):
+        """Remove the run files of a state that will not be merged"""
+        for path in (state['indel_run'], state['fallback_run']):
+            if path is not None and os.path.exists(path):
+                os.unlink(path)
+
+    @classmethod
+    def merge(cls, states: List[Dict[str, Any]], sort_memory_mb: int = SORT_MEMORY_MB,
+              tmp_dir: Optional[str] = None, quality_filter: Optional[QualityFilter] = None,
+              panel: Optional[LocusPanel] = None) -> "ProfileBuilder":
+        """Combine region results, taking over their run files
+
+        The runs are k-way merged when the profile is read, so the order does
+        not depend on scheduling and no region is held in memory.
+        """
+        builder = cls(sort_memory_mb, tmp_dir, quality_filter, panel)
+        for state in states:
+            builder.total_variants += state['total_variants']
+            builder.variant_types.update(state['variant_types'])
+            builder.off_panel += state['off_panel']
+            builder.filtered.update(state['filtered'])
+            builder.filtered_indels += state['filtered_indels']
+            builder.filtered_bytes += state['filtered_bytes']
+        for state in states:
+            if state['indel_run'] is not None:
+                builder._indels.add_sorted_file(state['indel_run'], state['indel_count'])
+        for state in states:
+            if state['fallback_run'] is None:
+                continue
+            if builder._indels.count:
+                os.unlink(state['fallback_run'])
+            else:
+                builder._fallback.add_sorted_file(state['fallback_run'], state['fallback_count'])
+        if builder._indels.count:
+            builder._fallback.close()
+            builder._fallback = None
+        return builder
+
+def scan_region(vcf_file: str, index: int, region: Region, sort_memory_mb: int, tmp_dir: Optional[str],
+                quality_filter: Optional[QualityFilter], panel: Optional[LocusPanel]) -> Dict[str, Any]:
+    """Process pool task: profile one region of the VCF into sorted run files in tmp_dir"""
+    builder = ProfileBuilder(sort_memory_mb, tmp_dir, quality_filter, panel)
+    try:
+        with open_region(vcf_file, region) as lines:
+            builder.add_lines(lines)
+        return builder.state(f"region_{index:05d}_")
+    finally:
+        builder.close()
+
+def read_run(path: Optional[str]) -> Iterator[bytes]:
+    """The lines of a run file written by ProfileBuilder.state()"""
+    if path is None:
+        return
+    with open(path, 'rb') as f:
+        for line in f:
+            yield line[:-1]
+
+def scan_parallel(vcf_file: str, workers: int, sort_memory_mb: int = SORT_MEMORY_MB,
+                  tmp_dir: Optional[str] = None,
+                  quality_filter: Optional[QualityFilter] = None,
+                  panel: Optional[LocusPanel] = None,
+                  sink: Optional[Callable[[bytes], None]] = None) -> Optional[ProfileBuilder]:
+    """Profile the VCF region by region on a process pool; None when it cannot be split
+
+    Workers return each region's sorted lines as run files in tmp_dir (the
+    system temp directory by default), which the returned builder merges.
+    Each region's indel lines are passed to sink once it and every region
+    before it are done, so sink sees them in region order whatever the
+    scheduling.
+    """
+    regions = plan_regions(vcf_file)
+    if not regions:
+        return None
+    logger.info(f"Processing {len(regions)} regions on {workers} workers")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(scan_region, vcf_file, index, region, sort_memory_mb, tmp_dir, quality_filter, panel)
+                   for index, region in enumerate(regions)]
+        try:
+            states = []
+            for future in futures:
+                states.append(future.result())
+                if sink is not None:
+                    for line in read_run(states[-1]['indel_run']):
+                        sink(line)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            for future in futures:
+                if not future.cancelled() and future.exception() is None:
+                    ProfileBuilder.discard(future.result())
+            raise
+    return ProfileBuilder.merge(states, sort_memory_mb, tmp_dir, quality_filter, panel)
+
+def format_number(n: int) -> str:
+    return f"{n:,}"
+
+def percentage(part: int, total: int) -> str:
+    """Two decimals, truncated like `bc` with scale=2"""
+    return f"{part * 10000 // total / 100:.2f}" if total else "0.00"
+
+def write_file(path: Path, data: bytes, lines: Iterable[bytes] = ()):
+    """Write data, then each of lines newline-terminated"""
+    with open(path, 'wb') as f:
+        f.write(data)
+        for line in lines:
+            f.write(line + b'\n')
+
+def tee_lines(lines: Iterable[bytes], sink: Callable[[bytes], None]) -> Iterator[bytes]:
+    for line in lines:
+        sink(line)
+        yield line
+
+def profile_header(vcf_file: str, total_variants: int, profile_lines: int,
+                   quality_filter: Optional[QualityFilter] = None, panel: Optional[LocusPanel] = None) -> bytes:
+    return (
+        "# STR Profile File\n"
+        f"# Generated: {datetime.now().ctime()}\n"
+        f"# Source VCF: {vcf_file}\n"
+        f"# Total Variants: {format_number(total_variants)}\n"
+        f"# STR Entries: {format_number(profile_lines)}\n"
+        f"# Quality Filter: {quality_filter or 'none'}\n"
+        f"# Panel: {panel or 'none'}\n"
+        "# Format: CHROM<TAB>POS<TAB>REF<TAB>ALT\n"
+        "# =============================================================================\n"
+    ).encode('utf-8')
+
+def profile_summary(vcf_file: str, output_name: str, builder: ProfileBuilder,
+                    profile_lines: int, profile_bytes: int, files: List[str]) -> str:
+    lines = [
+        "STR Profile Summary",
+        "==================",
+        f"Generated: {datetime.now().ctime()}",
+        f"Source VCF: {vcf_file}",
+        f"Output Name: {output_name}",
+        f"Pipeline: {PIPELINE_VERSION}",
+        "",
+        "STATISTICS:",
+        f"- Total Variants: {format_number(builder.total_variants)}",
+        f"- STR Entries: {format_number(profile_lines)}",
+        f"- Indel Count: {format_number(builder.indel_count)}",
+        "",
+        "VARIANT TYPE BREAKDOWN:",
+    ]
+    for vtype, count in sorted(builder.variant_types.items()):
+        lines.append(f"- {vtype}: {format_number(count)} ({percentage(count, builder.total_variants)}%)")
+    if builder.panel is not None:
+        lines += [
+            "",
+            "LOCUS PANEL:",
+            f"- Panel: {builder.panel}",
+            f"- Loci: {format_number(builder.panel.loci)} intervals, {format_number(builder.panel.bases)} bp",
+            f"- Records Outside Panel: {format_number(builder.off_panel)} ({percentage(builder.off_panel, builder.total_variants)}%)",
+        ]
+    if builder.quality_filter is not None:
+        filtered = sum(builder.filtered.values())
+        unfiltered_bytes = profile_bytes + builder.filtered_bytes
+        lines += [
+            "",
+            "QUALITY FILTER:",
+            f"- Thresholds: {builder.quality_filter}",
+            f"- Records Filtered: {format_number(filtered)} ({percentage(filtered, builder.total_variants)}%)",
+        ]
+        for reason in ('QUAL', 'FILTER', 'DP', 'GQ'):
+            if builder.filtered[reason]:
+                lines.append(f"  - {reason}: {format_number(builder.filtered[reason])}")
+        lines += [
+            f"- Indels Removed: {format_number(builder.filtered_indels)}",
+            f"- Profile Data: {format_number(profile_bytes)} bytes, down from {format_number(unfiltered_bytes)} "
+            f"({percentage(builder.filtered_bytes, unfiltered_bytes)}% smaller)",
+        ]
+    lines += ["", "FILES GENERATED:"]
+    lines += [f"- {name}" for name in files]
+    lines += [
+        "",
+        "USAGE:",
+        f"- Upload {output_name}_str_final.txt to your storage system",
+        "- Use the SAME file for similarity comparison",
+    ]
+    return "\n".join(lines) + "\n"
+
+def scan_sequential(vcf_file: str, out: Path, output_name: str, keep_intermediates: bool,
+                    files: List[str], sort_memory_mb: int = SORT_MEMORY_MB,
+                    quality_filter: Optional[QualityFilter] = None,
+                    panel: Optional[LocusPanel] = None,
+                    sink: Optional[Callable[[bytes], None]] = None) -> ProfileBuilder:
+    """Profile the VCF in one streaming pass, optionally writing intermediate files to out
+
+    Indel lines are passed to sink as they are found.
+    """
+    builder = ProfileBuilder(sort_memory_mb, str(out), quality_filter, panel)
+    logger.info(f"Streaming {vcf_file}")
+    with ExitStack() as stack:
+        raw_profile = indels_vcf = None
+        if keep_intermediates:
+            raw_profile = stack.enter_context(open(out / f"{output_name}_str_profile.txt", 'wb'))
+            indels_vcf = stack.enter_context(open(out / f"{output_name}_indels.vcf", 'wb'))
+            files += [f"{output_name}_str_profile.txt", f"{output_name}_indels.vcf"]
+
+        vcf = stack.enter_context(open_vcf(vcf_file))
+        for line in vcf:
+            if line.startswith(b'#'):
+                if indels_vcf is not None:
+                    indels_vcf.write(line)
+                continue
+            fields = line.rstrip(b'\r\n').split(b'\t', builder.maxsplit)
+            if len(fields) < 5:
+                continue
+            profile_line = builder.add(fields)
+            if profile_line is None:
+                continue
+            if sink is not None:
+                sink(profile_line)
+            if raw_profile is not None:
+                raw_profile.write(profile_line + b'\n')
+                indels_vcf.write(line)
+
+    return builder
+
+def generate_profile(vcf_file: str, output_name: str, output_dir: str = ".",
+                     keep_intermediates: bool = False, workers: int = 1,
+                     sort_memory_mb: int = SORT_MEMORY_MB,
+                     quality_filter: Optional[QualityFilter] = None,
+                     panel: Optional[LocusPanel] = None,
+                     sink: Optional[Callable[[bytes], None]] = None) -> PipelineResult:
+    """Stream a VCF once and write {output_name}_str_final.txt and _profile_summary.txt
+
+    With keep_intermediates the raw (unsorted) profile, the indel VCF and the
+    variant type breakdown are also written, as generate_str_profile.sh did.
+    With workers > 1 the VCF is split by chromosome and processed on a
+    process pool; the output is identical to a sequential run. Profile lines
+    beyond sort_memory_mb are sorted in runs on disk (see external_sort).
+    Records outside panel, or failing quality_filter, are left out of the
+    profile. sink, if given, receives every profile line once, while the
+    VCF is still being scanned, in an order that depends only on the input
+    and on whether the run is sequential (VCF order) or parallel (region by
+    region, each region sorted). A VCF without indels only reaches it at
+    the end, as its fallback lines are written.
+    """
+    if not os.path.exists(vcf_file):
+        raise FileNotFoundError(f"VCF file not found: {vcf_file}")
+
+    out = Path(output_dir)
+    out.mkdir(parents=True, exist_ok=True)
+    # Everything is written to a private workspace and only finished files are
+    # moved to out, so concurrent jobs never see each other's partial output
+    with job_workspace() as workspace:
+        final_path = workspace / f"{output_name}_str_final.txt"
+        summary_path = workspace / f"{output_name}_profile_summary.txt"
+        builder = None
+        files = [final_path.name]
+
+        if workers > 1 and keep_intermediates:
+            logger.warning("Intermediate files need a sequential run; ignoring workers")
+        elif workers > 1:
+            builder = scan_parallel(vcf_file, workers, sort_memory_mb, str(workspace), quality_filter, panel, sink)
+
+        if builder is None:
+            builder = scan_sequential(vcf_file, workspace, output_name, keep_intermediates, files,
+                                      sort_memory_mb, quality_filter, panel, sink)
+
+        try:
+            if keep_intermediates:
+                types_path = workspace / f"{output_name}_variant_types.txt"
+                types_path.write_text("".join(f"{count:>7} {vtype}\n" for vtype, count in sorted(builder.variant_types.items())))
+                files.append(types_path.name)
+            files.append(summary_path.name)
+
+            if not builder.indel_count:
+                logger.warning("No indels found, using all variants for STR analysis")
+            profile_count = builder.profile_count()
+            header = profile_header(vcf_file, builder.total_variants, profile_count,
+                                    builder.quality_filter, builder.panel)
+            lines = builder.profile_lines()
+            if sink is not None and not builder.indel_count:
+                lines = tee_lines(lines, sink)
+            write_file(final_path, header, lines)
+            profile_bytes = final_path.stat().st_size - len(header)
+            write_file(summary_path, profile_summary(vcf_file, output_name, builder, profile_count,
+                                                     profile_bytes, files).encode('utf-8'))
+        finally:
+            builder.close()
+
+        for name in files:
+            publish(workspace / name, out / name)
+
+    logger.info(f"Profile: {format_number(profile_count)} STR entries from {format_number(builder.total_variants)} variants")
+    if builder.panel is not None:
+        logger.info(f"Panel {builder.panel} left out {format_number(builder.off_panel)} records")
+    if builder.quality_filter is not None:
+        logger.info(f"Quality filter ({builder.quality_filter}) removed {format_number(sum(builder.filtered.values()))} "
+                    f"records, {format_number(builder.filtered_indels)} of them indels")
+    return PipelineResult(str(out / final_path.name), str(out / summary_path.name), builder.total_variants,
+                          builder.indel_count, profile_count, dict(builder.variant_types),
+                          sum(builder.filtered.values()))
+
+def add_quality_arguments(parser: argparse.ArgumentParser):
+    """Quality filter options, shared by the device CLIs"""
+    group = parser.add_argument_group('quality filter')
+    group.add_argument('--min-qual', type=float, help='Drop records with QUAL below this')
+    group.add_argument('--pass-only', action='store_true', help='Drop records whose FILTER is not PASS')
+    group.add_argument('--min-dp', type=int, help='Drop records with read depth (sample or INFO DP) below this')
+    group.add_argument('--min-gq', type=int, help='Drop records with genotype quality below this')
+
+def quality_filter_from_args(args: argparse.Namespace) -> Optional[QualityFilter]:
+    quality_filter = QualityFilter(args.min_qual, args.pass_only, args.min_dp, args.min_gq)
+    return quality_filter if quality_filter.active else None
+
+def add_panel_arguments(parser: argparse.ArgumentParser):
+    """Locus panel options, shared by the device CLIs"""
+    group = parser.add_argument_group('locus panel')
+    group.add_argument('--panel', help='BED file of loci; the profile only keeps records inside them')
+    group.add_argument('--panel-name', help='Panel name written to the profile header (default: BED file name)')
+
+def panel_from_args(args: argparse.Namespace) -> Optional[LocusPanel]:
+    return LocusPanel.from_bed(args.panel, args.panel_name) if args.panel else None
+
+def main():
+    """Generate an STR profile from a VCF"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s | %(levelname)-8s | %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    )
+
+    parser = argparse.ArgumentParser(
+        description="STR Profile Pipeline - streaming VCF to STR profile",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Generate max_str_final.txt and max_profile_summary.txt
+  python str_pipeline.py genome.vcf.gz max
+
+  # Keep the raw profile, indel VCF and variant type breakdown for debugging
+  python str_pipeline.py genome.vcf.gz max --keep-intermediates
+
+  # Split by chromosome and use every core
+  python str_pipeline.py genome.vcf.gz max --workers 0
+
+  # Keep at most 64MB of profile lines in memory on a small device
+  python str_pipeline.py genome.vcf.gz max --sort-memory 64
+
+  # Only keep confident calls
+  python str_pipeline.py genome.vcf.gz max --min-qual 30 --pass-only --min-dp 10 --min-gq 20
+
+  # Restrict the profile to a locus panel
+  python str_pipeline.py genome.vcf.gz max --panel str_panel_v2.bed
+        """
+    )
+    parser.add_argument('vcf_file', help='Path to VCF file (.vcf, .vcf.gz or .bcf)')
+    parser.add_argument('output_name', nargs='?', default='genome', help='Name for output files (default: genome)')
+    parser.add_argument('--output-dir', default='.', help='Directory for output files')
+    parser.add_argument('--keep-intermediates', action='store_true',
+                        help='Also write the raw profile, indel VCF and variant type breakdown')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Process chromosomes in parallel on this many processes (0: one per core)')
+    parser.add_argument('--sort-memory', type=int, default=SORT_MEMORY_MB,
+                        help=f'MB of profile lines to sort in memory before spilling to disk (default: {SORT_MEMORY_MB})')
+    add_quality_arguments(parser)
+    add_panel_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        workers = args.workers or os.cpu_count() or 1
+        result = generate_profile(args.vcf_file, args.output_name, args.output_dir,
+                                  args.keep_intermediates, workers, args.sort_memory,
+                                  quality_filter_from_args(args), panel_from_args(args))
+    except Exception as e:
+        logger.error(f"Profile generation failed: {e}")
+        sys.exit(1)
+    print(f"STR profile generated successfully!")
+    print(f"Final STR file: {result.final_path}")
+    print(f"Profile summary: {result.summary_path}")
+
+if __name__ == "__main__":
+    main()
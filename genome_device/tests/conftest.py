@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The device modules import each other by their flat names, as they do on the device
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,65 @@
+"""Tests for the parallel BGZF reader"""
+
+import gzip
+import random
+
+import pytest
+
+import bgzf
+
+@pytest.fixture
+def vcf(tmp_path):
+    rng = random.Random(7)
+    lines = [b'##fileformat=VCFv4.2\n']
+    for i in range(40000):
+        lines.append(b'chr%d\t%d\t.\tA\t%s\t50\tPASS\tDP=%d\n'
+                     % (i % 22 + 1, i * 37, b'AT' * rng.randint(1, 6), rng.randint(1, 99)))
+    path = tmp_path / "sample.vcf"
+    path.write_bytes(b''.join(lines))
+    return path
+
+@pytest.fixture
+def compressed(vcf, tmp_path):
+    path = tmp_path / "sample.vcf.gz"
+    bgzf.compress(str(vcf), str(path))
+    return path
+
+def test_compress_writes_valid_gzip(vcf, compressed):
+    assert bgzf.is_bgzf(str(compressed))
+    assert not bgzf.is_bgzf(str(vcf))
+    assert gzip.decompress(compressed.read_bytes()) == vcf.read_bytes()
+    assert compressed.read_bytes().endswith(bgzf.EOF_BLOCK)
+
+def test_plain_gzip_is_not_bgzf(vcf, tmp_path):
+    path = tmp_path / "plain.vcf.gz"
+    path.write_bytes(gzip.compress(vcf.read_bytes()))
+    assert not bgzf.is_bgzf(str(path))
+
+@pytest.mark.parametrize("threads", [1, 2, 4])
+def test_inflate_chunks_matches_gzip(compressed, threads, monkeypatch):
+    # Small tasks so the in-flight limit is reached with a small file
+    monkeypatch.setattr(bgzf, "BLOCKS_PER_TASK", 2)
+    expected = gzip.decompress(compressed.read_bytes())
+    with open(compressed, 'rb') as f:
+        chunks = list(bgzf.inflate_chunks(f, threads))
+    assert len(chunks) > 1
+    assert b''.join(chunks) == expected
+
+def test_open_bgzf_iterates_lines(vcf, compressed):
+    with bgzf.open_bgzf(str(compressed), threads=2) as f:
+        assert list(f) == vcf.read_bytes().splitlines(keepends=True)
+
+def test_truncated_block_is_an_error(compressed, tmp_path):
+    path = tmp_path / "truncated.vcf.gz"
+    path.write_bytes(compressed.read_bytes()[:-len(bgzf.EOF_BLOCK) - 100])
+    with open(path, 'rb') as f, pytest.raises(ValueError, match="Truncated BGZF block"):
+        b''.join(bgzf.inflate_chunks(f, 2))
+
+def test_corrupt_block_fails_crc(compressed, tmp_path):
+    data = bytearray(compressed.read_bytes())
+    first_block = bgzf._HEADER.unpack_from(data)[-1] + 1
+    data[first_block - 8] ^= 0xff
+    path = tmp_path / "corrupt.vcf.gz"
+    path.write_bytes(bytes(data))
+    with open(path, 'rb') as f, pytest.raises(ValueError, match="CRC"):
+        b''.join(bgzf.inflate_chunks(f, 1))
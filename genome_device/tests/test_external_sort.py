@@ -0,0 +1,78 @@
+"""External sort: byte order within a memory cap, whatever the input order"""
+
+import os
+import random
+
+import pytest
+
+from external_sort import ProfileSorter
+from str_pipeline import ProfileBuilder
+
+def profile_lines(count, seed=0):
+    rng = random.Random(seed)
+    chroms = [b"chr1", b"chr2", b"chr10", b"chrX", b"chr1_alt"]
+    return [b"%s\t%d\t%s\t%s" % (rng.choice(chroms), rng.randint(1, 10 ** rng.randint(1, 9)),
+                                 rng.choice([b"A", b"AT", b"CAG"]), rng.choice([b"A", b"ATT", b"C,CA"]))
+            for _ in range(count)]
+
+def coordinate_sorted(lines):
+    order = {chrom: index for index, chrom in enumerate(dict.fromkeys(line.split(b"\t")[0] for line in lines))}
+    return sorted(lines, key=lambda line: (order[line.split(b"\t")[0]], int(line.split(b"\t")[1])))
+
+@pytest.mark.parametrize("memory_mb", [0, 256])
+@pytest.mark.parametrize("arrange", [lambda lines: lines, coordinate_sorted, sorted], ids=["random", "coordinate", "byte"])
+def test_matches_sorted(tmp_path, memory_mb, arrange):
+    lines = arrange(profile_lines(5000))
+    with ProfileSorter(memory_mb, str(tmp_path)) as sorter:
+        for line in lines:
+            sorter.add(line)
+        assert list(sorter.sorted_lines()) == sorted(lines)
+        if memory_mb == 0:
+            assert sorter.spilled_runs > 0
+    assert os.listdir(tmp_path) == []
+
+def test_coordinate_sorted_input_is_merged_not_sorted(tmp_path):
+    lines = coordinate_sorted(profile_lines(2000, seed=1))
+    with ProfileSorter(256, str(tmp_path)) as sorter:
+        for line in lines:
+            sorter.add(line)
+        assert sorter.coordinate_sorted
+        assert list(sorter.sorted_lines()) == sorted(lines)
+
+def test_sorted_files_are_merged_and_removed(tmp_path):
+    parts = [profile_lines(700, seed) for seed in range(70)]
+    paths = []
+    for part in parts:
+        with ProfileSorter(256, str(tmp_path)) as sorter:
+            for line in part:
+                sorter.add(line)
+            paths.append(sorter.write_sorted(str(tmp_path)))
+    with ProfileSorter(256, str(tmp_path)) as merged:
+        for path, part in zip(paths, parts):
+            merged.add_sorted_file(path, len(part))
+        assert merged.count == sum(len(part) for part in parts)
+        assert list(merged.sorted_lines()) == sorted(line for part in parts for line in part)
+    assert os.listdir(tmp_path) == []
+
+def vcf_records(lines):
+    return [line.split(b"\t")[:2] + [b".", line.split(b"\t")[2], line.split(b"\t")[3], b"50", b"PASS", b"."]
+            for line in lines]
+
+def test_region_states_merge_like_one_builder(tmp_path):
+    records = vcf_records(profile_lines(3000, seed=2))
+    whole = ProfileBuilder(tmp_dir=str(tmp_path))
+    for fields in records:
+        whole.add(fields)
+    states = []
+    for start in range(0, len(records), 1000):
+        region = ProfileBuilder(tmp_dir=str(tmp_path))
+        for fields in records[start:start + 1000]:
+            region.add(fields)
+        states.append(region.state())
+    merged = ProfileBuilder.merge(states, tmp_dir=str(tmp_path))
+    assert merged.indel_count == whole.indel_count
+    assert merged.variant_types == whole.variant_types
+    assert list(merged.profile_lines()) == list(whole.profile_lines())
+    merged.close()
+    whole.close()
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,69 @@
+"""Tests for BED locus panels"""
+
+import pickle
+
+import pytest
+
+from locus_panel import LocusPanel, PanelFormatError
+
+def write_bed(tmp_path, text, name="panel.bed"):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+def test_contains_matches_bed_half_open_boundaries():
+    # BED 100-200 covers VCF (1-based) positions 101..200
+    panel = LocusPanel("p", {b'1': [(100, 200)]})
+    assert not panel.contains(b'1', 100)
+    assert panel.contains(b'1', 101)
+    assert panel.contains(b'1', 200)
+    assert not panel.contains(b'1', 201)
+    assert not panel.contains(b'1', 1)
+    assert not panel.contains(b'2', 150)
+
+def test_single_base_interval():
+    panel = LocusPanel("p", {b'X': [(0, 1), (49, 50)]})
+    assert panel.contains(b'X', 1)
+    assert not panel.contains(b'X', 2)
+    assert not panel.contains(b'X', 49)
+    assert panel.contains(b'X', 50)
+
+def test_chr_prefix_is_ignored(tmp_path):
+    panel = LocusPanel.from_bed(write_bed(tmp_path, "chr7\t10\t20\n"))
+    assert panel.contains(b'7', 15)
+    assert panel.contains(b'chr7', 15)
+    assert panel.contains(b'CHR7', 20)
+    assert not panel.contains(b'chr7', 10)
+
+def test_overlapping_intervals_are_merged():
+    panel = LocusPanel("p", {b'1': [(150, 300), (100, 200), (300, 310), (400, 500)]})
+    assert panel.loci == 2
+    assert panel.bases == 310
+    assert all(panel.contains(b'1', pos) for pos in (101, 250, 301, 310))
+    assert not panel.contains(b'1', 311)
+    assert panel.contains(b'1', 401)
+
+def test_version_ignores_order_and_formatting(tmp_path):
+    a = LocusPanel.from_bed(write_bed(tmp_path, "track name=x\nchr1 100 200\nchr2 5 10\n"), "str")
+    b = LocusPanel.from_bed(write_bed(tmp_path, "# loci\n2\t5\t10\textra\n1\t150\t200\n1\t100\t160\n",
+                                      "other.bed"), "str")
+    assert str(a) == str(b)
+    assert str(a).startswith("str@")
+    assert str(LocusPanel("str", {b'1': [(100, 201)]})) != str(a)
+
+def test_name_defaults_to_bed_file_name(tmp_path):
+    panel = LocusPanel.from_bed(write_bed(tmp_path, "1\t0\t10\n", "str_panel_v2.bed.gz"))
+    assert panel.name == "str_panel_v2"
+
+@pytest.mark.parametrize("text", ["1\t100\n", "1\tx\t200\n", "1\t200\t100\n", "1\t-1\t10\n", "# empty\n"])
+def test_bad_bed_is_rejected(tmp_path, text):
+    with pytest.raises(PanelFormatError):
+        LocusPanel.from_bed(write_bed(tmp_path, text))
+
+def test_pickled_panel_drops_lookup_cache():
+    panel = LocusPanel("p", {b'1': [(100, 200)]})
+    assert panel.contains(b'chr1', 150)
+    copy = pickle.loads(pickle.dumps(panel))
+    assert copy._last_chrom is None
+    assert copy.contains(b'chr1', 150)
+    assert str(copy) == str(panel)
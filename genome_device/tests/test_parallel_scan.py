@@ -0,0 +1,69 @@
+"""Parallel profile generation gives the same bytes as a sequential run"""
+
+import random
+import functools
+from datetime import datetime
+
+import pytest
+
+import region_index
+import str_pipeline
+from str_pipeline import generate_profile
+from quality_filter import QualityFilter
+
+class FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2025, 1, 2, 3, 4, 5)
+
+def write_vcf(path, records, shuffle, indels=True, seed=3):
+    rng = random.Random(seed)
+    rows = []
+    for index in range(records):
+        chrom = ("chr1", "chr2", "chr10", "chrX")[index * 4 // records]
+        ref = rng.choice(["A", "AT", "CAG"])
+        alt = rng.choice(["A", "ATT", "C", "CA,CAA", "G"]) if indels else rng.choice(["G", "T"]) * len(ref)
+        rows.append(f"{chrom}\t{index * 7 + 1}\t.\t{ref}\t{alt}\t{rng.randint(5, 90)}\tPASS\tDP={rng.randint(1, 60)}\n")
+    if shuffle:
+        rng.shuffle(rows)
+    path.write_text("##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n" + "".join(rows))
+    return str(path)
+
+@pytest.fixture(autouse=True)
+def small_regions(tmp_path, monkeypatch):
+    monkeypatch.setattr(str_pipeline, "datetime", FrozenDatetime)
+    monkeypatch.setattr(region_index, "INDEX_CACHE_DIR", tmp_path / "index")
+    monkeypatch.setattr(region_index, "load_offset_index",
+                        functools.partial(region_index.load_offset_index, region_bytes=16 * 1024))
+
+@pytest.mark.parametrize("shuffle", [False, True], ids=["sorted", "shuffled"])
+@pytest.mark.parametrize("indels", [True, False], ids=["indels", "no-indels"])
+def test_parallel_output_matches_sequential(tmp_path, shuffle, indels):
+    vcf = write_vcf(tmp_path / "sample.vcf", 4000, shuffle, indels)
+    assert len(region_index.plan_regions(vcf)) > 4
+
+    results = {}
+    for workers in (1, 3):
+        out = tmp_path / f"workers{workers}"
+        result = generate_profile(vcf, "sample", str(out), workers=workers, sort_memory_mb=0)
+        with open(result.final_path, 'rb') as f:
+            results[workers] = (f.read(), (out / "sample_profile_summary.txt").read_bytes(), result)
+
+    sequential, parallel = results[1], results[3]
+    assert parallel[0] == sequential[0]
+    assert parallel[1] == sequential[1]
+    assert {k: v for k, v in parallel[2].to_dict().items() if not k.endswith('_path')} == \
+        {k: v for k, v in sequential[2].to_dict().items() if not k.endswith('_path')}
+    assert sequential[2].profile_lines > 0
+
+def test_parallel_output_matches_sequential_with_a_quality_filter(tmp_path):
+    vcf = write_vcf(tmp_path / "sample.vcf", 3000, shuffle=True)
+    quality_filter = QualityFilter(min_qual=30, min_dp=10)
+    outputs = []
+    for workers in (1, 3):
+        result = generate_profile(vcf, "sample", str(tmp_path / f"workers{workers}"), workers=workers,
+                                  sort_memory_mb=0, quality_filter=quality_filter)
+        with open(result.final_path, 'rb') as f:
+            outputs.append((f.read(), result.filtered_records))
+    assert outputs[0] == outputs[1]
+    assert outputs[0][1] > 0
@@ -0,0 +1,145 @@
+"""Profile cache: what changes the key, when the VCF is re-hashed, and LRU eviction"""
+
+import os
+import json
+
+import pytest
+
+import profile_cache
+from profile_cache import ProfileCache, META_FILE
+from quality_filter import QualityFilter
+from locus_panel import LocusPanel
+
+def write_vcf(path, records=20, shift=0):
+    lines = [b"##fileformat=VCFv4.2\n", b"#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"]
+    for index in range(records):
+        alt = b"AT" if index % 2 else b"G"
+        lines.append(b"chr1\t%d\t.\tA\t%s\t%d\tPASS\tDP=20\n" % (100 + index * 10 + shift, alt, 10 + index * 5))
+    path.write_bytes(b"".join(lines))
+    return str(path)
+
+@pytest.fixture
+def cache(tmp_path):
+    return ProfileCache(tmp_path / "cache", max_mb=16)
+
+@pytest.fixture
+def counted(monkeypatch):
+    """Counts VCF hashes and profile generations"""
+    calls = {'hash': 0, 'generate': 0}
+    sha256_file, generate_profile = profile_cache.sha256_file, profile_cache.generate_profile
+
+    def counting_hash(path):
+        calls['hash'] += 1
+        return sha256_file(path)
+
+    def counting_generate(*args, **kwargs):
+        calls['generate'] += 1
+        return generate_profile(*args, **kwargs)
+
+    monkeypatch.setattr(profile_cache, "sha256_file", counting_hash)
+    monkeypatch.setattr(profile_cache, "generate_profile", counting_generate)
+    return calls
+
+def test_key_covers_settings_and_pipeline_version(tmp_path, cache, monkeypatch):
+    vcf = write_vcf(tmp_path / "a.vcf")
+    panel = LocusPanel("str", {b'1': [(0, 1000)]})
+    base = cache._settings_key(vcf, {})[0]
+
+    assert cache._settings_key(vcf, {'quality_filter': None, 'panel': None})[0] == base
+    filtered = cache._settings_key(vcf, {'quality_filter': QualityFilter(min_qual=30)})[0]
+    assert filtered != base
+    assert cache._settings_key(vcf, {'quality_filter': QualityFilter(min_qual=40)})[0] != filtered
+    assert cache._settings_key(vcf, {'quality_filter': QualityFilter(min_qual=30)})[0] == filtered
+    assert cache._settings_key(vcf, {'panel': panel})[0] != base
+    assert cache._settings_key(vcf, {'panel': LocusPanel("str", {b'1': [(0, 999)]})})[0] \
+        != cache._settings_key(vcf, {'panel': panel})[0]
+
+    monkeypatch.setattr(profile_cache, "PIPELINE_VERSION", "str-pipeline/test")
+    assert cache._settings_key(vcf, {})[0] != base
+
+def test_same_content_at_another_path_has_the_same_key(tmp_path, cache):
+    a = write_vcf(tmp_path / "a.vcf")
+    b = write_vcf(tmp_path / "b.vcf")
+    assert cache.key(a) == cache.key(b)
+    assert cache.key(a) != cache.key(write_vcf(tmp_path / "c.vcf", shift=1))
+
+def test_vcf_is_rehashed_only_when_size_or_mtime_change(tmp_path, cache, counted):
+    path = tmp_path / "a.vcf"
+    vcf = write_vcf(path)
+    first = cache.vcf_hash(vcf)
+    assert cache.vcf_hash(vcf) == first
+    assert counted['hash'] == 1
+    assert str(path.resolve()) in json.loads((cache.cache_dir / profile_cache.HASHES_FILE).read_text())
+
+    stat = os.stat(vcf)
+    os.utime(vcf, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.vcf_hash(vcf) == first
+    assert counted['hash'] == 2
+
+    # Only size and mtime are compared, so an edit that keeps both reuses the recorded hash
+    write_vcf(path, shift=1)
+    os.utime(vcf, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert cache.vcf_hash(vcf) == first
+    assert counted['hash'] == 2
+
+    write_vcf(path, records=21)
+    assert cache.vcf_hash(vcf) != first
+    assert counted['hash'] == 3
+
+def test_repeat_generation_is_served_from_the_cache(tmp_path, cache, counted):
+    vcf = write_vcf(tmp_path / "a.vcf")
+    first = cache.generate(vcf)
+    assert counted['generate'] == 1
+    assert first.profile_lines == 10
+    assert os.path.dirname(first.final_path) == str(cache.cache_dir / cache.key(vcf))
+
+    again = cache.generate(vcf, workers=4, sort_memory_mb=1)
+    assert counted['generate'] == 1
+    assert again.to_dict() == first.to_dict()
+    assert cache.lookup(vcf).final_path == first.final_path
+
+    filtered = cache.generate(vcf, quality_filter=QualityFilter(min_qual=60))
+    assert counted['generate'] == 2
+    assert filtered.profile_lines < first.profile_lines
+    assert cache.lookup(write_vcf(tmp_path / "b.vcf", shift=1)) is None
+
+def test_incomplete_entry_is_regenerated(tmp_path, cache, counted):
+    vcf = write_vcf(tmp_path / "a.vcf")
+    result = cache.generate(vcf)
+    entry = cache.cache_dir / cache.key(vcf)
+    (entry / META_FILE).unlink()
+
+    assert cache.lookup(vcf) is None
+    assert not entry.exists()
+    regenerated = cache.generate(vcf)
+    assert counted['generate'] == 2
+    assert regenerated.to_dict() == result.to_dict()
+    assert (entry / META_FILE).exists()
+
+def test_evict_removes_least_recently_used_first(tmp_path, cache):
+    keys = []
+    for index in range(3):
+        vcf = write_vcf(tmp_path / f"{index}.vcf", shift=index)
+        cache.generate(vcf)
+        keys.append(cache.key(vcf))
+        os.utime(cache.cache_dir / keys[-1], (1000 + index, 1000 + index))
+    entry_bytes = cache.entries()[0]['bytes']
+
+    # Using the oldest entry makes it the most recently used
+    assert cache.get(keys[0]) is not None
+    cache.max_bytes = 2 * entry_bytes
+    assert cache.evict() == 1
+    assert sorted(e['key'] for e in cache.entries()) == sorted([keys[0], keys[2]])
+
+def test_evict_never_removes_the_entry_just_produced(tmp_path, cache):
+    cache.max_bytes = 0
+    older = write_vcf(tmp_path / "old.vcf")
+    cache.generate(older)
+    newer = write_vcf(tmp_path / "new.vcf", shift=1)
+    result = cache.generate(newer)
+
+    assert [e['key'] for e in cache.entries()] == [cache.key(newer)]
+    assert os.path.exists(result.final_path)
+    assert cache.evict(keep=cache.key(newer)) == 0
+    assert cache.evict() == 1
+    assert cache.entries() == []
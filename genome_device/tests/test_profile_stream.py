@@ -0,0 +1,113 @@
+"""Pipelined upload: profile lines reach the stream during the scan, in a fixed order"""
+
+import random
+import hashlib
+import os
+import functools
+import threading
+
+import pytest
+
+import region_index
+from profile_stream import ProfileStream, stream_header, stream_trailer
+from str_pipeline import generate_profile
+
+EXAMPLE_VCF = os.path.join(os.path.dirname(__file__), "..", "example.vcf")
+
+def write_vcf(path, records, seed=5):
+    rng = random.Random(seed)
+    rows = []
+    for index in range(records):
+        chrom = ("chr1", "chr2", "chr10")[index * 3 // records]
+        ref = rng.choice(["A", "AT", "CAG"])
+        alt = rng.choice(["A", "ATT", "C", "CA,CAA", "G"])
+        rows.append(f"{chrom}\t{rng.randint(1, 10 ** 6)}\t.\t{ref}\t{alt}\t50\tPASS\tDP=20\n")
+    path.write_text("##fileformat=VCFv4.2\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n" + "".join(rows))
+    return str(path)
+
+def profile_lines(path):
+    with open(path, 'rb') as f:
+        return [line.rstrip(b'\n') for line in f if not line.startswith(b'#')]
+
+@pytest.fixture
+def small_regions(tmp_path, monkeypatch):
+    monkeypatch.setattr(region_index, "INDEX_CACHE_DIR", tmp_path / "index")
+    monkeypatch.setattr(region_index, "load_offset_index",
+                        functools.partial(region_index.load_offset_index, region_bytes=16 * 1024))
+
+def test_sink_receives_every_profile_line_once(tmp_path):
+    received = []
+    result = generate_profile(EXAMPLE_VCF, "example", str(tmp_path), sink=received.append)
+    assert len(received) == result.profile_lines > 0
+    assert sorted(received) == sorted(profile_lines(result.final_path))
+
+def test_sequential_sink_follows_the_vcf(tmp_path):
+    vcf = write_vcf(tmp_path / "sample.vcf", 500)
+    received = []
+    result = generate_profile(vcf, "sample", str(tmp_path / "out"), sink=received.append)
+    assert sorted(received) == sorted(profile_lines(result.final_path))
+
+    with open(vcf, 'rb') as f:
+        order = {}
+        for line in f:
+            if not line.startswith(b'#'):
+                fields = line.split(b'\t')
+                order.setdefault((fields[0], int(fields[1])), len(order))
+    keys = [order[(fields[0], int(fields[1]))] for fields in (line.split(b'\t') for line in received)]
+    assert keys == sorted(keys)
+
+def test_parallel_sink_order_is_region_order_for_any_worker_count(tmp_path, small_regions):
+    vcf = write_vcf(tmp_path / "sample.vcf", 3000)
+    regions = region_index.plan_regions(vcf)
+    assert len(regions) > 4
+
+    streamed = {}
+    for workers in (2, 3):
+        received = []
+        result = generate_profile(vcf, "sample", str(tmp_path / f"workers{workers}"), workers=workers,
+                                  sort_memory_mb=0, sink=received.append)
+        streamed[workers] = received
+    assert streamed[2] == streamed[3]
+    assert sorted(streamed[2]) == sorted(profile_lines(result.final_path))
+    # Not globally sorted, since each region's lines are sent as a block
+    assert streamed[2] != profile_lines(result.final_path)
+
+def test_stream_hashes_what_the_consumer_takes():
+    header = stream_header("sample.vcf")
+    stream = ProfileStream(header, chunk_size=64, max_chunks=2)
+    lines = [b"chr1\t%d\tA\tAT" % pos for pos in range(1000)]
+
+    def produce():
+        for line in lines:
+            stream.add_line(line)
+        stream.finish(stream_trailer(5000, stream.lines))
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    sent = b''.join(stream.chunks())
+    producer.join()
+    assert sent == header + b''.join(line + b'\n' for line in lines) + \
+        b"# Total Variants: 5,000\n# STR Entries: 1,000\n"
+    assert stream.lines == 1000
+    assert stream.sha256.hexdigest() == hashlib.sha256(sent).hexdigest()
+    assert stream.bytes_sent == len(sent)
+
+def test_cancel_stops_the_producer():
+    stream = ProfileStream(b"", chunk_size=1, max_chunks=1)
+    errors = []
+
+    def produce():
+        try:
+            for _ in range(100):
+                stream.add_line(b"x")
+            stream.finish()
+        except Exception as e:
+            errors.append(e)
+
+    producer = threading.Thread(target=produce)
+    producer.start()
+    next(stream.chunks())
+    stream.cancel()
+    producer.join(timeout=5)
+    assert not producer.is_alive()
+    assert errors and type(errors[0]).__name__ == "StreamCancelled"
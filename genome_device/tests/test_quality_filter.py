@@ -0,0 +1,51 @@
+"""Tests for the per-record VCF quality thresholds"""
+
+from quality_filter import QualityFilter
+
+def record(qual=b'50', filt=b'PASS', info=b'.', fmt=b'GT:DP:GQ', sample=b'0/1:20:40'):
+    return [b'chr1', b'1000', b'.', b'A', b'AT', qual, filt, info, fmt, sample]
+
+def test_inactive_filter_accepts_everything():
+    qf = QualityFilter()
+    assert not qf.active
+    assert str(qf) == "none"
+    assert qf.reject_reason(record(qual=b'.', filt=b'LowQual')) is None
+
+def test_missing_qual_fails_min_qual():
+    qf = QualityFilter(min_qual=30)
+    assert qf.reject_reason(record(qual=b'.')) == 'QUAL'
+    assert qf.reject_reason(record(qual=b'10')) == 'QUAL'
+    assert qf.reject_reason(record(qual=b'30')) is None
+    assert qf.reject_reason(record()[:5]) == 'QUAL'
+
+def test_missing_filter_counts_as_pass():
+    qf = QualityFilter(pass_only=True)
+    assert qf.reject_reason(record(filt=b'.')) is None
+    assert qf.reject_reason(record(filt=b'PASS')) is None
+    assert qf.reject_reason(record(filt=b'LowQual')) == 'FILTER'
+
+def test_dp_falls_back_to_info_when_sample_dp_is_missing():
+    qf = QualityFilter(min_dp=10)
+    assert qf.reject_reason(record(sample=b'0/1:.:40', info=b'AC=1;DP=15')) is None
+    assert qf.reject_reason(record(fmt=b'GT', sample=b'0/1', info=b'DP=15')) is None
+    assert qf.reject_reason(record(fmt=b'GT', sample=b'0/1', info=b'DP=5')) == 'DP'
+
+def test_missing_dp_everywhere_fails():
+    qf = QualityFilter(min_dp=10)
+    assert qf.reject_reason(record(sample=b'0/1:.:40', info=b'.')) == 'DP'
+    assert qf.reject_reason(record(fmt=b'GT', sample=b'0/1', info=b'AC=1')) == 'DP'
+    assert qf.reject_reason(record()[:8]) == 'DP'
+
+def test_missing_gq_fails():
+    qf = QualityFilter(min_gq=20)
+    assert qf.reject_reason(record()) is None
+    assert qf.reject_reason(record(sample=b'0/1:20:.')) == 'GQ'
+    assert qf.reject_reason(record(fmt=b'GT:DP', sample=b'0/1:20')) == 'GQ'
+
+def test_first_failing_threshold_is_reported():
+    qf = QualityFilter(min_qual=30, pass_only=True, min_dp=10, min_gq=20)
+    assert str(qf) == "QUAL>=30 FILTER=PASS DP>=10 GQ>=20"
+    assert qf.maxsplit == 10
+    assert qf.reject_reason(record(qual=b'.', filt=b'LowQual')) == 'QUAL'
+    assert qf.reject_reason(record(filt=b'LowQual', sample=b'0/1:.:.')) == 'FILTER'
+    assert qf.reject_reason(record(sample=b'0/1:.:.')) == 'DP'
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Job Workspaces
+Each profile generation runs in its own scratch directory, optionally on
+tmpfs, that is removed when the job ends; finished files are moved out
+"""
+
+import os
+import errno
+import shutil
+import logging
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# STR_WORKSPACE_TMPFS=true keeps scratch files (sort runs included) in memory
+WORKSPACE_TMPFS = os.getenv("STR_WORKSPACE_TMPFS", "false").lower() == "true"
+TMPFS_DIR = "/dev/shm"
+WORKSPACE_DIR = os.getenv("STR_WORKSPACE_DIR") or None
+
+def workspace_root() -> Optional[str]:
+    """Parent of new workspaces; None means the system temp directory"""
+    if WORKSPACE_TMPFS and os.path.isdir(TMPFS_DIR):
+        return TMPFS_DIR
+    return WORKSPACE_DIR
+
+@contextmanager
+def job_workspace(prefix: str = "str_job_") -> Iterator[Path]:
+    """A fresh directory for one job; it and everything left in it are removed on exit"""
+    root = workspace_root()
+    if root is not None:
+        os.makedirs(root, exist_ok=True)
+    path = Path(tempfile.mkdtemp(prefix=prefix, dir=root))
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def publish(src: Path, dst: Path):
+    """Move a finished file into place atomically, also across filesystems"""
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # tmpfs to disk: copy next to the destination, then rename
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{dst.name}.", dir=dst.parent)
+    try:
+        with os.fdopen(fd, 'wb') as out, open(src, 'rb') as f:
+            shutil.copyfileobj(f, out)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise